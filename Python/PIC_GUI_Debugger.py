@@ -4,16 +4,23 @@
 import sys
 import os
 import datetime
-import ctypes                   # for usb
 import time                     # for timing & sleeping
-import thread
 from PyQt4 import QtGui, QtCore
 
 # My Imports
 sys.path.append(".\helpers")
 import dataLogger
+import registerFormat
+import captureFile
+import segmentedCapture
 import Continual_Plot
 import ConversionFunctions
+import picDevice
+import acquisitionEngine
+import logicAnalyzer
+import logicTimeline
+from pollScheduler import clock
+from picProtocol import *       # USB-PIC Protocol (vendor request numbers shared with main.c)
 
 
 # This GUI is written in PyQt. It is awesome. To learn more, check out the following: (it's easy to pick up)
@@ -21,26 +28,6 @@ import ConversionFunctions
 # http://zetcode.com/tutorials/pyqt4/
 
 
-# USB-PIC Protocol; how they communicate (arbitrary numbers ("vendor requests") set by us)
-GET_LED         = 3     # Pic --> USB
-SET_LED         = 4     # USB --> Pic
-
-GET_DEBUG_MSG   = 10    # Pic --> USB (can get up to 8 messages)
-GET_REGISTERS   = 11    # Pic --> USB (Gets PORT and TRIS Registers)
-GET_EEPROM      = 12    # Pic --> USB (gets 256 eeprom bytes)
-
-SET_USB_MSG1    = 20    # USB --> Pic (can send any one message)
-SET_USB_MSG2    = 21
-
-SET_PORTA       = 30    # USB --> Pic
-SET_PORTB       = 31
-SET_PORTC       = 32
-
-SET_TRISA       = 35    # USB --> Pic
-SET_TRISB       = 36
-SET_TRISC       = 37
-
-
 
 class GuiInit(QtGui.QMainWindow):
 
@@ -60,9 +47,16 @@ class GuiInit(QtGui.QMainWindow):
     led_status = 0                  # PC's thought on what the status of the debug_led is
     
     # Program variables
-    live_monitoring = 1             # 1/0. Whether live_monitoring of the system is enabled
     data_logging    = False         # T/F. Whether data is being written to log
-    refresh_rate = 20               # Live monitoring frequency (# checks/second) (currently, max ~= 66.6)
+    log_file        = None          # segmentedCapture.SegmentedCaptureWriter the continual data log is written to
+    plot_visualization = None       # Continual_Plot.ContinualPlot of the continual data log's ADC voltage
+    refresh_rate = 20               # Live monitoring frequency (# checks/second). Actual rate: see 'Polling Statistics'
+    log_schema = "full"             # What each logged record holds (see captureFile.SCHEMAS): everything, with seq # and wall clock
+    log_segment_size = 64 * 1024 * 1024     # Continual logs roll over to a new segment at this many bytes...
+    log_segment_time = 3600                 # ...or after this many seconds
+    log_compression = "zlib"                # Sealed segments are compressed with this (see segmentedCapture.COMPRESSIONS)
+    MAX_REFRESH_RATE = 1000
+    display_rate = 30               # Most times/second the labels are redrawn (only when something changed)
     
     
     
@@ -72,11 +66,25 @@ class GuiInit(QtGui.QMainWindow):
         QtGui.QMainWindow.__init__(self, parent)    # Inits the base class. any call to "self." accesses it
         
         # Self-explanatory
+        self.device = picDevice.PicDevice()
         self.init_usb()                             
         self.create_widgets()
         self.init_window_components()
+        
+        # Labels are only ever touched from the Qt thread: polls are handed over through a queued signal,
+        # merged into the latest status, and redrawn at most display_rate times a second
+        self.latest_status = None
+        self.status_queued = False                  # A picStatus() signal is on its way to the Qt thread
+        self.repaint_pending = False                # An update_gui() is scheduled
+        self.last_repaint = 0
+        self.label_values = {}                      # label --> the value it is showing
+        self.connect(self, QtCore.SIGNAL('picStatus()'), self.apply_pic_status, QtCore.Qt.QueuedConnection)
         self.update_gui()
-        thread.start_new_thread(self.main_loop, ())
+        
+        # Live monitoring: the engine polls the PIC on its own thread; the GUI is just one of its subscribers
+        self.engine = acquisitionEngine.AcquisitionEngine(self.device, self.refresh_rate)
+        self.engine.subscribe(self.on_pic_status)
+        self.engine.start()
         
 
         
@@ -122,6 +130,14 @@ class GuiInit(QtGui.QMainWindow):
         refresh.setStatusTip('Change the rate of data aquisition')
         self.connect(refresh, QtCore.SIGNAL('triggered()'), self.change_refresh_rate)
         
+        polling_stats = QtGui.QAction(QtGui.QIcon('icons/stats.png'), 'Polling Statistics', self)
+        polling_stats.setStatusTip('Show the achieved refresh rate, jitter and missed deadlines')
+        self.connect(polling_stats, QtCore.SIGNAL('triggered()'), self.show_polling_stats)
+        
+        logic_analyzer = QtGui.QAction(QtGui.QIcon('icons/logic.png'), 'Logic Analyzer', self)
+        logic_analyzer.setStatusTip('Record PORTA/B/C bit by bit and show them as timelines')
+        self.connect(logic_analyzer, QtCore.SIGNAL('triggered()'), self.show_logic_analyzer)
+        
         
         help = QtGui.QAction(QtGui.QIcon('icons/help.png'), 'Help', self)
         help.setShortcut('F1')
@@ -146,6 +162,8 @@ class GuiInit(QtGui.QMainWindow):
         
         edit_menu = menubar.addMenu('&Edit')
         edit_menu.addAction(refresh)
+        edit_menu.addAction(polling_stats)
+        edit_menu.addAction(logic_analyzer)
         
         help_menu = menubar.addMenu('&Help')
         help_menu.addAction(help)
@@ -157,24 +175,10 @@ class GuiInit(QtGui.QMainWindow):
     
         
         
-    # Initializes usb connection (don't worry about this)
+    # Initializes usb connection (don't worry about this; see helpers/picDevice.py)
     def init_usb(self):
-        try:
-            self.usb = ctypes.cdll.LoadLibrary('helpers\usb.dll')
-            self.usb.initialize()
-            
-            self.buffer = ctypes.c_buffer(8)
-        
-            self.dev = self.usb.open_device(0x6666, 0x0003)
-            if self.dev<0:
-                print "No matching device found...\n"
-            else:
-                print "OMGLOLZYEY I found a self.usb!\n"
-                ret = self.usb.control_transfer(self.dev, 0x00, 0x09, 1, 0, 0, self.buffer)
-                if ret<0:
-                    print "Unable to send SET_CONFIGURATION standard request.\n"
-        except:
-            print "unable to load usb dll"
+        if self.device.open():
+            print "OMGLOLZYEY I found a self.usb!\n"
 
 
 
@@ -402,21 +406,10 @@ class GuiInit(QtGui.QMainWindow):
         # Send the value (modular method for sending the right values)
         if send:
             try:
-                # Hack for a case-switch statement
-                dict = { 
-                        "PORTA" : lambda: self.usb.control_transfer(self.dev, 0x40, SET_PORTA, newval, 0, 0, self.buffer),
-                        "PORTB" : lambda: self.usb.control_transfer(self.dev, 0x40, SET_PORTB, newval, 0, 0, self.buffer),
-                        "PORTC" : lambda: self.usb.control_transfer(self.dev, 0x40, SET_PORTC, newval, 0, 0, self.buffer),
-                        "TRISA" : lambda: self.usb.control_transfer(self.dev, 0x40, SET_TRISA, newval, 0, 0, self.buffer),
-                        "TRISB" : lambda: self.usb.control_transfer(self.dev, 0x40, SET_TRISB, newval, 0, 0, self.buffer),
-                        "TRISC" : lambda: self.usb.control_transfer(self.dev, 0x40, SET_TRISC, newval, 0, 0, self.buffer)
-                      } #create dictionary that maps each register to the right function
-                      
-                funcToCall = dict[register]     # select the right function to call, based on register
-                funcToCall()                    # call the function to execute the usb statement
+                self.device.set_register(register, newval)
                 
                 print "sent %d" % newval
-                self.update_gui()
+                self.request_repaint()
             except:
                 print "ERROR in SENDING %s value" % register
             
@@ -445,7 +438,7 @@ class GuiInit(QtGui.QMainWindow):
                             \nPlease enter a number between 0 and 255""")
         
         if send == True:
-            self.usb.control_transfer(self.dev, 0x40, SET_USB_MSG1, sendingval, 0, 0, self.buffer)
+            self.device.send_msg1(sendingval)
             print "sent %d" % sendingval
         
         
@@ -453,54 +446,41 @@ class GuiInit(QtGui.QMainWindow):
     # User moved the slider titled "usb message 2". Sends slider value
     def usb_msg2_clicked(self, value):
         try:
-            self.usb.control_transfer(self.dev, 0x40, SET_USB_MSG2, value, 0, 0, self.buffer)
+            self.device.send_msg2(value)
             print "sent %d" % value
             
         except:
             print "oh no! Something pooped out..."
             
-        self.update_gui()
+        self.request_repaint()
         
         
         
     def get_eeprom_clicked(self):
         print "getting eeprom"
         
-        # Asks the pic for the 256 eeprom bytes. Each time, PIC gives next 8 values
-        # Thus, we loop 8 bytes * 32 times = 256 total bytes
-        for i in range (0, 256/8):
-            self.usb.control_transfer(self.dev, 0xC0, GET_EEPROM, 0, 0, 8, self.buffer) #input = #bytes host requesting (the 1)
-            for j in range(0, 8):
-                index = 8*i + j
-                self.eeprom[index] = ord(self.buffer[j]) #ord converts self.buffer characters to ints
+        # Asks the pic for all 256 eeprom bytes: the firmware may have written to it since the cache was filled
+        self.eeprom = self.device.read_eeprom(refresh_all = True)
                 
         print "\nEEPROM is 256 bytes"
         print self.eeprom
-        # Write EEPROM to text file
+        # Write EEPROM to a text file, and to an Intel HEX file for programmers & other tools
         
         # Figure out time
         now = datetime.datetime.now()
         now_s = "%d.%d.%d - %dh.%dm.%ds" % (now.month, now.day, now.year, now.hour, now.minute, now.second)
         
-        # Name file
+        # Name files
         filename = "%s\\data\\eeprom - %s - eeprom get.txt" % (os.getcwd(), now_s)
+        hex_filename = "%s\\data\\eeprom - %s - eeprom get.hex" % (os.getcwd(), now_s)
         
         # Make output directory (unless already exists)
         dataLogger.makeDir()
         
-        # Open File
+        # Write files (text file starts with the date/time)
         print "Writing to file: %s" % filename
-        fout = open(filename, 'w')
-        
-        # Create output string
-        s_out = ""
-        for i in range(0, 256):
-            s_out += "Byte %d: \t%d\n" % (i, self.eeprom[i])
-        
-        # Write starting data/time
-        fout.write("Eeprom state at: %s\n\n\n" % now_s)
-        fout.write(s_out)
-        fout.close()
+        self.device.eeprom.save(filename, header = "Eeprom state at: %s\n\n\n" % now_s)
+        self.device.eeprom.save(hex_filename)
         
         
             
@@ -509,75 +489,95 @@ class GuiInit(QtGui.QMainWindow):
     # Simple 'set' command. Inverts the LED's current status and sends it to PIC
     def set_led_clicked(self): 
         self.led_status = inverse(self.led_status)          # Invert LED
-        self.usb.control_transfer(self.dev, 0x40, SET_LED, self.led_status, 0, 0, self.buffer) #change led value
+        self.device.set_led(self.led_status) #change led value
         
-        self.update_gui()
+        self.request_repaint()
         print "Set LED to %d" % self.led_status
 
     # Simple 'get' command. Asks for the value of LED
     def get_led_clicked(self): 
-        self.usb.control_transfer(self.dev, 0xC0, GET_LED, 0, 0, 1, self.buffer)
-        self.led_status = ord(self.buffer[0])
+        self.led_status = self.device.get_led()
         
-        self.update_gui()
+        self.request_repaint()
     
     
     
-    # Gets the entire 'status' of the PIC (all of it's PORT and TRIS registers, as well as debug messages, etc.).
-    # Continually called by threaded loop.
-    def get_pic_status(self):
-        
-        # Get the "Debug Message" (8 bytes of information)
-        self.usb.control_transfer(self.dev, 0xC0, GET_DEBUG_MSG, 0, 0, 8, self.buffer) #input = #bytes host requesting (the 1)
-   
-        # Cycles through the 8 received bytes, and sticks them int othe debug_message, to be printed out later
-        for i in range(0, 8):
-            self.debug_message[i] = ord(self.buffer[i]) #ord converts self.buffer characters to ints
-   
-   
-        #========== Get PORT/TRIS Registers ==========#
-        # PORT Registers
-        self.usb.control_transfer(self.dev, 0xC0, GET_REGISTERS, 0, 0, 8, self.buffer)
-        self.PORTA = ord(self.buffer[0])
-        self.PORTB = ord(self.buffer[1])
-        self.PORTC = ord(self.buffer[2])
-        
-        self.TRISA = ord(self.buffer[3])
-        self.TRISB = ord(self.buffer[4])
-        self.TRISC = ord(self.buffer[5])
-
-        self.update_gui()
+    # Receives the entire 'status' of the PIC (all of it's PORT and TRIS registers, as well as debug messages, etc.).
+    # Called by the acquisition engine (from its thread) for every poll, so it must not touch any widgets:
+    # it keeps the newest status and signals the Qt thread, unless a signal is already on its way
+    def on_pic_status(self, status):
+        self.latest_status = status
+        if not self.status_queued:
+            self.status_queued = True
+            self.emit(QtCore.SIGNAL('picStatus()'))
+            
+    # Runs on the Qt thread. However many polls arrived since the last call, only the newest is used
+    def apply_pic_status(self):
+        self.status_queued = False
+        status = self.latest_status
+        
+        self.debug_message = list(status.debug_message)
+        
+        self.PORTA = status.PORTA
+        self.PORTB = status.PORTB
+        self.PORTC = status.PORTC
         
-        # Get the "debug led" status
-        self.get_led_clicked() 
+        self.TRISA = status.TRISA
+        self.TRISB = status.TRISB
+        self.TRISC = status.TRISC
+        
+        self.led_status = status.led
+        
+        self.request_repaint()
 
 
 
     #========== GUI & Variable Refresh (live monitoring) ==========#
-        
+    
+    
+    # Schedules an update_gui, no sooner than 1/display_rate after the last one. Several requests in one frame = one repaint
+    def request_repaint(self):
+        if self.repaint_pending:
+            return
+        self.repaint_pending = True
+        delay = self.last_repaint + 1.0 / self.display_rate - clock()
+        QtCore.QTimer.singleShot(max(0, int(delay * 1000)), self.update_gui)
+        
+        
+    # Sets a label's text (format % convert(value)), unless it is already showing that value
+    def show_value(self, label, format, value, convert = None):
+        if self.label_values.get(label) != value:
+            self.label_values[label] = value
+            if convert is not None:
+                value = convert(value)
+            label.setText(format % value)
+            
 
-    # Updates the gui display (here you can alter the screen text)
+    # Updates the gui display (here you can alter the screen text). Only labels whose value changed are touched
     def update_gui(self):
+        self.repaint_pending = False
+        self.last_repaint = clock()
         
-        self.led_label.setText("Led: %d" % self.led_status) #update GUI
-        self.usb_msg2_label2.setText("(" + str(self.usb_msg2_input.sliderPosition()) + ")") 
+        self.show_value(self.led_label, "Led: %d", self.led_status) #update GUI
+        self.show_value(self.usb_msg2_label2, "(%d)", self.usb_msg2_input.sliderPosition())
         
-        self.PORTA_label.setText("PORTA: %s" % bin(self.PORTA))
-        self.PORTB_label.setText("PORTB: %s" % bin(self.PORTB))
-        self.PORTC_label.setText("PORTC: %s" % bin(self.PORTC))
+        binary = registerFormat.BIN.__getitem__                 # bin(), from a table
+        self.show_value(self.PORTA_label, "PORTA: %s", self.PORTA, binary)
+        self.show_value(self.PORTB_label, "PORTB: %s", self.PORTB, binary)
+        self.show_value(self.PORTC_label, "PORTC: %s", self.PORTC, binary)
         
-        self.TRISA_label.setText("TRISA: %s" % bin(self.TRISA))
-        self.TRISB_label.setText("TRISB: %s" % bin(self.TRISB))
-        self.TRISC_label.setText("TRISC: %s" % bin(self.TRISC))
+        self.show_value(self.TRISA_label, "TRISA: %s", self.TRISA, binary)
+        self.show_value(self.TRISB_label, "TRISB: %s", self.TRISB, binary)
+        self.show_value(self.TRISC_label, "TRISC: %s", self.TRISC, binary)
         
-        self.debug_message0_label.setText("Debug Msg0: %d" % self.debug_message[0])
-        self.debug_message1_label.setText("Debug Msg1: %d" % self.debug_message[1])
-        self.debug_message2_label.setText("Debug Msg2: %d" % self.debug_message[2])
-        self.debug_message3_label.setText("Debug Msg3: %d" % self.debug_message[3])
-        self.debug_message4_label.setText("Debug Msg4: %d" % self.debug_message[4])
-        self.debug_message5_label.setText("Debug Msg5: %d" % self.debug_message[5])
-        self.debug_message6_label.setText("Debug Msg6: %d" % self.debug_message[6])
-        self.debug_message7_label.setText("Debug Msg7: %d" % self.debug_message[7])
+        self.show_value(self.debug_message0_label, "Debug Msg0: %d", self.debug_message[0])
+        self.show_value(self.debug_message1_label, "Debug Msg1: %d", self.debug_message[1])
+        self.show_value(self.debug_message2_label, "Debug Msg2: %d", self.debug_message[2])
+        self.show_value(self.debug_message3_label, "Debug Msg3: %d", self.debug_message[3])
+        self.show_value(self.debug_message4_label, "Debug Msg4: %d", self.debug_message[4])
+        self.show_value(self.debug_message5_label, "Debug Msg5: %d", self.debug_message[5])
+        self.show_value(self.debug_message6_label, "Debug Msg6: %d", self.debug_message[6])
+        self.show_value(self.debug_message7_label, "Debug Msg7: %d", self.debug_message[7])
 
         
         
@@ -585,30 +585,24 @@ class GuiInit(QtGui.QMainWindow):
                                     # =====      Other Methods       ===== #
         
     
-    # The threaded loop that constantly communicates with PIC (getting and sending data)
-    def main_loop(self):
-        
-        while self.live_monitoring == 1: # Cycle through the various variables we're monitoring 
-            self.get_pic_status()
-            self.update_gui()
-
-            time.sleep(1.0/self.refresh_rate)
-            
-        print "stopped live monitoring"
-
-        
-    # Used to save the PIC state to a text file
+    # Used to save the PIC state to a capture file (see helpers/captureFile.py). Continual logs are a directory
+    # of segments that roll over and get compressed in the background (see helpers/segmentedCapture.py)
     def log_data(self, duration):
         
         if (duration != 1):                             # if have to log
             self.data_logging = not self.data_logging   # reverse status
-            if (not self.data_logging):                 # if not logging, quit
+            if (not self.data_logging):                 # if not logging, stop and quit
+                self.stop_logging()
                 return
                 
         print "Beginning to log data.." 
         
-        # Initialize Plot Visualization
-        self.plot_visualization = Continual_Plot.ContinualPlot()
+        # Initialize Plot Visualization (only for continual logs; each plot has its own redraw timer on figure 1,
+        # so the last one is stopped first)
+        if (duration != 1):
+            if (self.plot_visualization is not None):
+                self.plot_visualization.exit()
+            self.plot_visualization = Continual_Plot.ContinualPlot()
         
         # Figure out time
         now = datetime.datetime.now()
@@ -616,73 +610,65 @@ class GuiInit(QtGui.QMainWindow):
         
         # Name file
         if (duration == 1):
-            filename = "%s\\data\\data - %s - single data log.txt" % (os.getcwd(), now_s)
+            filename = "%s\\data\\data - %s - single data log.pic" % (os.getcwd(), now_s)
         else:
-            filename = "%s\\data\\data - %s - continual data log.txt" % (os.getcwd(), now_s)
+            filename = "%s\\data\\data - %s - continual data log" % (os.getcwd(), now_s)
         
         # Make output directory (unless already exists)
         dataLogger.makeDir()
         
-        # Open File
+        # Open File (writes the header: start time, rate, which debug bytes hold the ADC reading & the record fields)
         print "Writing to file: %s" % filename
-        fout = open(filename, 'w')
-        
-        # Write starting data/time
-        fout.write("Start time: %s\n\n\n" % now_s)
-        
-        # Write Column headers
-        #fout.write(dataLogger.makeHeaders())
+        if (duration == 1):
+            capture = captureFile.CaptureWriter(filename, rate = self.refresh_rate, schema = self.log_schema)
+        else:
+            capture = segmentedCapture.SegmentedCaptureWriter(filename, rate = self.refresh_rate, schema = self.log_schema,
+                                                              segment_size = self.log_segment_size,
+                                                              segment_time = self.log_segment_time,
+                                                              compression = self.log_compression)
         
         # Either run once, or start thread (depending on run specs)
         if (duration == 1):
-            self.log_data_write(fout)
-            fout.close()
+            self.log_data_write(capture, self.engine.latest or self.device.get_status())
+            capture.close()
             print "Finished logging PIC state"
             self.statusBar.showMessage("Finished logging PIC state")
         else:
             if (self.data_logging):
-                thread.start_new_thread(self.log_data_thread, (fout,))
+                self.log_file = capture
+                self.engine.subscribe(self.log_data_sample)
                 self.statusBar.showMessage("Started Live data logging")
             
 
 
 
-    # Sub-method of logging data. Gets variables, formats them, and writes them
-    def log_data_write(self, fout):
+    # Sub-method of logging data. Writes one status as a binary record (seq #, timestamps, raw ADC, registers,
+    # debug bytes and LED, with the default log_schema)
+    def log_data_write(self, capture, status):
+        capture.write(status)
         
-        """
-        # Store all printed vals in an array
-        s = [self.PORTA, self.PORTB, self.PORTC, self.TRISA, self.TRISB, self.TRISC]
-        s.extend(self.debug_message)
         
-        # Create formatted write string
-        sout = dataLogger.format_output(s)
-        """
+    # Sub-method of logging data. Subscribed to the acquisition engine until the user disengages it
+    def log_data_sample(self, status):
+        self.log_data_write(self.log_file, status)
         
         # Read and convert 2 bytes to one ADC val.. then to a voltage
-        adc_read_val = ConversionFunctions.convert8bitTo16bit(high_byte = self.debug_message[3], low_byte = self.debug_message[6])
+        adc_read_val = ConversionFunctions.convert8bitTo16bit(high_byte = status.debug_message[3], low_byte = status.debug_message[6])
         adc_read_voltage = ConversionFunctions.adcToVoltage(adc_read_val)
         
         # sends value to the visualization plot
         self.plot_visualization.addData(adc_read_voltage)
         
-        # Write string to file
-        fout.write("%.3f" % adc_read_voltage)
-        fout.write("\n")
-        
-        
-    # Sub-method of logging data. An infinite loop that will run until user disengages it
-    def log_data_thread(self, fout):
-        
-        while(self.data_logging):
-            # Write data
-            self.log_data_write(fout)
-            
-            # Wait for program to catch up
-            time.sleep(1.0/self.refresh_rate)
+    
+    # With wait, returns once the last segment is written and compressed (when quitting); without, that
+    # carries on in the background
+    def stop_logging(self, wait = False):
+        self.engine.unsubscribe(self.log_data_sample)   # Waits for any sample being written to finish
+        self.data_logging = False
         
         self.plot_visualization.exit()
-        fout.close()
+        self.log_file.close(wait = wait)                # Seals the last segment and finalizes manifest.json
+        self.log_file = None
         print "Stopped live data logging"
         self.statusBar.showMessage("Stopped live data logging")
         
@@ -690,7 +676,7 @@ class GuiInit(QtGui.QMainWindow):
         
     # Pops up a menu to let the user alter the refresh rate
     def change_refresh_rate(self):
-        input, ok = QtGui.QInputDialog.getText(self, 'Set new value', 'Set new refresh rate (#updates/sec) \nMin: 1, Max: 66')
+        input, ok = QtGui.QInputDialog.getText(self, 'Set new value', 'Set new refresh rate (#updates/sec) \nMin: 1, Max: %d' % self.MAX_REFRESH_RATE)
         
         if ok:                                      # if user hits ok
             try:                                    # Check that it's a number
@@ -698,10 +684,27 @@ class GuiInit(QtGui.QMainWindow):
             except:
                 print "sorry I need a number there"
             
-            if input >= 1 and input <= 66:          # Check number's value
+            if input >= 1 and input <= self.MAX_REFRESH_RATE:   # Check number's value
                 self.refresh_rate = input
+                self.engine.set_rate(input)
                 self.statusBar.showMessage("Now checking PIC's status {0} times/second".format(input))
         
+        
+    # Shows how well the acquisition engine is keeping up with the refresh rate
+    def show_polling_stats(self):
+        QtGui.QMessageBox.information(self, "Polling Statistics", self.engine.stats.summary().replace(", ", "\n") +
+                                      "\n\n" + self.device.stats.summary())
+        
+        
+    # Opens a logic analyzer window that records every pin of PORTA/B/C from now until it is closed
+    def show_logic_analyzer(self):
+        recorder = logicAnalyzer.LogicRecorder(logicAnalyzer.LogicCapture())
+        window = logicTimeline.LogicWindow(recorder.capture, recorder, parent = self)
+        window.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+        self.connect(window, QtCore.SIGNAL('closed()'), lambda : self.engine.unsubscribe(recorder.write))
+        self.engine.subscribe(recorder.write)
+        window.show()
+        
     
     
     # Try opening documentation in wordpad. If fails, open in notepad
@@ -753,9 +756,12 @@ if __name__=="__main__":
     
     
     # End
-    #gui.usb.close_device(self.dev)
-    sys.exit(app.exec_())
-    gui.usb.close_device(self.dev)
+    ret = app.exec_()
+    if gui.log_file is not None:                    # Still logging: save the last segment before quitting
+        gui.stop_logging(wait = True)
+    gui.engine.stop()
+    gui.device.close()
+    sys.exit(ret)
     
     
 """
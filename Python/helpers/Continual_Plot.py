@@ -11,40 +11,63 @@ from pylab import *
 import sys
 import random
 import thread
+import numpy
+
+from ringBuffer import RingBuffer
+import plotDecimation
 
 
 def poo():
     print "poo"
 
+# Plots the most recent samples. addData() only stores the sample (under the ring buffer's lock), so it is cheap to call from any thread
+# (e.g. the acquisition engine's); a timer on the GUI thread redraws the line at most 'fps' times a second,
+# blitting just the line over a cached background of the axes, labels and grid. Every ContinualPlot draws on
+# figure 1, so exit() the old one before making another
 class ContinualPlot:
     
-    data = []
-    plot_data = []
-    curr_axis_length = 10
     X_AXIS_INCREMENT = 10
     Y_AXIS_INCREMENT = 10
     MAX_SAMPLES_WINDOW = 200            # How many samples fit into a window before we begin scrolling
+    HISTORY_DEPTH = 100000              # How many samples are kept (older ones are overwritten)
+    FRAME_RATE = 30                     # Redraws/second (at most; none while no new samples arrive)
     
-    def __init__(self):
+    def __init__(self, window = MAX_SAMPLES_WINDOW, depth = HISTORY_DEPTH, fps = FRAME_RATE):
+        self.window = window
+        self.data = RingBuffer(max(depth, window))          # The most recent samples; bounded however long the run
+        self.x_data = numpy.arange(window)                  # x values of the visible window (sample # within it)
+        self.curr_axis_length = 10
+        self.drawn_count = 0                                # data.count when the line was last drawn
+        self.background = None                              # Everything but the line, as last drawn
+        
         ion()                                               # Allows continual update plotting
         self.myfig = figure(1)                              # Create Figure
+        self.myfig.clf()                                    # Drop a previous plot's axes and line
         self.mysubplot = subplot(111)                       # Create Subplot
-        self.myplot = plot(0, 0)                            # Plot first point
+        self.myplot = plot(0, 0, animated = True)           # Plot first point (animated: left out of the background)
         axis([0, 10, 0, 3])                                # Set default axes
         xlabel('Data sample #')
         ylabel('voltage (V)')
         title('Continual Output')
         grid(True)
+        
+        canvas = self.myfig.canvas
+        self.draw_cid = canvas.mpl_connect('draw_event', self.onDraw)      # Full redraws (first show, resizes, new axes) refresh the background
+        self.timer = canvas.new_timer(interval = int(1000 / fps))
+        self.timer.add_callback(self.render)
+        self.timer.start()
         draw()
         
     
-    # Updates axes if necessary
-    def updateAxes(self, new_val):
+    # Updates axes if necessary. Returns True if they changed (and the background must be redrawn)
+    def updateAxes(self, count):
         # Update X-axis
-        if (len(self.plot_data) < self.MAX_SAMPLES_WINDOW):                     # For scrolling
-            if (len(self.data) >= self.curr_axis_length):
-                self.curr_axis_length += self.X_AXIS_INCREMENT
+        if (self.curr_axis_length < self.window):                               # For scrolling
+            length = min(self.window, (count // self.X_AXIS_INCREMENT + 1) * self.X_AXIS_INCREMENT)
+            if (length > self.curr_axis_length):
+                self.curr_axis_length = length
                 self.mysubplot.set_xlim(0, self.curr_axis_length) # Sets the x-axis labels
+                return True
         
         """
         # If new value is below the y min. range, update it
@@ -55,23 +78,49 @@ class ContinualPlot:
         if (new_val > self.mysubplot.get_ylim()[1]):
             self.mysubplot.set_ylim(ymax = new_val+self.Y_AXIS_INCREMENT )
         """
+        return False
 
 
-    # Call to update data that is being plotted
+    # Call to add data to be plotted. Never draws, so never holds up the caller
     def addData(self, new_val):
-        self.data.append(new_val)                                               # Sets data to new one
+        self.data.append(new_val)
+        
+    # Same, for a whole array of samples
+    def addBlock(self, new_vals):
+        self.data.extend(new_vals)
+    
+    
+    def onDraw(self, event):
+        self.background = self.myfig.canvas.copy_from_bbox(self.mysubplot.bbox)
+        self.mysubplot.draw_artist(self.myplot[0])
+        
+    
+    # Timer callback (GUI thread): redraws the line from whatever samples have arrived since the last frame
+    def render(self):
+        if self.data.count == self.drawn_count:
+            return
+        
+        # plot the last (up to) window vals: copied out of the ring buffer under its lock, as the acquisition thread
+        # keeps appending. Windows wider than the axes are cut down to a min/max pair per pixel, which keeps spikes visible
+        indices, plot_data = self.data.snapshot(self.window)
+        count = self.drawn_count = len(indices) and int(indices[-1]) + 1
+        x, y = plotDecimation.minmax(plot_data, self.mysubplot.bbox.width)
+        self.myplot[0].set_data(self.x_data[x], y)                              # Updates the actual plot with the new data
+        
+        canvas = self.myfig.canvas
+        if self.updateAxes(count) or self.background is None:
+            canvas.draw()                                   # onDraw redraws the line and grabs a new background
+        else:
+            canvas.restore_region(self.background)
+            self.mysubplot.draw_artist(self.myplot[0])
+        canvas.blit(self.mysubplot.bbox)
         
-        # (for scrolling) If the plot window has filled up, pop the first val before appending
-        if (len(self.plot_data) >= self.MAX_SAMPLES_WINDOW):
-            self.plot_data.pop(0)
-        self.plot_data.append(new_val)
-        # plot either from 0 or the last # MAX_SAMPLES_WINDOW vals
-        self.myplot[0].set_data(range(max(0, len(self.plot_data) - self.MAX_SAMPLES_WINDOW), len(self.plot_data)), self.plot_data)               # Updates the actual plot with the new data
-        self.updateAxes(new_val)                                                # Checks whether the axes need changing
-        draw()                                                                  # Redraws figure
         
+    # Stops redrawing and lets go of the figure
     def exit(self):
-        pass
+        self.timer.stop()
+        self.timer.remove_callback(self.render)
+        self.myfig.canvas.mpl_disconnect(self.draw_cid)
         
 # Test loop
 def myDataLoop(*args):
@@ -92,8 +141,7 @@ if __name__=="__main__":
     
     thread.start_new_thread(myDataLoop, (0, plot) )
     
-    print "press enter to exit"
-    raw_input()
-    plot.close()
-    sys.exit(app.exec_())
+    print "close the plot to exit"
+    show()                              # Runs the GUI event loop, which drives the plot's timer
+    plot.exit()
 
@@ -5,14 +5,60 @@ Created on Wed Apr 28 10:02:37 2010
 @author: btaratutin
 """
 
+import numpy
+
+# How the PIC lays out a conversion in ADRESH:ADRESL (ADFM bit of ADCON2; main.c sets it left justified)
+RIGHT_JUSTIFIED = 'right'
+LEFT_JUSTIFIED = 'left'
+
 # Convert 2 8-bit values into a 16-bit value
 def convert8bitTo16bit(high_byte, low_byte):
     return ( (high_byte << 8) + low_byte )
 
-# convert "adc_values" to voltages
-def adcToVoltage(adc_val):
-    Vref = 2.5
-    LSB = Vref / 1024
-    voltage = round(adc_val * LSB - Vref, 3)
+# convert "adc_values" to voltages. offset defaults to -Vref
+def adcToVoltage(adc_val, Vref = 2.5, resolution = 10, offset = None):
+    if offset is None:
+        offset = -Vref
+    LSB = float(Vref) / (1 << resolution)           # float(): Vref = 5 mustn't make this integer division on Python 2
+    voltage = round(adc_val * LSB + offset, 3)
     return voltage
-    #(to string)return '%.3f' % voltage
\ No newline at end of file
+    #(to string)return '%.3f' % voltage
+
+
+# ===== Block versions: whole numpy arrays of samples at once ===== #
+
+# Convert arrays of ADRESH/ADRESL bytes into ADC counts.
+# Right justified is the same as convert8bitTo16bit; left justified drops the unused low bits
+def convertBlock(high_bytes, low_bytes, justification = RIGHT_JUSTIFIED, resolution = 10):
+    words = (numpy.asarray(high_bytes).astype(numpy.uint16) << 8) | numpy.asarray(low_bytes).astype(numpy.uint16)
+    if justification == LEFT_JUSTIFIED:
+        return words >> (16 - resolution)
+    elif justification == RIGHT_JUSTIFIED:
+        return words
+    raise ValueError("unknown justification %r" % justification)
+
+
+# adcToVoltage for every 16-bit count, computed once per setting by adcToVoltage itself,
+# so the block results are exactly the scalar ones (numpy.round can differ from round() in the last bit)
+voltage_tables = {}
+
+def voltageTable(Vref = 2.5, resolution = 10, offset = None):
+    key = (Vref, resolution, offset)
+    if key not in voltage_tables:
+        voltage_tables[key] = numpy.array([adcToVoltage(i, Vref, resolution, offset) for i in range(1 << 16)])
+    return voltage_tables[key]
+
+# convert an array of "adc_values" to voltages
+def adcToVoltageBlock(adc_vals, Vref = 2.5, resolution = 10, offset = None):
+    adc_vals = numpy.asarray(adc_vals)
+    if adc_vals.dtype.kind in 'ui' and (adc_vals.size == 0 or (adc_vals.min() >= 0 and adc_vals.max() < (1 << 16))):
+        return voltageTable(Vref, resolution, offset)[adc_vals]
+
+    # Not 16-bit counts: compute directly (may differ from adcToVoltage in the last bit)
+    if offset is None:
+        offset = -Vref
+    return numpy.round(adc_vals * (float(Vref) / (1 << resolution)) + offset, 3)
+
+# Convert arrays of ADRESH/ADRESL bytes straight to voltages
+def bytesToVoltageBlock(high_bytes, low_bytes, justification = RIGHT_JUSTIFIED, Vref = 2.5, resolution = 10, offset = None):
+    return adcToVoltageBlock(convertBlock(high_bytes, low_bytes, justification, resolution), Vref, resolution, offset)
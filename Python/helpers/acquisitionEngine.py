@@ -0,0 +1,121 @@
+"""
+Acquisition Engine - polls a PIC on its own thread and hands every status to its subscribers.
+
+Has no GUI dependencies: the debugger GUI, the data logger and the pic_acquire
+command line tool are all just subscribers.
+
+Use:
+    engine = AcquisitionEngine(device, rate = 100)
+    engine.subscribe(my_callback)           # my_callback(status) is called from the engine thread
+    engine.start()
+    ...
+    engine.stop()
+"""
+
+import threading
+import time
+
+import pollScheduler
+
+
+# Calls every subscribed callback with each published item, from the publishing thread
+class Publisher:
+
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.RLock()   # Held while publishing, so unsubscribe() never races a callback
+
+    def subscribe(self, callback):
+        self.lock.acquire()
+        try:
+            if callback not in self.subscribers:
+                self.subscribers.append(callback)
+        finally:
+            self.lock.release()
+
+    def unsubscribe(self, callback):
+        self.lock.acquire()
+        try:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+        finally:
+            self.lock.release()
+
+    def publish(self, item):
+        self.lock.acquire()
+        try:
+            for callback in list(self.subscribers):
+                try:
+                    callback(item)
+                except Exception as e:
+                    print("subscriber %r failed: %s" % (callback, e))
+        finally:
+            self.lock.release()
+
+
+# callback(status) is called from the engine thread for every successful poll
+class AcquisitionEngine(Publisher):
+
+    ERROR_BACKOFF = 0.1                 # Seconds to wait after a failed poll (e.g. board unplugged)
+
+    def __init__(self, device, rate = 20, policy = pollScheduler.DROP):
+        Publisher.__init__(self)
+        self.device = device            # Anything with a get_status() method (see picDevice.PicDevice)
+        self.rate = rate                # Target polls/second. None or 0 = poll as fast as the device answers
+        self.scheduler = pollScheduler.DeadlineScheduler(rate, policy)
+        self.stats = self.scheduler.stats   # Achieved rate, jitter percentiles, missed deadlines
+
+        self.thread = None
+        self.name = "AcquisitionEngine"     # The thread's name
+        self.running = False
+
+        self.latest = None              # Most recent status
+        self.sample_count = 0
+        self.error_count = 0
+        self.last_error = None
+
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target = self.run, name = self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout = None):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.currentThread():
+            self.thread.join(timeout)
+        self.thread = None
+
+    def is_running(self):
+        return self.running
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.scheduler.set_rate(rate)
+
+
+    # Polls the device once and publishes the result. Returns the status, or None if the poll failed
+    def poll_once(self):
+        try:
+            status = self.device.get_status()
+        except Exception as e:
+            self.error_count += 1
+            self.last_error = e
+            return None
+
+        self.latest = status
+        self.sample_count += 1
+        self.publish(status)
+        return status
+
+
+    # The polling loop (runs on self.thread)
+    def run(self):
+        self.scheduler.reset()
+        while self.running:
+            self.scheduler.wait()
+            if self.poll_once() is None:
+                time.sleep(self.ERROR_BACKOFF)
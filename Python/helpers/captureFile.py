@@ -0,0 +1,246 @@
+"""
+Capture File - compact binary logs of PIC statuses.
+
+A capture is a fixed header followed by fixed-width little-endian records:
+
+    header  magic "PICCAP\\r\\n", version, header size, record size, field count,
+            start time (host wall clock, unix seconds), start clock (pollScheduler.clock()),
+            target rate (polls/second, 0 = unpaced), ADC channel map (the debug_message
+            bytes holding the high and low byte of the ADC reading), then one
+            (name, struct code) entry per record field
+    record  the fields of the schema the capture was written with:
+              standard  timestamp (seconds since start clock), raw ADC, PORTA..TRISC, dm0..dm7, LED
+              full      the same plus a sequence number (records written before this one) and the
+                        host wall clock (unix seconds) when the record was written, just after its poll
+              adc       timestamp and raw ADC only
+            Readers go by the field entries in the header, so they read any schema
+    footer  (version 2, optional) an index footer, added when a capture is sealed (see
+            segmentedCapture.py): an (record number, timestamp) entry every block, then the
+            record count, first and last timestamps, entry count and magic "PICIDX\r\n"
+
+Records are only ever appended, and the header never changes once written,
+so a capture that was cut off (crash, unplugged laptop) is still readable:
+everything up to the last whole record is there.
+
+Captures compressed with gzip (.gz) or xz (.xz, Python 3 only) are read
+the same way.
+
+Use:
+    capture = CaptureWriter("capture.pic", rate = 100, schema = "full")
+    engine.subscribe(capture.write)         # every PicStatus becomes one record
+    ...
+    capture.close()
+
+    header, records = read_capture("capture.pic")
+"""
+
+import os
+import time
+import gzip
+import struct
+import operator
+from collections import namedtuple
+
+from pollScheduler import clock
+
+
+MAGIC = b"PICCAP\r\n"           # The \r\n catches files mangled by text-mode transfers
+VERSION = 2                     # Newest version read here. 2 = may end with an index footer
+PLAIN_VERSION = 1               # What CaptureWriter writes, so older readers still take plain captures
+
+HEADER_STRUCT = struct.Struct("<8sHHHHdddBB")
+FIELD_STRUCT = struct.Struct("<15sc")          # name, struct code
+
+INDEX_MAGIC = b"PICIDX\r\n"
+INDEX_ENTRY_STRUCT = struct.Struct("<Qd")      # record number, its timestamp
+FOOTER_STRUCT = struct.Struct("<QddQ8s")       # records, first timestamp, last timestamp, index entries, magic
+
+# Which debug_message bytes the ADC reading is in, as (high byte, low byte)
+ADC_CHANNEL = (3, 6)
+
+# The record fields, in order, with their struct codes
+RECORD_FIELDS = (("timestamp", "d"), ("adc", "H"),
+                 ("PORTA", "B"), ("PORTB", "B"), ("PORTC", "B"),
+                 ("TRISA", "B"), ("TRISB", "B"), ("TRISC", "B"),
+                 ("dm0", "B"), ("dm1", "B"), ("dm2", "B"), ("dm3", "B"),
+                 ("dm4", "B"), ("dm5", "B"), ("dm6", "B"), ("dm7", "B"),
+                 ("led", "B"))
+
+RECORD_STRUCT = struct.Struct("<" + "".join([code for name, code in RECORD_FIELDS]))
+
+# Every field a record can have, in the order CaptureWriter.write() works them out
+ALL_FIELDS = (("seq", "I"), ("timestamp", "d"), ("wall_time", "d")) + RECORD_FIELDS[1:]
+
+# Schema name --> its record fields
+SCHEMAS = {"standard" : RECORD_FIELDS,
+           "full" : (("seq", "I"), ("timestamp", "d"), ("wall_time", "d")) + RECORD_FIELDS[1:],
+           "adc" : (("timestamp", "d"), ("adc", "H"))}
+DEFAULT_SCHEMA = "standard"
+
+CaptureHeader = namedtuple('CaptureHeader', 'version header_size record_size start_time start_clock rate adc_channel fields')
+CaptureFooter = namedtuple('CaptureFooter', 'records first_timestamp last_timestamp index')
+
+
+class CaptureError(Exception):
+    pass
+
+
+def encode_header(start_time, start_clock, rate, adc_channel = ADC_CHANNEL, fields = RECORD_FIELDS,
+                  version = PLAIN_VERSION):
+    header_size = HEADER_STRUCT.size + FIELD_STRUCT.size * len(fields)
+    record_size = struct.calcsize("<" + "".join([code for name, code in fields]))
+    data = HEADER_STRUCT.pack(MAGIC, version, header_size, record_size, len(fields),
+                              start_time, start_clock, rate or 0, adc_channel[0], adc_channel[1])
+    for name, code in fields:
+        data += FIELD_STRUCT.pack(name.encode('ascii'), code.encode('ascii'))
+    return data
+
+
+# Reads the header from the start of an open (binary) file
+def read_header(fin):
+    data = fin.read(HEADER_STRUCT.size)
+    if len(data) < HEADER_STRUCT.size:
+        raise CaptureError("file is too short to be a capture")
+    (magic, version, header_size, record_size, field_count,
+     start_time, start_clock, rate, adc_high, adc_low) = HEADER_STRUCT.unpack(data)
+    if magic != MAGIC:
+        raise CaptureError("not a capture file")
+    if version > VERSION:
+        raise CaptureError("capture version %d is newer than this reader (%d)" % (version, VERSION))
+
+    fields = []
+    for i in range(field_count):
+        name, code = FIELD_STRUCT.unpack(fin.read(FIELD_STRUCT.size))
+        fields.append((name.rstrip(b"\0").decode('ascii'), code.decode('ascii')))
+    fin.seek(header_size)
+    return CaptureHeader(version, header_size, record_size, start_time, start_clock, rate,
+                         (adc_high, adc_low), tuple(fields))
+
+
+# The index footer of a sealed capture: index is a list of (record number, timestamp)
+def encode_footer(records, first_timestamp, last_timestamp, index):
+    data = bytearray()
+    for entry in index:
+        data += INDEX_ENTRY_STRUCT.pack(*entry)
+    return bytes(data + FOOTER_STRUCT.pack(records, first_timestamp, last_timestamp, len(index), INDEX_MAGIC))
+
+# The CaptureFooter at the end of data (whose records start at 'offset'), or None if the capture has none
+# (it was never sealed, or is version 1). Only the footer itself is looked at
+def decode_footer(header, data, offset = 0):
+    if header.version < 2 or len(data) < offset + FOOTER_STRUCT.size:
+        return None
+    records, first_timestamp, last_timestamp, entries, magic = FOOTER_STRUCT.unpack_from(data, len(data) - FOOTER_STRUCT.size)
+    start = len(data) - FOOTER_STRUCT.size - entries * INDEX_ENTRY_STRUCT.size
+    if magic != INDEX_MAGIC or start != offset + records * header.record_size:
+        return None                     # Records that happen to end in the magic, in a capture that was cut off
+    index = [INDEX_ENTRY_STRUCT.unpack_from(data, start + i * INDEX_ENTRY_STRUCT.size) for i in range(entries)]
+    return CaptureFooter(records, first_timestamp, last_timestamp, index)
+
+
+# Opens a capture for reading, decompressing it on the fly if it is .gz or .xz
+def open_file(filename):
+    if filename.endswith(".gz"):
+        return gzip.open(filename, 'rb')
+    if filename.endswith(".xz"):
+        try:
+            import lzma
+        except ImportError:
+            raise CaptureError("reading .xz captures needs Python 3 (lzma)")
+        return lzma.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+# Reads a whole capture into memory. Returns its header and a list of record tuples (see RECORD_FIELDS).
+# A partly written last record (the capture was cut off) is ignored
+def read_capture(filename):
+    fin = open_file(filename)
+    try:
+        header = read_header(fin)
+        data = fin.read()
+    finally:
+        fin.close()
+
+    record = struct.Struct("<" + "".join([code for name, code in header.fields]))
+    footer = decode_footer(header, data)
+    if footer is not None:
+        count = footer.records
+    else:
+        count = len(data) // record.size
+    return header, [record.unpack_from(data, i * record.size) for i in range(count)]
+
+
+class CaptureWriter:
+
+    BLOCK_SIZE = 64 * 1024          # Records are written to disk in blocks of about this many bytes
+    FLUSH_INTERVAL = 1.0            # ...or at least this often (seconds), so a crash loses at most this much
+
+    # schema is a name from SCHEMAS, or a sequence of (name, code) fields from ALL_FIELDS
+    def __init__(self, filename, rate = None, adc_channel = ADC_CHANNEL, start_clock = None, schema = DEFAULT_SCHEMA):
+        if start_clock is None:
+            start_clock = clock()
+        if isinstance(schema, type("")):
+            if schema not in SCHEMAS:
+                raise CaptureError("unknown schema %r (expected one of %s)" % (schema, ", ".join(sorted(SCHEMAS))))
+            fields = SCHEMAS[schema]
+        else:
+            fields = tuple(schema)
+        names = [name for name, code in ALL_FIELDS]
+        for field in fields:
+            if field not in ALL_FIELDS:
+                raise CaptureError("unknown record field %r" % (field,))
+
+        self.filename = filename
+        self.adc_channel = adc_channel
+        self.start_clock = start_clock
+        self.fields = fields
+        self.record = struct.Struct("<" + "".join([code for name, code in fields]))
+        self.select = operator.itemgetter(*[names.index(name) for name, code in fields])    # ALL_FIELDS --> fields
+        if len(fields) == 1:
+            self.select = lambda values, select = self.select: (select(values),)
+        self.block = bytearray()
+        self.records = 0
+        self.last_flush = clock()
+        self.start(time.time(), rate)
+
+    # Opens the file and writes the header
+    def start(self, start_time, rate):
+        self.fout = open(self.filename, 'wb')
+        self.fout.write(encode_header(start_time, self.start_clock, rate, self.adc_channel, self.fields))
+        self.sync()                 # A capture with a header is readable, even if nothing else makes it to disk
+
+
+    # Appends one PicStatus
+    def write(self, status):
+        dm = status.debug_message
+        adc = (dm[self.adc_channel[0]] << 8) + dm[self.adc_channel[1]]
+        self.block += self.record.pack(*self.select((self.records & 0xFFFFFFFF, status.timestamp - self.start_clock,
+                                                     time.time(), adc & 0xFFFF,
+                                                     status.PORTA, status.PORTB, status.PORTC,
+                                                     status.TRISA, status.TRISB, status.TRISC,
+                                                     dm[0], dm[1], dm[2], dm[3], dm[4], dm[5], dm[6], dm[7],
+                                                     status.led)))
+        self.records += 1
+
+        if len(self.block) >= self.BLOCK_SIZE or status.timestamp - self.last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+
+    # Hands the buffered records to the OS
+    def flush(self):
+        if self.block:
+            self.fout.write(self.block)
+            self.block = bytearray()
+        self.fout.flush()
+        self.last_flush = clock()
+
+    # Flushes, and waits until the records are actually on the disk
+    def sync(self):
+        self.flush()
+        os.fsync(self.fout.fileno())
+
+    def close(self):
+        if self.fout is None:
+            return
+        self.sync()
+        self.fout.close()
+        self.fout = None
@@ -0,0 +1,239 @@
+"""
+Capture Reader - reads data logs as NumPy arrays, without parsing them line by line.
+
+Binary captures (see captureFile.py) are memory-mapped: every column is a
+zero-copy view into the file, so only the pages that are actually looked at
+get read. A sparse time index (the timestamp of every INDEX_STRIDE'th record)
+finds a time window of a multi-GB capture with two binary searches.
+
+Compressed segments (.gz, .xz) are decompressed into memory instead, and a
+segmented capture's directory (see segmentedCapture.py) reads as one
+capture, its segments joined in order. Delta captures (deltaCapture.py) are
+decoded into the same columns.
+
+The old text logs ("Start time: ..." then one voltage per line, no
+timestamps) are read too; their samples are assumed to be 1/rate apart.
+
+Use:
+    capture = open_capture("data/capture.pic")
+    adc = capture["adc"]                    # or "voltage", "PORTA".."TRISC", "dm0".."dm7", "led", "timestamp"
+    window = capture.slice_time(60, 120)    # records between 1 and 2 minutes in
+    print(window["PORTA"].mean())
+"""
+
+import os
+import mmap
+import time
+
+import numpy
+
+import captureFile
+import segmentedCapture
+import deltaCapture
+import ConversionFunctions
+
+
+# struct code --> little-endian numpy type
+NUMPY_TYPES = {"d" : "<f8", "f" : "<f4", "Q" : "<u8", "I" : "<u4", "H" : "<u2", "B" : "u1", "b" : "i1", "h" : "<i2"}
+
+LEGACY_DTYPE = numpy.dtype([("timestamp", "<f8"), ("adc", "<u2"), ("voltage", "<f8")])
+
+# The inverse of ConversionFunctions.adcToVoltage (with its default Vref and resolution)
+def voltage_to_adc(voltage, Vref = 2.5, resolution = 10):
+    return numpy.round((voltage + Vref) * ((1 << resolution) / float(Vref))).astype(numpy.uint16)
+
+
+def record_dtype(fields):
+    return numpy.dtype([(str(name), NUMPY_TYPES[code]) for name, code in fields])
+
+
+# Opens a capture: binary (maybe compressed), a segmented capture's directory, or legacy text.
+# rate is only used for text logs, which don't record it
+def open_capture(filename, rate = 20):
+    if os.path.isdir(filename):
+        return SegmentedCapture(filename)
+    if filename.endswith((".gz", ".xz")):
+        return Capture(filename)
+    fin = open(filename, 'rb')
+    try:
+        magic = fin.read(len(captureFile.MAGIC))
+    finally:
+        fin.close()
+    if magic == captureFile.MAGIC:
+        return Capture(filename)
+    if magic == deltaCapture.MAGIC:
+        return DeltaCapture(filename)
+    return LegacyCapture(filename, rate)
+
+
+class CaptureBase:
+
+    INDEX_STRIDE = 4096         # Records per time index entry
+
+    def __init__(self):
+        self.records = numpy.empty(0, LEGACY_DTYPE)     # Set by the subclass
+        self.start_time = None                          # Host wall clock at the first record (unix seconds), if known
+        self.rate = None
+        self.time_index = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def names(self):
+        names = list(self.records.dtype.names)
+        if "voltage" not in names and "adc" in names:
+            names.append("voltage")
+        return names
+
+    # One column. A view into the file where possible; "voltage" is computed from "adc" if not stored
+    def column(self, name, start = 0, stop = None):
+        records = self.records[start:stop]
+        if name == "voltage" and "voltage" not in records.dtype.names:
+            return ConversionFunctions.adcToVoltageBlock(records["adc"])
+        return records[name]
+
+
+    def build_time_index(self):
+        self.time_index = numpy.array(self.records["timestamp"][::self.INDEX_STRIDE])
+
+    # Indices [start, stop) of the records with t0 <= timestamp < t1 (seconds since the start of the capture)
+    def time_range(self, t0, t1):
+        return self.find_time(t0), self.find_time(t1)
+
+    # Records with t0 <= timestamp < t1, as a view
+    def slice_time(self, t0, t1):
+        start, stop = self.time_range(t0, t1)
+        return self.records[start:stop]
+
+    # Index of the first record with timestamp >= t. Only reads the timestamps of one index stride
+    def find_time(self, t):
+        if self.time_index is None:
+            self.build_time_index()
+        block = int(numpy.searchsorted(self.time_index, t, 'left')) - 1
+        if block < 0:
+            return 0
+        start = block * self.INDEX_STRIDE
+        stop = min(start + self.INDEX_STRIDE + 1, len(self.records))
+        return start + int(numpy.searchsorted(self.records["timestamp"][start:stop], t, 'left'))
+
+
+class Capture(CaptureBase):
+
+    def __init__(self, filename):
+        CaptureBase.__init__(self)
+        self.filename = filename
+        self.map = None
+        if filename.endswith((".gz", ".xz")):
+            fin = captureFile.open_file(filename)
+            try:
+                self.header = captureFile.read_header(fin)
+                data = fin.read()
+            finally:
+                fin.close()
+            offset = 0
+        else:
+            fin = open(filename, 'rb')
+            try:
+                self.header = captureFile.read_header(fin)
+                self.map = mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ)
+            finally:
+                fin.close()             # The map stays valid
+            data = self.map
+            offset = self.header.header_size
+
+        self.start_time = self.header.start_time
+        self.rate = self.header.rate
+        self.footer = captureFile.decode_footer(self.header, data, offset)
+        if self.footer is not None:
+            count = self.footer.records
+        else:
+            count = (len(data) - offset) // self.header.record_size    # A cut-off last record is left out
+        dtype = record_dtype(self.header.fields)
+        if dtype.itemsize != self.header.record_size:
+            raise captureFile.CaptureError("field table does not match the record size")
+        self.records = numpy.frombuffer(data, dtype, count, offset)
+
+    # Drops the arrays and unmaps the file. Views handed out earlier keep the map alive until they go away
+    def close(self):
+        self.records = numpy.empty(0, self.records.dtype)
+        self.time_index = None
+        if self.map is None:
+            return
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+
+
+# A segmented capture's segments, read as one. The records are copied into one array
+class SegmentedCapture(CaptureBase):
+
+    def __init__(self, directory):
+        CaptureBase.__init__(self)
+        self.filename = directory
+        self.manifest = segmentedCapture.read_manifest(directory)
+        self.segments = [Capture(filename) for filename in segmentedCapture.segment_files(directory)]
+        if not self.segments:
+            raise captureFile.CaptureError("%s has no segments" % directory)
+        self.header = self.segments[0].header
+        self.start_time = self.header.start_time
+        self.rate = self.header.rate
+        self.records = numpy.concatenate([segment.records for segment in self.segments])
+        for segment in self.segments:
+            segment.close()
+
+
+# A delta capture, decoded into memory: timestamp, adc, then the state bytes
+class DeltaCapture(CaptureBase):
+
+    def __init__(self, filename):
+        CaptureBase.__init__(self)
+        self.filename = filename
+        reader = deltaCapture.DeltaReader(filename)
+        self.header = reader.header
+        self.start_time = reader.start_time
+        self.rate = reader.rate
+        times, rows = reader.decode()
+        fields = [("timestamp", "d"), ("adc", "H")] + [(name, "B") for name in deltaCapture.FIELDS]
+        self.records = numpy.empty(len(rows), record_dtype(fields))
+        self.records["timestamp"] = times
+        if rows:
+            values = numpy.array(rows, numpy.uint8)
+            for i, name in enumerate(deltaCapture.FIELDS):
+                self.records[name] = values[:, i]
+            high, low = ["dm%d" % i for i in self.header.adc_channel]
+            self.records["adc"] = (self.records[high].astype(numpy.uint16) << 8) + self.records[low]
+
+
+class LegacyCapture(CaptureBase):
+
+    START_FORMAT = "%m.%d.%Y - %Hh.%Mm.%Ss"
+
+    def __init__(self, filename, rate = 20):
+        CaptureBase.__init__(self)
+        self.filename = filename
+        self.rate = rate
+        fin = open(filename, 'r')
+        try:
+            lines = fin.read().split("\n")
+        finally:
+            fin.close()
+
+        values = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith("Start time:"):
+                try:
+                    self.start_time = time.mktime(time.strptime(line[len("Start time:"):].strip(), self.START_FORMAT))
+                except ValueError:
+                    pass
+            elif line:
+                values.append(float(line))
+
+        self.records = numpy.empty(len(values), LEGACY_DTYPE)
+        self.records["voltage"] = values
+        self.records["adc"] = voltage_to_adc(self.records["voltage"])
+        self.records["timestamp"] = numpy.arange(len(values)) / float(rate)
@@ -6,14 +6,11 @@ Data Logger Module - makes writing to files easy
 """
 
 import os
-import datetime
+
+import registerFormat
 
 def bin8(val):                  # ensures binary return value has leading 0's (total of 8)
-    newval = bin(val)           # bin() adds 0b... therefore goal length is 10
-    while (len(newval) < 10):
-        newval = newval[0:2] + '0' + newval[2:]
-        
-    return newval
+    return registerFormat.bin8(val)
 
 
 def makeDir():                  # If 'data' directory does not exist, create it
@@ -22,28 +19,9 @@ def makeDir():                  # If 'data' directory does not exist, create it
         os.makedirs(dir_name)           # make it
         
         
-def format_output(s):           # Converts passed in list to formatted output string
-    # Convert all values to strings
-    s = [str(val) for val in s]
-    
-    # Create formatted string
-    sout = ''
-    for i in range(len(s)):
-        val = s[i]
-        if (i < 6):             # Convert port & tris vals to binary
-            val = bin8(int(val))
-            sout += val.ljust(15)
-        else:                   # Append the rest of the values
-            sout += val.ljust(8)
-            
-    # Add timestamp
-    now = datetime.datetime.now()
-    now_s = "%d:%d:%d:%s" % (now.hour, now.minute, now.second, str(now.microsecond)[0:2])
-    
-    sout += now_s.ljust(20)
-        
-    
-    return sout
+def format_output(s, t = None, timestamp = None):   # Converts passed in list to formatted output string (port & tris
+    return registerFormat.format_row(s, t, timestamp)   # vals in binary, the rest in decimal, then the time t (time.time();
+                                                        # default now), with timestamp (a registerFormat.TimestampFormatter)
     
 def makeHeaders():             # Writes the headers for the file
     headers = ( "{0}{1}{2}{3}{4}{5}{6}{7}{8}{9}{10}{11}{12}{13}{14}".format(
@@ -0,0 +1,438 @@
+"""
+Delta Capture - change-only logs of PIC statuses, for full-state logging of mostly idle boards.
+
+The registers and debug bytes hardly ever change from one poll to the next,
+so instead of a whole record per poll a delta capture stores what changed:
+
+    header    magic "PICDLT\\r\\n", version, header size, start time, start clock,
+              target rate, keyframe interval, timestamp resolution, ADC channel map
+    entries   KEYFRAME  sample number, timestamp, time step, all 15 state bytes
+                        (PORTA..TRISC, dm0..dm7, LED): a place to start decoding from
+              DELTA     which bytes changed (a bit mask), the change in the time step,
+                        and the new values of those bytes: one sample
+              RUN       n more samples with nothing changed, each one time step later
+    footer    (once closed) a (sample number, file offset) entry per keyframe, then the
+              sample count, entry count and magic "PICDIX\\r\\n"
+
+Timestamps are kept to 'resolution' seconds (default a millisecond; the text
+logs had centiseconds) as whole ticks since the start clock. A steadily
+paced poll of an idle board is one RUN entry of a few bytes per keyframe
+interval, instead of ~40 bytes a sample.
+
+Any sample is found by going to the keyframe before it (at most
+keyframe_interval samples back) and decoding forward; RUNs are skipped over
+in one step. A capture that was cut off has no footer and is scanned for its
+keyframes instead, and is readable up to its last whole entry.
+
+Use:
+    capture = DeltaWriter("capture.picd", rate = 100)
+    engine.subscribe(capture.write)         # like captureFile.CaptureWriter
+    ...
+    capture.close()
+
+    reader = DeltaReader("capture.picd")
+    t, values = reader.sample(123456)       # values: PORTA..TRISC, dm0..dm7, LED
+    times, rows = reader.decode(1000, 2000)
+"""
+
+import os
+import time
+import math
+import struct
+import bisect
+from collections import namedtuple
+
+from pollScheduler import clock
+from captureFile import CaptureError, ADC_CHANNEL
+
+
+MAGIC = b"PICDLT\r\n"
+VERSION = 1
+INDEX_MAGIC = b"PICDIX\r\n"
+
+HEADER_STRUCT = struct.Struct("<8sHHdddIdBB")
+INDEX_ENTRY_STRUCT = struct.Struct("<QQ")       # sample number, file offset of its keyframe
+FOOTER_STRUCT = struct.Struct("<QQ8s")          # samples, index entries, magic
+
+# The state bytes of every sample, in order
+FIELDS = ("PORTA", "PORTB", "PORTC", "TRISA", "TRISB", "TRISC",
+          "dm0", "dm1", "dm2", "dm3", "dm4", "dm5", "dm6", "dm7", "led")
+FIELD_COUNT = len(FIELDS)
+
+# Entry types
+KEYFRAME = 0
+DELTA = 1
+RUN = 2
+
+KEYFRAME_INTERVAL = 4096        # Default samples between keyframes
+RESOLUTION = 1e-3               # Default timestamp resolution (seconds)
+
+DeltaHeader = namedtuple('DeltaHeader', 'version header_size start_time start_clock rate keyframe_interval resolution adc_channel')
+
+
+# Variable-length ints: 7 bits a byte, low bits first. Signed ones are zigzagged (0, -1, 1, -2 ... --> 0, 1, 2, 3 ...)
+def write_varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def write_signed(out, n):
+    write_varint(out, n << 1 if n >= 0 else (-n << 1) - 1)
+
+# Returns (value, offset just after it)
+def read_varint(data, offset):
+    n = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, offset
+        shift += 7
+
+def read_signed(data, offset):
+    n, offset = read_varint(data, offset)
+    return (n >> 1) if not n & 1 else -((n + 1) >> 1), offset
+
+
+# The state bytes of a PicStatus, as a tuple in FIELDS order
+def status_values(status):
+    return (status.PORTA, status.PORTB, status.PORTC, status.TRISA, status.TRISB, status.TRISC) + \
+           tuple(status.debug_message) + (status.led,)
+
+
+class DeltaEncoder:
+
+    def __init__(self, keyframe_interval = KEYFRAME_INTERVAL, offset = 0):
+        self.keyframe_interval = keyframe_interval
+        self.out = bytearray()          # Encoded entries not taken yet (see take())
+        self.offset = offset            # Where self.out starts in the file
+        self.index = []                 # (sample number, offset) of every keyframe
+        self.samples = 0
+        self.values = None
+        self.ticks = 0
+        self.step = 0                   # Ticks between the last two samples
+        self.run = 0                    # Samples in the RUN not written out yet
+
+    # Adds one sample: its timestamp in ticks and its FIELD_COUNT state bytes (a tuple)
+    def encode(self, ticks, values):
+        out = self.out
+        step = ticks - self.ticks
+        if self.samples % self.keyframe_interval == 0:
+            self.end_run()
+            if not self.samples:
+                step = 0
+            self.index.append((self.samples, self.offset + len(out)))
+            out.append(KEYFRAME)
+            write_varint(out, self.samples)
+            write_signed(out, ticks)
+            write_signed(out, step)
+            out += bytearray(values)
+        elif step == self.step and values == self.values:
+            self.run += 1
+        else:
+            self.end_run()
+            previous = self.values
+            mask = 0
+            changed = []
+            for i in range(FIELD_COUNT):
+                if values[i] != previous[i]:
+                    mask |= 1 << i
+                    changed.append(values[i])
+            out.append(DELTA)
+            write_varint(out, mask)
+            write_signed(out, step - self.step)
+            out += bytearray(changed)
+        self.values = values
+        self.ticks = ticks
+        self.step = step
+        self.samples += 1
+
+    # Writes out the samples of the current run
+    def end_run(self):
+        if self.run:
+            self.out.append(RUN)
+            write_varint(self.out, self.run)
+            self.run = 0
+
+    # The entries encoded since the last take(), ending any run so nothing is held back
+    def take(self):
+        self.end_run()
+        data = self.out
+        self.offset += len(data)
+        self.out = bytearray()
+        return data
+
+    def footer(self):
+        data = bytearray()
+        for entry in self.index:
+            data += INDEX_ENTRY_STRUCT.pack(*entry)
+        return bytes(data + FOOTER_STRUCT.pack(self.samples, len(self.index), INDEX_MAGIC))
+
+
+# Yields (first sample, count, first ticks, step, values) for every entry from 'offset' on (which must be a
+# keyframe): 'count' samples from 'first sample' on, 'step' ticks apart, all with state 'values'.
+# Stops at the end of the data, or at an entry that was cut off. Something that isn't an entry (an unknown kind,
+# or a keyframe out of sequence) raises CaptureError if strict, or ends the entries if not: when scanning a
+# capture that was cut off, it is the start of a partly written footer
+def iter_entries(data, offset, end = None, strict = True):
+    if end is None:
+        end = len(data)
+    sample = 0
+    ticks = step = 0
+    values = None
+    try:
+        while offset < end:
+            kind = data[offset]
+            if kind == KEYFRAME:
+                first, offset = read_varint(data, offset + 1)
+                if values is not None and first != sample:
+                    if not strict:
+                        return
+                    raise CaptureError("delta capture keyframe for sample %d where sample %d was expected" % (first, sample))
+                sample = first
+                ticks, offset = read_signed(data, offset)
+                step, offset = read_signed(data, offset)
+                if offset + FIELD_COUNT > end:
+                    return
+                values = tuple(data[offset:offset + FIELD_COUNT])
+                offset += FIELD_COUNT
+                yield sample, 1, ticks, step, values
+            elif kind == DELTA:
+                mask, offset = read_varint(data, offset + 1)
+                change, offset = read_signed(data, offset)
+                new = list(values)
+                for i in range(FIELD_COUNT):
+                    if mask & (1 << i):
+                        new[i] = data[offset]
+                        offset += 1
+                if offset > end:
+                    return
+                values = tuple(new)
+                step += change
+                ticks += step
+                yield sample, 1, ticks, step, values
+            elif kind == RUN:
+                count, offset = read_varint(data, offset + 1)
+                yield sample, count, ticks + step, step, values
+                ticks += step * count
+                sample += count - 1
+            elif not strict:
+                return
+            else:
+                raise CaptureError("bad delta capture entry %d at offset %d" % (kind, offset))
+            sample += 1
+    except IndexError:                      # Cut off in the middle of an entry
+        return
+
+
+def encode_header(start_time, start_clock, rate, keyframe_interval, resolution, adc_channel = ADC_CHANNEL):
+    return HEADER_STRUCT.pack(MAGIC, VERSION, HEADER_STRUCT.size, start_time, start_clock, rate or 0,
+                              keyframe_interval, resolution, adc_channel[0], adc_channel[1])
+
+def decode_header(data):
+    if len(data) < HEADER_STRUCT.size:
+        raise CaptureError("file is too short to be a delta capture")
+    (magic, version, header_size, start_time, start_clock, rate, keyframe_interval, resolution,
+     adc_high, adc_low) = HEADER_STRUCT.unpack_from(data)
+    if magic != MAGIC:
+        raise CaptureError("not a delta capture")
+    if version > VERSION:
+        raise CaptureError("delta capture version %d is newer than this reader (%d)" % (version, VERSION))
+    return DeltaHeader(version, header_size, start_time, start_clock, rate, keyframe_interval, resolution,
+                       (adc_high, adc_low))
+
+
+class DeltaWriter:
+
+    BLOCK_SIZE = 16 * 1024          # Entries are written to disk in blocks of about this many bytes
+    FLUSH_INTERVAL = 1.0            # ...or at least this often (seconds), so a crash loses at most this much
+
+    def __init__(self, filename, rate = None, adc_channel = ADC_CHANNEL, start_clock = None,
+                 keyframe_interval = KEYFRAME_INTERVAL, resolution = RESOLUTION):
+        if start_clock is None:
+            start_clock = clock()
+        self.filename = filename
+        self.start_clock = start_clock
+        self.resolution = resolution
+        header = encode_header(time.time(), start_clock, rate, keyframe_interval, resolution, adc_channel)
+        self.encoder = DeltaEncoder(keyframe_interval, len(header))
+        self.fout = open(filename, 'wb')
+        self.fout.write(header)
+        self.sync()
+        self.last_flush = clock()
+
+    def __len__(self):
+        return self.encoder.samples
+
+
+    # Appends one PicStatus
+    def write(self, status):
+        self.encoder.encode(int(round((status.timestamp - self.start_clock) / self.resolution)), status_values(status))
+        if len(self.encoder.out) >= self.BLOCK_SIZE or status.timestamp - self.last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    # Hands the encoded entries to the OS
+    def flush(self):
+        self.fout.write(self.encoder.take())
+        self.fout.flush()
+        self.last_flush = clock()
+
+    # Flushes, and waits until the entries are actually on the disk
+    def sync(self):
+        self.flush()
+        os.fsync(self.fout.fileno())
+
+    # Writes the keyframe index and closes the file
+    def close(self):
+        if self.fout is None:
+            return
+        self.flush()
+        self.fout.write(self.encoder.footer())
+        self.sync()
+        self.fout.close()
+        self.fout = None
+
+
+class DeltaReader:
+
+    def __init__(self, filename):
+        self.filename = filename
+        fin = open(filename, 'rb')
+        try:
+            self.data = bytearray(fin.read())
+        finally:
+            fin.close()
+        self.header = decode_header(self.data)
+        self.resolution = self.header.resolution
+        self.start_time = self.header.start_time
+        self.rate = self.header.rate
+
+        footer = self.read_footer()
+        self.strict = footer is not None     # Without a footer, the entries end wherever they stop making sense
+        if footer is not None:
+            self.samples, self.index, self.end = footer
+        else:
+            self.scan()
+        self.index_samples = [sample for sample, offset in self.index]
+
+    def __len__(self):
+        return self.samples
+
+    # (samples, index, end of the entries) from the footer, or None if there isn't one (the capture was cut off)
+    def read_footer(self):
+        data = self.data
+        if len(data) < self.header.header_size + FOOTER_STRUCT.size:
+            return None
+        samples, entries, magic = FOOTER_STRUCT.unpack_from(data, len(data) - FOOTER_STRUCT.size)
+        end = len(data) - FOOTER_STRUCT.size - entries * INDEX_ENTRY_STRUCT.size
+        if magic != INDEX_MAGIC or end < self.header.header_size:
+            return None
+        index = [INDEX_ENTRY_STRUCT.unpack_from(data, end + i * INDEX_ENTRY_STRUCT.size) for i in range(entries)]
+        if entries and (index[0][1] != self.header.header_size or data[index[0][1]] != KEYFRAME):
+            return None
+        return samples, index, end
+
+    # Finds the keyframes and counts the samples by decoding the whole capture, up to its last whole entry
+    def scan(self):
+        self.samples = 0
+        self.end = len(self.data)
+        for sample, count, ticks, step, values in iter_entries(self.data, self.header.header_size, strict = False):
+            self.samples = sample + count
+        self.index = list(self.keyframes(self.header.header_size))
+
+    # Yields (sample number, offset) of the keyframes from 'offset' on, skipping over the other entries
+    def keyframes(self, offset):
+        data = self.data
+        sample = 0
+        try:
+            while offset < self.end:
+                kind = data[offset]
+                start = offset
+                if kind == KEYFRAME:
+                    number, offset = read_varint(data, offset + 1)
+                    if number != sample or sample >= self.samples:      # Cut off, or the start of a partial footer
+                        return
+                    yield sample, start
+                    offset = read_varint(data, read_varint(data, offset)[1])[1] + FIELD_COUNT
+                    sample += 1
+                elif kind == DELTA:
+                    mask, offset = read_varint(data, offset + 1)
+                    offset = read_varint(data, offset)[1] + bin(mask).count("1")
+                    sample += 1
+                elif kind == RUN:
+                    count, offset = read_varint(data, offset + 1)
+                    sample += count
+                else:
+                    return
+        except IndexError:
+            return
+
+
+    # Offset of the last keyframe at or before 'sample'
+    def keyframe_before(self, sample):
+        i = bisect.bisect_right(self.index_samples, sample) - 1
+        if i < 0:
+            raise IndexError("sample %d is out of range" % sample)
+        return self.index[i][1]
+
+    # (timestamp, values) of sample i. timestamp is in seconds since the start clock
+    def sample(self, i):
+        if i < 0:
+            i += self.samples
+        if not 0 <= i < self.samples:
+            raise IndexError("sample %d is out of range (%d samples)" % (i, self.samples))
+        for first, count, ticks, step, values in iter_entries(self.data, self.keyframe_before(i), self.end, self.strict):
+            if first + count > i:
+                return (ticks + (i - first) * step) * self.resolution, values
+        raise IndexError("sample %d is out of range" % i)
+
+    # Samples [start, stop), as a list of timestamps and a list of value tuples
+    def decode(self, start = 0, stop = None):
+        if stop is None or stop > self.samples:
+            stop = self.samples
+        times = []
+        rows = []
+        if start >= stop:
+            return times, rows
+        resolution = self.resolution
+        for first, count, ticks, step, values in iter_entries(self.data, self.keyframe_before(start), self.end, self.strict):
+            if first + count <= start:
+                continue
+            if first >= stop:
+                break
+            skip = max(start - first, 0)
+            n = min(first + count, stop) - first - skip
+            ticks += skip * step
+            times.extend([(ticks + k * step) * resolution for k in range(n)])
+            rows.extend([values] * n)
+        return times, rows
+
+    # Index of the first sample with timestamp >= t (seconds since the start clock), by binary search over
+    # the keyframes and then decoding forward
+    def find_time(self, t):
+        lo, hi = 0, len(self.index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.sample(self.index[mid][0])[0] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return 0
+        target = t / self.resolution
+        for first, count, ticks, step, values in iter_entries(self.data, self.index[lo - 1][1], self.end, self.strict):
+            if ticks + (count - 1) * step >= target:
+                if ticks >= target:
+                    return first
+                return first + int(math.ceil((target - ticks) / step))
+        return self.samples
+
+
+# Reads a whole delta capture. Returns its header and a list of (timestamp, PORTA..TRISC, dm0..dm7, LED) tuples
+def read_delta(filename):
+    reader = DeltaReader(filename)
+    times, rows = reader.decode()
+    return reader.header, [(t,) + values for t, values in zip(times, rows)]
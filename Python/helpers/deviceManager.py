@@ -0,0 +1,225 @@
+"""
+Device Manager - finds every PIC plugged into the host and polls them all at once.
+
+Each board is opened by its id (the serial number in its string descriptor,
+or where it is plugged in if it has none) and gets its own PicDevice, its own
+polling thread and DeadlineScheduler, optionally its own capture file, and
+its own health counters. The threads spend nearly all their time blocked in
+USB transfers, which run outside the GIL, so boards on different USB
+controllers are polled in parallel: the total rate grows with the number of
+controllers instead of being capped by one loop.
+
+A board that keeps failing is reopened (e.g. after being unplugged and
+plugged back in) without disturbing the others. Ids must be unique: each
+board's capture file is named after its id, so a board whose id is already
+in the pool is refused.
+
+Use:
+    manager = DeviceManager(lambda id: usbTransport.LibusbTransport(serial = id), rate = 100)
+    manager.open_all()                      # every board list_devices() finds
+    manager.start_capture("captures")       # captures/<id>.pic for each board (or captures/<id>/, segmented)
+    manager.start()
+    ...
+    manager.stop()
+    print(manager.summary())
+"""
+
+import os
+import re
+
+import acquisitionEngine
+import captureFile
+import segmentedCapture
+import picDevice
+import pollScheduler
+from pollScheduler import clock
+
+
+# An AcquisitionEngine for one of several boards, that keeps track of the board's health
+class DeviceEngine(acquisitionEngine.AcquisitionEngine):
+
+    RECONNECT_AFTER = 10                # Consecutive failed polls before the board is reopened
+
+    def __init__(self, id, device, rate = 20, policy = pollScheduler.DROP):
+        acquisitionEngine.AcquisitionEngine.__init__(self, device, rate, policy)
+        self.id = id
+        self.name = "DeviceEngine %s" % id
+        self.capture = None             # captureFile.CaptureWriter, while capturing
+        self.consecutive_errors = 0
+        self.reconnects = 0
+        self.last_sample_time = None    # clock() of the last successful poll
+
+
+    def poll_once(self):
+        status = acquisitionEngine.AcquisitionEngine.poll_once(self)
+        if status is not None:
+            self.consecutive_errors = 0
+            self.last_sample_time = clock()
+            return status
+
+        self.consecutive_errors += 1
+        if self.consecutive_errors % self.RECONNECT_AFTER == 0:
+            self.reconnects += 1
+            self.device.open()
+        return None
+
+
+    # "ok", "failing" (some recent polls failed) or "lost" (reconnecting)
+    def state(self):
+        if self.consecutive_errors >= self.RECONNECT_AFTER:
+            return "lost"
+        if self.consecutive_errors:
+            return "failing"
+        return "ok"
+
+    def health(self):
+        jitter = self.stats.jitter_percentiles((50, 99))
+        return {'id' : self.id, 'state' : self.state(), 'samples' : self.sample_count,
+                'errors' : self.error_count, 'reconnects' : self.reconnects,
+                'rate' : self.stats.achieved_rate(), 'missed' : self.stats.missed, 'dropped' : self.stats.dropped,
+                'jitter_p50' : jitter[50], 'jitter_p99' : jitter[99],
+                'captured' : self.capture is not None and self.capture.records or 0,
+                'last_error' : self.last_error is not None and str(self.last_error) or None}
+
+
+class DeviceManager:
+
+    VENDOR_ID   = picDevice.PicDevice.VENDOR_ID
+    PRODUCT_ID  = picDevice.PicDevice.PRODUCT_ID
+
+    def __init__(self, make_transport, rate = 20, policy = pollScheduler.DROP):
+        self.make_transport = make_transport    # make_transport(id) --> a usbTransport.Transport that opens board 'id'
+        self.rate = rate
+        self.policy = policy
+        self.engines = []                       # A DeviceEngine per open board, in the order they were added
+
+
+    def __len__(self):
+        return len(self.engines)
+
+    def __iter__(self):
+        return iter(self.engines)
+
+    def __getitem__(self, id):
+        for engine in self.engines:
+            if engine.id == id:
+                return engine
+        raise KeyError(id)
+
+    def ids(self):
+        return [engine.id for engine in self.engines]
+
+
+    # Ids of all the boards plugged in
+    def enumerate(self):
+        return sorted(self.make_transport(None).list_devices(self.VENDOR_ID, self.PRODUCT_ID))
+
+    # Opens board 'id' and adds it to the pool. Returns its DeviceEngine, or None if it couldn't be opened.
+    # Raises ValueError if a board with that id is already in the pool
+    def add(self, id):
+        if id in self.ids():
+            raise ValueError("board %s is already open (board ids must be unique)" % id)
+        device = picDevice.PicDevice(self.make_transport(id))
+        if not device.open():
+            return None
+        engine = DeviceEngine(id, device, self.rate, self.policy)
+        self.engines.append(engine)
+        return engine
+
+    # Opens the given boards (default: all of them). Returns how many were opened
+    def open_all(self, ids = None):
+        if ids is None:
+            ids = self.enumerate()
+        opened = 0
+        for id in ids:
+            if id in self.ids():
+                print("board %s is listed twice; opened once" % id)
+            elif self.add(id) is None:
+                print("unable to open board %s" % id)
+            else:
+                opened += 1
+        return opened
+
+
+    # callback(id, status) is called from each board's thread for every successful poll
+    def subscribe(self, callback):
+        for engine in self.engines:
+            engine.subscribe(lambda status, id = engine.id: callback(id, status))
+
+    def start(self):
+        for engine in self.engines:
+            engine.start()
+
+    def stop(self, timeout = None):
+        for engine in self.engines:
+            engine.running = False          # Let them all wind down at once, then wait for each
+        for engine in self.engines:
+            engine.stop(timeout)
+
+    def set_rate(self, rate):
+        self.rate = rate
+        for engine in self.engines:
+            engine.set_rate(rate)
+
+
+    # Starts writing each board's samples to directory/<id>.pic (see captureFile.py for the schemas). With a
+    # segment_size (bytes) or segment_time (seconds), each board gets a segmented capture in directory/<id>/
+    # instead (see segmentedCapture.py)
+    def start_capture(self, directory, start_clock = None, schema = captureFile.DEFAULT_SCHEMA,
+                      segment_size = None, segment_time = None, compression = "zlib"):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if start_clock is None:
+            start_clock = clock()           # Same timebase for every board, so their captures line up
+        names = set()
+        for engine in self.engines:
+            if engine.capture is not None:
+                continue
+            name = re.sub(r"[^A-Za-z0-9_.@-]", "_", engine.id)
+            while name in names:                    # Two ids that only differ in characters that were replaced
+                name += "_"
+            names.add(name)
+            filename = os.path.join(directory, name)
+            if segment_size or segment_time:
+                engine.capture = segmentedCapture.SegmentedCaptureWriter(filename, engine.rate, start_clock = start_clock,
+                                                                         schema = schema, segment_size = segment_size,
+                                                                         segment_time = segment_time, compression = compression)
+            else:
+                engine.capture = captureFile.CaptureWriter(filename + ".pic", engine.rate, start_clock = start_clock,
+                                                           schema = schema)
+            engine.subscribe(engine.capture.write)
+
+    def stop_capture(self):
+        for engine in self.engines:
+            if engine.capture is None:
+                continue
+            engine.unsubscribe(engine.capture.write)
+            engine.capture.close()
+            engine.capture = None
+
+
+    def close(self):
+        self.stop()
+        self.stop_capture()
+        for engine in self.engines:
+            engine.device.close()
+        self.engines = []
+
+
+    # ===== Health ===== #
+
+    def health(self):
+        return [engine.health() for engine in self.engines]
+
+    # Samples/second over all the boards
+    def total_rate(self):
+        return sum([engine.stats.achieved_rate() for engine in self.engines])
+
+    def summary(self):
+        lines = []
+        for h in self.health():
+            lines.append("%-12s %-7s %8d samples %8.1f/s  %d errors  %d reconnects  %d missed  %d dropped  "
+                         "jitter p50 %.3fms p99 %.3fms" % (h['id'], h['state'], h['samples'], h['rate'], h['errors'],
+                         h['reconnects'], h['missed'], h['dropped'], h['jitter_p50'] * 1000, h['jitter_p99'] * 1000))
+        lines.append("%d boards, %.1f samples/s in total" % (len(self.engines), self.total_rate()))
+        return "\n".join(lines)
@@ -0,0 +1,169 @@
+"""
+EEPROM Image - the host's copy of the PIC's 256-byte EEPROM.
+
+Every byte is either known (read from the PIC, or written to it) or dirty
+(the PIC may have changed it since). Refreshing only re-reads the dirty bytes,
+coalesced into as few GET_EEPROM_BLOCK transfers as possible, so reading
+the EEPROM a second time usually costs nothing. Writing a whole target image
+the same way only sends the bytes that differ (diff_blocks).
+
+Images can be saved as raw binary (.bin), Intel HEX (.hex) or the old text
+dump (.txt), picked by the file name's extension.
+
+Use:
+    image = EepromImage()
+    image.refresh(device.read_eeprom_block)     # reads whatever is dirty
+    image.save("eeprom.hex")
+"""
+
+from picProtocol import EEPROM_SIZE, EEPROM_BLOCK_SIZE, EEPROM_WRITE_BLOCK_SIZE
+
+
+class EepromImage:
+
+    def __init__(self, size = EEPROM_SIZE):
+        self.size = size
+        self.data = bytearray(size)
+        self.dirty = bytearray(b"\x01" * size)      # 1 = not known to match the PIC
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def tolist(self):
+        return list(self.data)
+
+
+    # Forget bytes [offset, offset + length) (all of them if no range is given)
+    def invalidate(self, offset = 0, length = None):
+        if length is None:
+            length = self.size - offset
+        self.dirty[offset:offset + length] = b"\x01" * length
+
+    # Record bytes known to be on the PIC (just read, or just written)
+    def update(self, offset, data):
+        self.data[offset:offset + len(data)] = bytearray(data)
+        self.dirty[offset:offset + len(data)] = bytearray(len(data))
+
+    def is_valid(self):
+        return not any(self.dirty)
+
+
+    # The dirty bytes as (offset, length) reads of at most block_size bytes
+    def dirty_blocks(self, block_size = EEPROM_BLOCK_SIZE):
+        blocks = []
+        offset = 0
+        while offset < self.size:
+            if not self.dirty[offset]:
+                offset += 1
+                continue
+            end = offset
+            while end < self.size and end - offset < block_size and self.dirty[end]:
+                end += 1
+            blocks.append((offset, end - offset))
+            offset = end
+        return blocks
+
+    # Re-reads the dirty bytes with read_block(offset, length) --> list of bytes. Returns # transfers made
+    def refresh(self, read_block, block_size = EEPROM_BLOCK_SIZE):
+        blocks = self.dirty_blocks(block_size)
+        for offset, length in blocks:
+            self.update(offset, read_block(offset, length))
+        return len(blocks)
+
+
+    # Where target differs from the image, as (offset, length) writes of at most block_size bytes.
+    # Differences close together share a write; the unchanged bytes between them are sent again, but the
+    # firmware doesn't rewrite bytes that already match
+    def diff_blocks(self, target, block_size = EEPROM_WRITE_BLOCK_SIZE):
+        target = bytearray(target)
+        changed = [i for i in range(self.size) if target[i] != self.data[i]]
+        blocks = []
+        for i in changed:
+            if blocks and i < blocks[-1][0] + block_size:
+                blocks[-1][1] = i + 1 - blocks[-1][0]
+            else:
+                blocks.append([i, 1])
+        return [tuple(block) for block in blocks]
+
+
+    # ===== Export ===== #
+
+    def to_bin(self):
+        return bytes(self.data)
+
+    # Intel HEX: 16-byte data records, then the end-of-file record
+    def to_hex(self, record_size = 16):
+        lines = []
+        for offset in range(0, self.size, record_size):
+            chunk = self.data[offset:offset + record_size]
+            record = bytearray([len(chunk), offset >> 8, offset & 0xFF, 0x00]) + chunk
+            record.append(-sum(record) & 0xFF)
+            lines.append(":" + "".join(["%02X" % b for b in record]))
+        lines.append(":00000001FF")
+        return "\n".join(lines) + "\n"
+
+    # The GUI's original dump: one "Byte n: <tab>value" line per byte
+    def to_text(self):
+        return "".join(["Byte %d: \t%d\n" % (i, b) for i, b in enumerate(self.data)])
+
+    # Saves in the format given by the file's extension (.bin, .hex, else text)
+    def save(self, filename, header = ""):
+        extension = filename.lower().rsplit(".", 1)[-1]
+        if extension == "bin":
+            fout = open(filename, 'wb')
+            fout.write(self.to_bin())
+        elif extension in ("hex", "ihx"):
+            fout = open(filename, 'w')
+            fout.write(self.to_hex())
+        else:
+            fout = open(filename, 'w')
+            fout.write(header)
+            fout.write(self.to_text())
+        fout.close()
+
+
+# ===== Import ===== #
+
+# Reads an image saved by EepromImage.save (.bin, .hex or text dump). Returns a bytearray of 'size' bytes;
+# bytes the file doesn't mention are 0
+def load(filename, size = EEPROM_SIZE):
+    extension = filename.lower().rsplit(".", 1)[-1]
+    image = bytearray(size)
+    if extension == "bin":
+        fin = open(filename, 'rb')
+        data = bytearray(fin.read())
+        fin.close()
+        if len(data) > size:
+            raise ValueError("%s is %d bytes; the eeprom only has %d" % (filename, len(data), size))
+        image[:len(data)] = data
+        return image
+
+    fin = open(filename, 'r')
+    lines = fin.read().splitlines()
+    fin.close()
+    if extension in ("hex", "ihx"):
+        for number, line in enumerate(lines):
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith(":"):
+                raise ValueError("%s line %d is not an Intel HEX record" % (filename, number + 1))
+            record = bytearray([int(line[i:i + 2], 16) for i in range(1, len(line), 2)])
+            if sum(record) & 0xFF:
+                raise ValueError("%s line %d has a bad checksum" % (filename, number + 1))
+            count, address, kind = record[0], (record[1] << 8) | record[2], record[3]
+            if kind == 0x01:                                # End of file
+                break
+            if kind == 0x00:
+                if address + count > size:
+                    raise ValueError("%s line %d is past the end of the eeprom" % (filename, number + 1))
+                image[address:address + count] = record[4:4 + count]
+    else:
+        for line in lines:                                  # "Byte n: <tab>value"; anything else is skipped
+            if line.startswith("Byte "):
+                address, value = line[5:].split(":")
+                image[int(address)] = int(value)
+    return image
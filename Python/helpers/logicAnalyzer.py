@@ -0,0 +1,238 @@
+"""
+Logic Analyzer - PORTA/B/C as 24 digital pins, stored as the times their level changed.
+
+Register values are turned into per-pin transition lists a block at a time:
+XOR each value with the one before it, keep only the samples where any bit
+changed (numpy.nonzero), and split those into bits. Nothing is kept per
+sample, so a pin that toggles a few times a day costs a few floats however
+fast the board is polled. An edge's time is the timestamp of the first
+sample that showed the new level (the change happened since the poll before).
+
+Each pin answers, from its edge times alone (binary searches and diffs):
+
+    level_at(t)         0 or 1 at time t (or an array of times)
+    edges(t0, t1)       the edges in a window, and the level after each
+    pulse_widths(1)     how long each complete high (or low) pulse lasted
+    frequency()         rising edges per second, over the whole periods seen
+    decimate(t0, t1, n) one entry per pixel for drawing (see logicTimeline.py):
+                        the level at the start of the pixel and how many edges fall in it
+
+Use:
+    logic = LogicCapture.from_capture(captureReader.open_capture("capture.pic"))
+    pin = logic.pin("PORTB.2")
+    print(pin.level_at(12.5), pin.frequency(), pin.pulse_widths(1).max())
+
+    recorder = LogicRecorder(LogicCapture())        # live
+    engine.subscribe(recorder.write)
+    recorder.update()                               # now and then, from the thread that reads the capture
+"""
+
+import threading
+from collections import deque
+
+import numpy
+
+
+REGISTERS = ("PORTA", "PORTB", "PORTC")
+PINS = ["%s.%d" % (register, bit) for register in REGISTERS for bit in range(8)]
+
+EMPTY = numpy.empty(0, numpy.float64)
+
+
+class Pin:
+
+    def __init__(self, name, initial, start, end, times):
+        self.name = name
+        self.initial = initial          # Level at 'start', the first sample
+        self.start = start
+        self.end = end                  # Time of the last sample
+        self.times = times              # Edge times, in order. The level toggles at each one
+
+    def __len__(self):
+        return len(self.times)
+
+    # Levels at the given edges: the level after edge k is initial ^ (k + 1) & 1
+    def levels_after(self, first, count):
+        return ((numpy.arange(first, first + count) + 1 + self.initial) & 1).astype(numpy.uint8)
+
+
+    # Level at time t (t may be an array). Before the first sample, the first sample's level
+    def level_at(self, t):
+        changes = numpy.searchsorted(self.times, t, 'right')
+        return (changes + self.initial) & 1
+
+    # Edge times with t0 <= time < t1, and the level after each
+    def edges(self, t0, t1):
+        lo, hi = numpy.searchsorted(self.times, (t0, t1), 'left')
+        return self.times[lo:hi], self.levels_after(lo, hi - lo)
+
+    # Edge k is rising if the level before it, initial ^ k & 1, was low
+    def rising(self):
+        return self.times[self.initial::2]
+
+    def falling(self):
+        return self.times[1 - self.initial::2]
+
+    # Durations of the complete pulses at 'level' (one that started before the first sample, or hasn't ended by
+    # the last, is left out)
+    def pulse_widths(self, level = 1):
+        times = self.times[(level + self.initial + 1) & 1:]               # From the first edge into 'level'
+        n = len(times) // 2
+        return times[1:2 * n:2] - times[0:2 * n:2]
+
+    # Rising edges per second, over the whole periods between the first and last rising edge (0 if < 2)
+    def frequency(self):
+        rising = self.rising()
+        if len(rising) < 2:
+            return 0.0
+        return (len(rising) - 1) / float(rising[-1] - rising[0])
+
+    # Fraction of [start, end] spent high
+    def duty_cycle(self):
+        if self.end <= self.start:
+            return float(self.initial)
+        spans = numpy.diff(numpy.concatenate(([self.start], self.times, [self.end])))
+        return float(spans[1 - self.initial::2].sum()) / (self.end - self.start)
+
+
+    # For drawing t0..t1 'width' pixels wide: the level at the start of each pixel, and the number of edges in it
+    # (0 = flat, 1 = one transition, more = too busy to draw apart). One binary search per pixel boundary, so it
+    # takes as long for a million edges in view as for one
+    def decimate(self, t0, t1, width):
+        width = int(width)
+        bounds = numpy.searchsorted(self.times, numpy.linspace(t0, t1, width + 1), 'left')
+        return ((bounds[:-1] + self.initial) & 1).astype(numpy.uint8), numpy.diff(bounds)
+
+
+class LogicCapture:
+
+    def __init__(self, registers = REGISTERS):
+        self.registers = tuple(registers)
+        self.lock = threading.Lock()
+        self.start = None               # Time of the first sample
+        self.end = None                 # ...and of the last
+        self.samples = 0
+        self.last = {}                  # register --> its last value
+        self.initial = {}               # pin --> its level at the first sample
+        self.chunks = {}                # pin --> edge time arrays, one per append() that had any
+        self.pins = {}                  # pin --> Pin, built on demand
+
+    def pin_names(self):
+        return ["%s.%d" % (register, bit) for register in self.registers for bit in range(8)]
+
+    # Adds a block of samples: timestamps, and an array of values for every register (a dict, or anything
+    # indexed by register name like a capture's records)
+    def append(self, timestamps, columns):
+        timestamps = numpy.asarray(timestamps, numpy.float64)
+        n = len(timestamps)
+        if not n:
+            return
+        self.lock.acquire()
+        try:
+            for register in self.registers:
+                values = numpy.asarray(columns[register]).astype(numpy.uint8)
+                if register not in self.last:
+                    for bit in range(8):
+                        self.initial["%s.%d" % (register, bit)] = int(values[0] >> bit) & 1
+                    previous = values[0]
+                else:
+                    previous = self.last[register]
+                changed = numpy.empty(n, numpy.uint8)
+                changed[0] = values[0] ^ previous
+                numpy.bitwise_xor(values[1:], values[:-1], out = changed[1:])
+                rows = numpy.nonzero(changed)[0]
+                if len(rows):
+                    bits = numpy.unpackbits(changed[rows].reshape(-1, 1), axis = 1)     # Bit 7 first
+                    for bit in range(8):
+                        at = rows[bits[:, 7 - bit] != 0]
+                        if len(at):
+                            name = "%s.%d" % (register, bit)
+                            self.chunks.setdefault(name, []).append(timestamps[at])
+                self.last[register] = values[-1]
+            if self.start is None:
+                self.start = float(timestamps[0])
+            self.end = float(timestamps[-1])
+            self.samples += n
+        finally:
+            self.lock.release()
+
+    # Adds a list of PicStatus
+    def append_statuses(self, statuses):
+        if not statuses:
+            return
+        self.append([status.timestamp for status in statuses],
+                    dict([(register, [getattr(status, register) for status in statuses]) for register in self.registers]))
+
+    # A capture (see captureReader.open_capture) read in blocks of 'block' records
+    @classmethod
+    def from_capture(cls, capture, registers = REGISTERS, block = 1 << 20):
+        missing = [register for register in registers if register not in capture.names()]
+        if missing:
+            raise ValueError("the capture has no %s column (its schema only has %s)" % (
+                             ", ".join(missing), ", ".join(capture.names())))
+        logic = cls(registers)
+        for start in range(0, len(capture), block):
+            records = capture.records[start:start + block]
+            logic.append(records["timestamp"], records)
+        return logic
+
+
+    # The Pin called 'name' ("PORTB.2"), as of the last append
+    def pin(self, name):
+        self.lock.acquire()
+        try:
+            pin = self.pins.get(name)
+            if pin is None or pin.end != self.end:
+                if name not in self.initial:
+                    if name not in self.pin_names():
+                        raise KeyError(name)
+                    return Pin(name, 0, self.start, self.end, EMPTY)            # No samples yet
+                chunks = self.chunks.get(name)
+                if not chunks:
+                    times = EMPTY
+                else:
+                    if len(chunks) > 1:
+                        chunks[:] = [numpy.concatenate(chunks)]
+                    times = chunks[0]
+                pin = Pin(name, self.initial[name], self.start, self.end, times)
+                self.pins[name] = pin
+            return pin
+        finally:
+            self.lock.release()
+
+    # Total edges on all pins
+    def edge_count(self):
+        return sum([len(self.pin(name)) for name in self.pin_names()])
+
+    # One line per pin that has any edges: edges, frequency, shortest/longest high pulse
+    def summary(self):
+        lines = ["%-8s %10s %12s %12s %12s %7s" % ("pin", "edges", "freq (Hz)", "min high ms", "max high ms", "duty")]
+        for name in self.pin_names():
+            pin = self.pin(name)
+            if not len(pin):
+                continue
+            widths = pin.pulse_widths(1)
+            lines.append("%-8s %10d %12.3f %12.3f %12.3f %6.1f%%" % (name, len(pin), pin.frequency(),
+                         len(widths) and widths.min() * 1000 or 0, len(widths) and widths.max() * 1000 or 0,
+                         pin.duty_cycle() * 100))
+        lines.append("%d samples over %.3fs, %d edges" % (self.samples, (self.end or 0) - (self.start or 0),
+                                                          self.edge_count()))
+        return "\n".join(lines)
+
+
+# Collects live statuses (write() is called from the acquisition thread) and adds them to a LogicCapture in
+# blocks when update() is called
+class LogicRecorder:
+
+    def __init__(self, capture):
+        self.capture = capture
+        self.pending = deque()          # deque.append/popleft are safe across threads without a lock
+
+    def write(self, status):
+        self.pending.append(status)
+
+    # Returns how many statuses were added
+    def update(self):
+        statuses = [self.pending.popleft() for i in range(len(self.pending))]
+        self.capture.append_statuses(statuses)
+        return len(statuses)
@@ -0,0 +1,223 @@
+"""
+Logic Timeline - draws a logicAnalyzer.LogicCapture as one row per pin, like a logic analyzer.
+
+Every repaint asks each pin for one entry per pixel (Pin.decimate): a pixel
+with no edge is drawn as a flat line at the pin's level, one edge as a
+transition, and several edges as a filled block. That is a binary search per
+pixel boundary, so a view with millions of edges in it draws as fast as one
+with a few.
+
+Mouse: the wheel zooms around the pointer, dragging pans, a double click
+shows everything again (and, live, follows the newest samples). The time,
+level, edge count and frequency under the pointer are shown in the window's
+status bar.
+
+Use:
+    window = LogicWindow(logicAnalyzer.LogicCapture.from_capture(capture))
+    window.show()
+
+    recorder = logicAnalyzer.LogicRecorder(logicAnalyzer.LogicCapture())        # live
+    engine.subscribe(recorder.write)
+    window = LogicWindow(recorder.capture, recorder)
+"""
+
+from PyQt4 import QtGui, QtCore
+
+import numpy
+
+
+class LogicTimeline(QtGui.QWidget):
+
+    ROW_HEIGHT = 20
+    LABEL_WIDTH = 64
+    AXIS_HEIGHT = 18
+    TICKS = 8                       # Roughly how many time labels on the axis
+    MIN_SPAN = 1e-6                 # Most zoomed in, in seconds across the widget
+
+    def __init__(self, logic, pins = None, parent = None):
+        QtGui.QWidget.__init__(self, parent)
+        self.logic = logic
+        self.pins = pins or logic.pin_names()
+        self.t0 = None                  # The time window shown. None = everything
+        self.t1 = None
+        self.follow = True              # Keep the newest samples in view (as they come in, live)
+        self.drag_x = None
+        self.setMouseTracking(True)
+        self.setMinimumSize(self.LABEL_WIDTH + 200, len(self.pins) * self.ROW_HEIGHT + self.AXIS_HEIGHT)
+        self.setSizePolicy(QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Fixed)
+
+
+    # ===== View ===== #
+
+    # (t0, t1) shown, in capture timestamps
+    def view(self):
+        start, end = self.logic.start or 0.0, self.logic.end or 0.0
+        if self.t0 is None:
+            return start, max(end, start + self.MIN_SPAN)
+        if self.follow and end > self.t1:             # Live: slide along with the newest samples
+            return end - (self.t1 - self.t0), end
+        return self.t0, self.t1
+
+    def set_view(self, t0, t1, follow = False):
+        span = max(t1 - t0, self.MIN_SPAN)
+        self.t0, self.t1 = t0, t0 + span
+        self.follow = follow
+        self.update()
+
+    def show_all(self):
+        self.t0 = self.t1 = None
+        self.follow = True
+        self.update()
+
+    def plot_width(self):
+        return max(self.width() - self.LABEL_WIDTH, 1)
+
+    # Pixel x (widget coordinates) --> time
+    def time_at(self, x):
+        t0, t1 = self.view()
+        return t0 + (x - self.LABEL_WIDTH) * (t1 - t0) / float(self.plot_width())
+
+    # Pixel y --> the pin in that row, or None
+    def pin_at(self, y):
+        row = y // self.ROW_HEIGHT
+        if 0 <= row < len(self.pins):
+            return self.pins[row]
+        return None
+
+
+    # ===== Mouse ===== #
+
+    def wheelEvent(self, event):
+        t0, t1 = self.view()
+        at = self.time_at(event.x())
+        scale = 0.8 ** (event.delta() / 120.0)          # One notch in = 80% of the span
+        self.set_view(at - (at - t0) * scale, at + (t1 - at) * scale, self.follow and t1 >= (self.logic.end or 0))
+
+    def mousePressEvent(self, event):
+        if event.button() == QtCore.Qt.LeftButton:
+            self.drag_x = event.x()
+
+    def mouseMoveEvent(self, event):
+        if self.drag_x is not None:
+            t0, t1 = self.view()
+            shift = self.time_at(self.drag_x) - self.time_at(event.x())
+            self.drag_x = event.x()
+            self.set_view(t0 + shift, t1 + shift)
+        self.emit(QtCore.SIGNAL('status(QString)'), self.describe(event.x(), event.y()))
+
+    def mouseReleaseEvent(self, event):
+        self.drag_x = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.show_all()
+
+    # What is under the pointer, e.g. "t = 12.503100 s   PORTB.2 = 1   1520 edges, 50.000 Hz"
+    def describe(self, x, y):
+        if x < self.LABEL_WIDTH or self.logic.start is None:
+            return ""
+        t = self.time_at(x)
+        text = "t = %.6f s" % (t - self.logic.start)
+        name = self.pin_at(y)
+        if name is not None:
+            pin = self.logic.pin(name)
+            text += "   %s = %d   %d edges, %.3f Hz" % (name, pin.level_at(t), len(pin), pin.frequency())
+        return text
+
+
+    # ===== Drawing ===== #
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtCore.Qt.black)
+        if self.logic.start is None:
+            painter.setPen(QtCore.Qt.gray)
+            painter.drawText(self.LABEL_WIDTH, self.ROW_HEIGHT, "No samples yet")
+            return
+        t0, t1 = self.view()
+        width = self.plot_width()
+        for row, name in enumerate(self.pins):
+            self.draw_row(painter, row * self.ROW_HEIGHT, self.logic.pin(name), t0, t1, width)
+        self.draw_axis(painter, len(self.pins) * self.ROW_HEIGHT, t0, t1, width)
+        painter.end()
+
+    def draw_row(self, painter, top, pin, t0, t1, width):
+        painter.setPen(QtCore.Qt.lightGray)
+        painter.drawText(4, top + self.ROW_HEIGHT - 6, pin.name)
+        painter.setPen(QtGui.QColor(40, 40, 40))
+        painter.drawLine(0, top + self.ROW_HEIGHT - 1, self.width(), top + self.ROW_HEIGHT - 1)
+
+        high, low = top + 3, top + self.ROW_HEIGHT - 4
+        x0 = self.LABEL_WIDTH
+        levels, counts = pin.decimate(t0, t1, width)
+        # Each pixel: the level it ends at, or 2 if it has too many edges to draw apart
+        codes = numpy.where(counts > 1, 2, levels ^ (counts & 1))
+        starts = numpy.concatenate(([0], numpy.nonzero(numpy.diff(codes))[0] + 1))
+        stops = numpy.concatenate((starts[1:], [width]))
+
+        busy = QtGui.QColor(0, 160, 0)
+        lines = []
+        for start, stop, code in zip(starts.tolist(), stops.tolist(), codes[starts].tolist()):
+            if code == 2:
+                painter.fillRect(x0 + start, high, stop - start, low - high + 1, busy)
+            else:
+                y = code and high or low
+                lines.append(QtCore.QLine(x0 + start, y, x0 + stop - 1, y))
+        for x in numpy.nonzero(counts == 1)[0].tolist():
+            lines.append(QtCore.QLine(x0 + x, high, x0 + x, low))
+        painter.setPen(QtCore.Qt.green)
+        painter.drawLines(lines)
+
+    def draw_axis(self, painter, top, t0, t1, width):
+        painter.setPen(QtCore.Qt.gray)
+        painter.drawLine(self.LABEL_WIDTH, top, self.width(), top)
+        step = nice_step((t1 - t0) / self.TICKS)
+        first = numpy.ceil((t0 - self.logic.start) / step) * step
+        for tick in numpy.arange(first, t1 - self.logic.start, step):
+            x = self.LABEL_WIDTH + int((tick + self.logic.start - t0) * width / (t1 - t0))
+            painter.drawLine(x, top, x, top + 4)
+            painter.drawText(x + 2, top + self.AXIS_HEIGHT - 4, "%gs" % round(tick, 9))
+
+
+# 1, 2 or 5 times a power of ten, at least 'step'
+def nice_step(step):
+    power = 10.0 ** numpy.floor(numpy.log10(step))
+    for multiple in (1, 2, 5):
+        if multiple * power >= step:
+            return multiple * power
+    return 10 * power
+
+
+# A window around a LogicTimeline. With a logicAnalyzer.LogicRecorder, new samples are added and drawn
+# 'display_rate' times a second
+class LogicWindow(QtGui.QMainWindow):
+
+    display_rate = 30
+
+    def __init__(self, logic, recorder = None, pins = None, parent = None):
+        QtGui.QMainWindow.__init__(self, parent)
+        self.setWindowTitle("Logic Analyzer")
+        self.recorder = recorder
+        self.timeline = LogicTimeline(logic, pins)
+        scroll = QtGui.QScrollArea()
+        scroll.setWidget(self.timeline)
+        scroll.setWidgetResizable(True)
+        self.setCentralWidget(scroll)
+        self.resize(1000, self.timeline.minimumHeight() + 60)
+        self.connect(self.timeline, QtCore.SIGNAL('status(QString)'), self.statusBar().showMessage)
+
+        self.timer = None
+        if recorder is not None:
+            self.timer = QtCore.QTimer(self)
+            self.connect(self.timer, QtCore.SIGNAL('timeout()'), self.refresh)
+            self.timer.start(int(1000 / self.display_rate))
+
+    # Adds the statuses recorded since the last call, and redraws if there were any
+    def refresh(self):
+        if self.recorder.update():
+            self.timeline.update()
+
+    def closeEvent(self, event):
+        if self.timer is not None:
+            self.timer.stop()
+        self.emit(QtCore.SIGNAL('closed()'))
+        QtGui.QMainWindow.closeEvent(self, event)
@@ -0,0 +1,137 @@
+"""
+PIC Async - an asyncio front end to PicDevice, for running the PIC alongside other async equipment.
+
+The transports only make blocking calls, so every request runs on an executor
+thread and the event loop just awaits it. By default all boards share one
+small pool (USB_WORKERS threads) rather than getting a thread each; requests
+to the same board still run one at a time, in order, because PicDevice holds
+its lock around every transfer.
+
+Every request has a timeout (DEFAULT_TIMEOUT unless given) and can be
+cancelled. A request that hasn't reached the USB yet is dropped. A transfer
+already under way can't be interrupted. It finishes within the transport's
+own 100 ms timeout, and its result is thrown away.
+
+Needs Python 3.6 or later (asyncio and async generators); the rest of the
+helpers don't depend on it.
+
+Use:
+    async with AsyncPicDevice(picDevice.PicDevice()) as dev:
+        status = await dev.get_status()
+        async for status in dev.stream(rate = 100):
+            ...
+"""
+
+import asyncio
+import concurrent.futures
+
+import picDevice
+import pollScheduler
+
+
+DEFAULT_TIMEOUT = 1.0           # Seconds a request may take, queueing included
+USB_WORKERS     = 4             # Threads in the shared executor
+
+shared_executor = None
+
+
+def default_executor():
+    global shared_executor
+    if shared_executor is None:
+        shared_executor = concurrent.futures.ThreadPoolExecutor(USB_WORKERS)
+    return shared_executor
+
+
+class AsyncPicDevice:
+
+    def __init__(self, device = None, executor = None, timeout = DEFAULT_TIMEOUT):
+        if device is None:
+            device = picDevice.PicDevice()
+        self.device = device
+        self.executor = executor or default_executor()
+        self.timeout = timeout
+
+
+    # Runs function(*args) on the executor. Raises asyncio.TimeoutError if it takes longer than timeout
+    # (default: self.timeout; None = wait for ever)
+    async def call(self, function, *args, timeout = False):
+        if timeout is False:
+            timeout = self.timeout
+        loop = asyncio.get_event_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self.executor, function, *args), timeout)
+
+
+    async def open(self, timeout = False):
+        return await self.call(self.device.open, timeout = timeout)
+
+    async def close(self, timeout = False):
+        return await self.call(self.device.close, timeout = timeout)
+
+    async def __aenter__(self):
+        if not await self.open():
+            raise picDevice.PicUsbError("no matching device found")
+        return self
+
+    async def __aexit__(self, kind, value, traceback):
+        await self.close()
+
+
+    # ===== Commands ===== #
+
+    async def get_status(self, timeout = False):
+        return await self.call(self.device.get_status, timeout = timeout)
+
+    async def set_led(self, value, timeout = False):
+        return await self.call(self.device.set_led, value, timeout = timeout)
+
+    async def get_led(self, timeout = False):
+        return await self.call(self.device.get_led, timeout = timeout)
+
+    async def set_register(self, register, value, timeout = False):
+        return await self.call(self.device.set_register, register, value, timeout = timeout)
+
+    async def send_msg1(self, value, timeout = False):
+        return await self.call(self.device.send_msg1, value, timeout = timeout)
+
+    async def send_msg2(self, value, timeout = False):
+        return await self.call(self.device.send_msg2, value, timeout = timeout)
+
+    async def read_eeprom(self, refresh_all = False, timeout = False):
+        return await self.call(self.device.read_eeprom, refresh_all, timeout = timeout)
+
+    async def write_eeprom(self, image, verify = True, timeout = False):
+        return await self.call(self.device.write_eeprom, image, verify, timeout = timeout)
+
+
+    # ===== Acquisition ===== #
+
+    # Yields a PicStatus 'rate' times a second, against deadlines on the loop's clock like
+    # pollScheduler.DeadlineScheduler. With DROP, polls that are already late are skipped
+    async def stream(self, rate, policy = pollScheduler.DROP, timeout = False):
+        loop = asyncio.get_event_loop()
+        period = 1.0 / rate
+        deadline = loop.time()
+        while True:
+            behind = loop.time() - deadline
+            if behind < 0:
+                await asyncio.sleep(-behind)
+            elif behind > period and policy == pollScheduler.DROP:
+                deadline += int(behind / period) * period
+            yield await self.get_status(timeout)
+            deadline += period
+
+    # Yields blocks of ADC samples (numpy arrays of streamReader.BLOCK_DTYPE) streamed by the PIC over the
+    # bulk endpoint at 'rate' samples/second. The PIC stops streaming when the generator is closed
+    # (aclose(), or once it is garbage collected after the loop over it ends)
+    async def stream_blocks(self, rate, timeout = False):
+        import streamReader
+        reader = streamReader.StreamReader(self.device)
+        await self.call(self.device.start_stream, 1.0 / rate, timeout = timeout)
+        try:
+            while True:
+                block = await self.call(reader.read_block, timeout = timeout)
+                if len(block):
+                    yield block
+        finally:
+            if self.device.is_open():
+                await self.call(self.device.stop_stream, timeout = timeout)
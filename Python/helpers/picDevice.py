@@ -0,0 +1,276 @@
+"""
+PIC Device - owns the connection to one PIC and knows the vendor requests it understands.
+
+How the bytes get to the PIC (usb.dll, libusb-1.0, or the simulator) is up to
+the transport it is given; see usbTransport.py. Nothing in here imports Qt,
+so it can be used by the GUI as well as by headless tools.
+"""
+
+import ctypes
+import threading
+
+from picProtocol import *
+from pollScheduler import clock
+import usbTransport
+import eepromImage
+import transferStats
+
+
+class PicUsbError(Exception):
+
+    # ret: what the failed transfer returned, if it was a transfer that failed
+    def __init__(self, message, ret = None):
+        Exception.__init__(self, message)
+        self.ret = ret
+
+
+# Each thread's own transfer buffer, allocated the first time that thread uses it. Replies are decoded
+# straight out of it after the device lock is released, without another thread's transfer overwriting it
+class TransferBuffers(threading.local):
+
+    def __init__(self):
+        self.control = ctypes.c_buffer(VENDOR_DATA_SIZE)
+
+
+class PicDevice:
+
+    VENDOR_ID   = 0x6666
+    PRODUCT_ID  = 0x0003
+
+    def __init__(self, transport = None):
+        if transport is None:
+            transport = usbTransport.default_transport()
+        self.transport = transport
+        self.buffers = TransferBuffers()            # Per-thread; see buffer()
+        self.lock = threading.Lock()                # Transports are not safe to call from several threads at once
+        self.status_all_supported = None            # Whether the firmware knows GET_STATUS_ALL (None = not asked yet)
+        self.eeprom_block_supported = None          # Same, for GET_EEPROM_BLOCK
+        self.eeprom = eepromImage.EepromImage()     # Cached copy of the PIC's eeprom (see read_eeprom)
+        self.stats = transferStats.TransferStats()  # Calls, errors and latency of every transfer, per request
+
+
+    # Opens the first matching PIC. Returns True on success
+    def open(self):
+        self.close()
+        self.status_all_supported = None
+        self.eeprom_block_supported = None
+        self.eeprom.invalidate()                    # Could be a different PIC, or InitEEPROM() may have run
+
+        if not self.transport.open(self.VENDOR_ID, self.PRODUCT_ID):
+            print("No matching device found...\n")
+            self.stats.record_open(False)
+            return False
+        self.stats.record_open(True)
+
+        self.lock.acquire()
+        try:
+            ret = self.transfer(0x00, SET_CONFIGURATION, 1, 0, 0, self.buffer())
+        finally:
+            self.lock.release()
+        if ret < 0:
+            print("Unable to send SET_CONFIGURATION standard request.\n")
+        return True
+
+
+    def close(self):
+        self.transport.close()
+
+
+    def is_open(self):
+        return self.transport.is_open()
+
+
+    # The calling thread's transfer buffer (VENDOR_DATA_SIZE bytes)
+    def buffer(self):
+        return self.buffers.control
+
+    # One control transfer, counted and timed in self.stats. Call with self.lock held
+    def transfer(self, bmRequestType, bRequest, wValue, wIndex, wLength, buffer):
+        start = clock()
+        ret = self.transport.control_transfer(bmRequestType, bRequest, wValue, wIndex, wLength, buffer)
+        self.stats.record(bRequest, clock() - start, ret)
+        return ret
+
+    # Raw control transfer. Returns the transport's return code (# bytes transferred, or < 0 on error)
+    def control_transfer(self, bmRequestType, bRequest, wValue, wIndex, wLength, buffer):
+        if not self.is_open():
+            raise PicUsbError("device is not open")
+        self.lock.acquire()
+        try:
+            return self.transfer(bmRequestType, bRequest, wValue, wIndex, wLength, buffer)
+        finally:
+            self.lock.release()
+
+
+    # Asks the PIC for wLength bytes with the given vendor request. Returns the calling thread's transfer
+    # buffer with the reply at its start, to be decoded (e.g. with picProtocol.STATUS_ALL_STRUCT) before the thread's
+    # next transfer
+    def read_into(self, bRequest, wLength, wValue = 0):
+        if not self.is_open():
+            raise PicUsbError("device is not open")
+        buffer = self.buffers.control
+        self.lock.acquire()
+        try:
+            ret = self.transfer(VENDOR_IN, bRequest, wValue, 0, wLength, buffer)
+        finally:
+            self.lock.release()
+        if ret < wLength:
+            raise PicUsbError("vendor request %d returned %d" % (bRequest, ret), ret)
+        return buffer
+
+    # Same, returning the reply as a list of ints
+    def read_request(self, bRequest, wLength, wValue = 0):
+        return list(BYTES_STRUCTS[wLength].unpack_from(self.read_into(bRequest, wLength, wValue)))
+
+
+    # Sends a single value to the PIC with the given vendor request
+    def write_request(self, bRequest, value):
+        return self.control_transfer(VENDOR_OUT, bRequest, value, 0, 0, self.buffers.control)
+
+
+    # ===== Commands ===== #
+
+    def set_led(self, value):
+        return self.write_request(SET_LED, value)
+
+    def get_led(self):
+        return LED_STRUCT.unpack_from(self.read_into(GET_LED, LED_LENGTH))[0]
+
+    # register is one of "PORTA", "PORTB", "PORTC", "TRISA", "TRISB", "TRISC"
+    def set_register(self, register, value):
+        return self.write_request(SET_REGISTER_REQUESTS[register], value)
+
+    def send_msg1(self, value):
+        self.eeprom.invalidate(0, 5)                # main.c writes it to eeprom, at an address that cycles through 0..4
+        return self.write_request(SET_USB_MSG1, value)
+
+    def send_msg2(self, value):
+        return self.write_request(SET_USB_MSG2, value)
+
+    # Returns the PIC's 256 eeprom bytes. Only the bytes that may have changed since the last call are
+    # read again (all of them if refresh_all), in 64-byte blocks if the firmware supports GET_EEPROM_BLOCK
+    def read_eeprom(self, refresh_all = False):
+        if refresh_all:
+            self.eeprom.invalidate()
+        if self.eeprom_block_supported is not False:
+            try:
+                self.eeprom.refresh(self.read_eeprom_block)
+                self.eeprom_block_supported = True
+            except PicUsbError:
+                if self.eeprom_block_supported is not None:
+                    raise
+                self.eeprom_block_supported = False             # Older firmware: stalls
+        if self.eeprom_block_supported is False and not self.eeprom.is_valid():
+            self.eeprom.update(0, self.read_eeprom_legacy())
+        return self.eeprom.tolist()
+
+    # Up to EEPROM_BLOCK_SIZE eeprom bytes from offset, as a string of bytes
+    def read_eeprom_block(self, offset, length):
+        return self.read_into(GET_EEPROM_BLOCK, length, offset).raw[:length]
+
+    # Writes up to VENDOR_DATA_SIZE bytes to the eeprom from offset, in one SET_EEPROM_BLOCK
+    def write_eeprom_block(self, offset, data):
+        data = bytes(bytearray(data))
+        self.eeprom.invalidate(offset, len(data))
+        if not self.is_open():
+            raise PicUsbError("device is not open")
+        buffer = self.buffers.control
+        ctypes.memmove(buffer, data, len(data))
+        self.lock.acquire()
+        try:
+            ret = self.transfer(VENDOR_OUT, SET_EEPROM_BLOCK, offset, 0, len(data), buffer)
+            if ret < 0:
+                raise PicUsbError("eeprom write at 0x%02x returned %d (firmware without SET_EEPROM_BLOCK?)" % (offset, ret))
+        finally:
+            self.lock.release()
+
+
+    # Makes the PIC's eeprom match image (EEPROM_SIZE bytes). Only the bytes that differ from the cached
+    # contents are sent, packed into as few SET_EEPROM_BLOCK transfers as possible; with verify, the
+    # written blocks are read back. Returns the (offset, length) blocks written
+    def write_eeprom(self, image, verify = True):
+        image = bytearray(image)
+        if len(image) != EEPROM_SIZE:
+            raise ValueError("eeprom image must be %d bytes, not %d" % (EEPROM_SIZE, len(image)))
+
+        self.read_eeprom()                          # Brings the cache up to date (only reads what is dirty)
+        blocks = self.eeprom.diff_blocks(image)
+        for offset, length in blocks:
+            self.write_eeprom_block(offset, image[offset:offset + length])
+
+        if verify:
+            self.read_eeprom()                      # Re-reads just the blocks written
+            wrong = [i for i in range(EEPROM_SIZE) if self.eeprom[i] != image[i]]
+            if wrong:
+                raise PicUsbError("eeprom verify failed: %d bytes differ, the first at 0x%02x" % (len(wrong), wrong[0]))
+        else:
+            self.eeprom.update(0, image)
+        return blocks
+
+    # All 256 bytes with the unaddressed GET_EEPROM. Each gives the next 8, from wherever the PIC's
+    # eeprom_return_index is; 32 of them bring it back to where it started
+    def read_eeprom_legacy(self):
+        eeprom = bytearray()
+        for i in range(EEPROM_SIZE // 8):
+            eeprom += self.read_into(GET_EEPROM, 8).raw[:8]
+        return eeprom
+
+
+    # Reads up to len(buffer) bytes from a bulk endpoint into buffer. Returns # bytes read (0 on timeout)
+    def bulk_read(self, endpoint, buffer, timeout = 100):
+        if not self.is_open():
+            raise PicUsbError("device is not open")
+        start = clock()
+        try:
+            ret = self.transport.bulk_read(endpoint, buffer, len(buffer), timeout)  # Own endpoint, so no need for self.lock
+        except NotImplementedError as e:
+            raise PicUsbError(str(e))
+        self.stats.record("bulk 0x%02x" % endpoint, clock() - start, ret)
+        if ret < 0:
+            raise PicUsbError("bulk read on endpoint 0x%02x returned %d" % (endpoint, ret))
+        return ret
+
+
+    # Asks the PIC to stream one sample every 'period' seconds over the bulk endpoint (see streamReader.py)
+    def start_stream(self, period):
+        units = int(round(period / STREAM_PERIOD_UNIT))
+        units = max(1, min(units, 255))
+        self.transport.claim_interface(0)
+        self.write_request(START_STREAM, units)
+        return units * STREAM_PERIOD_UNIT           # The period the PIC will actually use
+
+    def stop_stream(self):
+        self.write_request(STOP_STREAM, 0)
+
+
+    # Gets the entire 'status' of the PIC (PORT and TRIS registers, debug messages and the debug LED).
+    # One GET_STATUS_ALL transfer if the firmware supports it, else the three separate requests
+    def get_status(self):
+        if not self.is_open():
+            raise PicUsbError("device is not open")
+        timestamp = clock()
+        if self.status_all_supported is not False:
+            try:
+                reply = self.read_into(GET_STATUS_ALL, STATUS_ALL_LENGTH)
+            except PicUsbError as e:
+                # Firmware without GET_STATUS_ALL either stalls it or (the original firmware) answers with 0 bytes,
+                # so on the first poll a stall or a short reply means it isn't there. Anything else (a timeout) is
+                # raised, and GET_STATUS_ALL is tried again on the next poll
+                if self.status_all_supported is None and e.ret is not None and \
+                   (e.ret in transferStats.STALL_CODES or 0 <= e.ret < STATUS_ALL_LENGTH):
+                    self.status_all_supported = False
+                    return self.get_status_legacy(timestamp)
+                raise
+            self.status_all_supported = True
+            return decode_status_all(reply, timestamp)
+
+        return self.get_status_legacy(timestamp)
+
+
+    # The per-field requests understood by every firmware version
+    def get_status_legacy(self, timestamp):
+        debug_message = DEBUG_MSG_STRUCT.unpack_from(self.read_into(GET_DEBUG_MSG, DEBUG_MSG_LENGTH))
+        r = REGISTERS_STRUCT.unpack_from(self.read_into(GET_REGISTERS, REGISTERS_LENGTH))
+        led = LED_STRUCT.unpack_from(self.read_into(GET_LED, LED_LENGTH))[0]
+
+        return PicStatus(timestamp, r[0], r[1], r[2], r[3], r[4], r[5], debug_message, led)
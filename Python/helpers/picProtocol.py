@@ -0,0 +1,93 @@
+"""
+USB-PIC Protocol - the vendor request numbers shared with the PIC, and the
+records built from its replies.
+
+The numbers are arbitrary ("vendor requests") but must match the defines
+at the bottom of main.c
+
+picDevice decodes replies straight out of its transfer buffers with the
+precompiled reply structs below, with no per-byte Python work.
+"""
+
+import struct
+from collections import namedtuple
+
+
+# bmRequestType values used with control_transfer
+VENDOR_IN       = 0xC0  # Pic --> USB (device-to-host, vendor request)
+VENDOR_OUT      = 0x40  # USB --> Pic (host-to-device, vendor request)
+
+SET_CONFIGURATION = 0x09    # standard request, sent once after opening the device
+
+# Vendor Requests
+GET_LED         = 3     # Pic --> USB
+SET_LED         = 4     # USB --> Pic
+
+GET_DEBUG_MSG   = 10    # Pic --> USB (can get up to 8 messages)
+GET_REGISTERS   = 11    # Pic --> USB (Gets PORT and TRIS Registers)
+GET_EEPROM      = 12    # Pic --> USB (gets 256 eeprom bytes)
+GET_STATUS_ALL  = 13    # Pic --> USB (debug messages + PORT/TRIS registers + LED in one transfer; newer firmware only)
+
+START_STREAM    = 14    # USB --> Pic (start sampling into the EP1 stream; value = sample period in 100 us units)
+STOP_STREAM     = 15    # USB --> Pic
+
+GET_EEPROM_BLOCK = 16   # Pic --> USB (up to 64 eeprom bytes from the address in wValue; newer firmware only)
+SET_EEPROM_BLOCK = 17   # USB --> Pic (writes the data stage to eeprom from the address in wValue; newer firmware only)
+
+SET_USB_MSG1    = 20    # USB --> Pic (can send any one message)
+SET_USB_MSG2    = 21
+
+SET_PORTA       = 30    # USB --> Pic
+SET_PORTB       = 31
+SET_PORTC       = 32
+
+SET_TRISA       = 35    # USB --> Pic
+SET_TRISB       = 36
+SET_TRISC       = 37
+
+# Register name --> the request that sets it, and back
+SET_REGISTER_REQUESTS = {"PORTA" : SET_PORTA, "PORTB" : SET_PORTB, "PORTC" : SET_PORTC,
+                         "TRISA" : SET_TRISA, "TRISB" : SET_TRISB, "TRISC" : SET_TRISC}
+REGISTER_NAMES = dict([(request, name) for name, request in SET_REGISTER_REQUESTS.items()])
+
+# Reply sizes (bytes)
+DEBUG_MSG_LENGTH = 8
+REGISTERS_LENGTH = 6
+LED_LENGTH       = 1
+STATUS_ALL_LENGTH = DEBUG_MSG_LENGTH + REGISTERS_LENGTH + LED_LENGTH
+
+VENDOR_DATA_SIZE = 64   # Longest reply the firmware can send (VENDOR_DATA_SIZE in main.h)
+
+EEPROM_SIZE      = 256
+EEPROM_BLOCK_SIZE = VENDOR_DATA_SIZE    # Most bytes one GET_EEPROM_BLOCK returns
+EEPROM_WRITE_BLOCK_SIZE = 16            # Most bytes per SET_EEPROM_BLOCK: each takes ~4 ms to write, and the dll times out at 100 ms
+
+# Streaming (bulk EP1 IN). Each packet holds up to 16 samples of: seq, ADRESH, ADRESL, PORTA
+STREAM_ENDPOINT     = 0x81
+STREAM_PACKET_SIZE  = 64
+STREAM_SAMPLE_SIZE  = 4
+STREAM_PERIOD_UNIT  = 100e-6    # Seconds per unit of the START_STREAM period
+
+
+# Reply layouts, for struct's unpack_from(buffer)
+DEBUG_MSG_STRUCT  = struct.Struct("<8B")                # dm0..dm7
+REGISTERS_STRUCT  = struct.Struct("<6B")                # PORTA, PORTB, PORTC, TRISA, TRISB, TRISC
+LED_STRUCT        = struct.Struct("<B")
+STATUS_ALL_STRUCT = struct.Struct("<8B6BB")             # dm0..dm7, PORTA..TRISC, LED
+
+# BYTES_STRUCTS[n] unpacks n bytes as n ints (for replies of any length, e.g. eeprom blocks)
+BYTES_STRUCTS = [struct.Struct("<%dB" % n) for n in range(VENDOR_DATA_SIZE + 1)]
+
+
+# One poll of the PIC: its PORT/TRIS registers, the 8 debug_message bytes and the debug LED.
+# timestamp is taken from pollScheduler.clock() (monotonic seconds) just before the poll
+PicStatus = namedtuple('PicStatus', 'timestamp PORTA PORTB PORTC TRISA TRISB TRISC debug_message led')
+
+
+# Builds a PicStatus from a GET_STATUS_ALL reply (dm0..dm7, PORTA/B/C, TRISA/B/C, LED): a transfer buffer,
+# or anything else with the buffer interface. Lists of ints work too
+def decode_status_all(data, timestamp):
+    if isinstance(data, list):
+        data = bytearray(data)
+    v = STATUS_ALL_STRUCT.unpack_from(data)
+    return PicStatus(timestamp, v[8], v[9], v[10], v[11], v[12], v[13], v[0:8], v[14])
@@ -0,0 +1,214 @@
+"""
+PIC Simulator - an in-process stand-in for the PIC, for running the host code with no board attached.
+
+SimulatedPic answers vendor requests the way ProcessVendorRequest in main.c
+does, including its quirks: GET_EEPROM hands out the next 8 bytes from a
+firmware-side eeprom_return_index, and SET_USB_MSG1 writes one byte to an
+eeprom_write_to address that wraps after 4. The main loop's effect on the
+registers (blinking/fading LEDs on RA1/RA2, TMR0 in debug_message[4..5]) is
+computed from the clock, and the ADC on AN0 reads from adc_source(t).
+
+With legacy = True it answers like the original firmware instead: it knows
+none of the newer requests (GET_STATUS_ALL, streaming, eeprom blocks), and
+answers any request it doesn't know with 0 bytes rather than stalling.
+"""
+
+import math
+
+from picProtocol import *
+from pollScheduler import clock
+
+
+# Default signal on the potentiometer pin: a slow 10-bit sine
+def sine_source(t):
+    return int(512 + 300 * math.sin(2 * math.pi * t))
+
+
+# Requests the original firmware didn't have
+NEWER_REQUESTS = (GET_STATUS_ALL, START_STREAM, STOP_STREAM, GET_EEPROM_BLOCK, SET_EEPROM_BLOCK)
+
+
+class SimulatedPic:
+
+    TMR0_TICK = 64 / 6e6                # Timer0: Fosc/4 = 6 MHz, 1:64 prescale (T0CON = 0b10000101)
+    STREAM_RING_SAMPLES = 64            # stream_ring in main.c is 256 bytes = 64 samples
+
+    def __init__(self, adc_source = sine_source, legacy = False):
+        self.adc_source = adc_source
+        self.legacy = legacy                # Original firmware: see the module docstring
+        self.start_time = clock()
+
+        # Registers, as main() leaves them
+        self.PORTA = 0
+        self.PORTB = 0
+        self.PORTC = 0
+        self.TRISA = 0b00000001
+        self.TRISB = 0b00000000
+        self.TRISC = 0b01000000
+
+        self.debug_message = [0] * 8
+        self.led = 0
+        self.blink_value = 127
+        self.light_value = 127
+
+        self.eeprom = [0] * 256             # InitEEPROM() clears it
+        self.eeprom_return_index = 0
+        self.eeprom_write_to = 0
+        self.eeprom_error = 0
+        self.eeprom_writes = 0              # Bytes actually written (each one wears the EEPROM)
+
+        self.streaming = False
+        self.stream_period = None
+        self.stream_seq = 0
+        self.stream_next_time = None        # When the next stream sample is due
+        self.stream_ring = []               # Samples (4-byte bytearrays) waiting to be read
+
+
+    # Seconds since the PIC was 'powered up'
+    def now(self):
+        return clock() - self.start_time
+
+    def adc(self, t):
+        return max(0, min(1023, self.adc_source(t)))
+
+
+    # What the main loop would have done to the registers and debug messages by now
+    def run_main_loop(self):
+        t = self.now()
+        tmr0 = int(t / self.TMR0_TICK) & 0xFFFF
+        tmr0h, tmr0l = tmr0 >> 8, tmr0 & 0xFF
+
+        porta = self.PORTA & ~0b110
+        if tmr0h < self.blink_value:
+            porta |= 0b010                  # BLINKY_LED (RA1)
+        if tmr0l < self.light_value:
+            porta |= 0b100                  # FADY_LED (RA2)
+        self.PORTA = porta
+
+        self.debug_message[4] = tmr0h
+        self.debug_message[5] = tmr0l
+
+        if self.streaming:
+            self.run_stream(t)
+
+
+    # Takes every stream sample that has come due since the last call. Samples that don't fit in the ring are lost
+    def run_stream(self, t):
+        if self.stream_next_time > t:
+            return
+        due = int((t - self.stream_next_time) / self.stream_period) + 1
+        free = self.STREAM_RING_SAMPLES - 1 - len(self.stream_ring)        # The firmware keeps one slot free
+        for k in range(min(due, free)):
+            adc = self.adc(self.stream_next_time + k * self.stream_period) << 6     # left justified
+            seq = (self.stream_seq + k) & 0xFF
+            self.stream_ring.append(bytearray([seq, adc >> 8, adc & 0xFF, self.PORTA]))
+        self.stream_seq = (self.stream_seq + due) & 0xFF
+        self.stream_next_time += due * self.stream_period
+
+
+    # Answers one vendor request. Returns the reply (a bytearray, possibly empty), or None to stall.
+    # Host-to-device requests with a data stage go to process_vendor_data instead, like in usb_code.c
+    def process_vendor_request(self, request, value, index = 0, length = 0, data = None):
+        self.run_main_loop()
+        value &= 0xFF                       # data_from_usb is the low byte of wValue
+
+        if self.legacy and request in NEWER_REQUESTS:
+            return bytearray()              # Its default: case sent bytes_to_send = 0, and never stalled
+
+        if data:
+            self.process_vendor_data(request, value, bytearray(data[:VENDOR_DATA_SIZE]))
+            return bytearray()
+
+        if request == SET_LED:
+            self.led = 1 if value else 0
+            return bytearray()
+
+        elif request == GET_LED:
+            return bytearray([self.led])
+
+        elif request == GET_DEBUG_MSG:
+            return bytearray(self.debug_message)
+
+        elif request == GET_STATUS_ALL:
+            return bytearray(self.debug_message + self.registers() + [self.led])
+
+        elif request == GET_REGISTERS:
+            return bytearray(self.registers())
+
+        elif request == GET_EEPROM:
+            data = bytearray()
+            for i in range(8):
+                data.append(self.eeprom[self.eeprom_return_index])
+                self.eeprom_return_index = (self.eeprom_return_index + 1) & 0xFF
+            return data
+
+        elif request == GET_EEPROM_BLOCK:
+            return bytearray([self.eeprom[(value + i) & 0xFF] for i in range(VENDOR_DATA_SIZE)])
+
+        elif request == START_STREAM:
+            self.start_stream(value)
+            return bytearray()
+
+        elif request == STOP_STREAM:
+            self.streaming = False
+            return bytearray()
+
+        elif request in REGISTER_NAMES:
+            setattr(self, REGISTER_NAMES[request], value)
+            return bytearray()
+
+        elif request == SET_USB_MSG1:
+            self.eeprom[self.eeprom_write_to] = value
+            self.eeprom_writes += 1
+            self.eeprom_error = 0
+            self.eeprom_write_to += 1
+            if self.eeprom_write_to > 4:
+                self.eeprom_write_to = 0
+            self.led = 1 - self.led
+            self.debug_message[7] = self.eeprom_error
+            return bytearray()
+
+        elif request == SET_USB_MSG2:
+            return bytearray()
+
+        return None                         # Unknown request: stall
+
+
+    # ProcessVendorData in main.c
+    def process_vendor_data(self, request, value, data):
+        if request == SET_EEPROM_BLOCK:
+            for i in range(len(data)):
+                address = (value + i) & 0xFF
+                if self.eeprom[address] != data[i]:         # Bytes that already match aren't rewritten
+                    self.eeprom[address] = data[i]
+                    self.eeprom_writes += 1
+            self.eeprom_error = 0
+            self.debug_message[7] = self.eeprom_error
+
+
+    def registers(self):
+        return [self.PORTA, self.PORTB, self.PORTC, self.TRISA, self.TRISB, self.TRISC]
+
+
+    def start_stream(self, period):
+        self.stream_period = max(period, 1) * STREAM_PERIOD_UNIT
+        self.stream_seq = 0
+        self.stream_ring = []
+        self.stream_next_time = self.now()
+        self.streaming = True
+
+
+    # Time until the next stream sample is due (None if not streaming)
+    def stream_wait_time(self):
+        if not self.streaming:
+            return None
+        return max(0.0, self.stream_next_time - self.now())
+
+
+    # Hands out whole packets of waiting stream samples, up to 'length' bytes
+    def read_stream(self, length):
+        self.run_main_loop()
+        samples = min(len(self.stream_ring), length // STREAM_SAMPLE_SIZE)
+        data = bytearray().join(self.stream_ring[:samples])
+        del self.stream_ring[:samples]
+        return data
@@ -0,0 +1,125 @@
+"""
+Plot Decimation - cuts long sample arrays down to about one point per pixel before plotting.
+
+A plot can't show more than its width in pixels anyway, but dropping samples
+(y[::k]) would also drop spikes. Instead every pixel gets the min and the max
+of the samples under it, so the drawn envelope looks exactly like the full
+data. lttb() (largest triangle three buckets) is there too, for when one
+representative point per bucket looks better than an envelope.
+
+DecimationPyramid precomputes min/max at several zoom levels, so any window
+of a 10-million-sample capture decimates in milliseconds.
+
+Use:
+    x, y = minmax(samples, 1000)            # plot(x, y) looks like plot(samples) on a 1000 pixel wide axes
+    pyramid = DecimationPyramid(capture["adc"])
+    x, y = pyramid.query(start, stop, 1000)
+"""
+
+import numpy
+
+
+# Min and max of each of 'buckets' equal slices of y, as 2*buckets points (min then max) ready to plot.
+# x is the index (plus 'start') of each bucket's first sample. Short arrays come back as they are
+def minmax(y, buckets, start = 0):
+    y = numpy.asarray(y)
+    n = len(y)
+    buckets = int(buckets)
+    if n <= 2 * buckets:
+        return numpy.arange(start, start + n), y
+
+    edges = (numpy.arange(buckets) * n) // buckets
+    points = numpy.empty(2 * buckets, y.dtype)
+    points[0::2] = numpy.minimum.reduceat(y, edges)
+    points[1::2] = numpy.maximum.reduceat(y, edges)
+    return numpy.repeat(edges + start, 2), points
+
+
+# Largest triangle three buckets: keeps the first and last points, and from each bucket in between the
+# point that makes the largest triangle with the point kept before it and the average of the next bucket
+def lttb(y, threshold, x = None):
+    y = numpy.asarray(y, numpy.float64)
+    n = len(y)
+    if x is None:
+        x = numpy.arange(n, dtype = numpy.float64)
+    else:
+        x = numpy.asarray(x, numpy.float64)
+    threshold = int(threshold)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    edges = numpy.floor(numpy.arange(threshold - 1) * ((n - 2) / float(threshold - 2))).astype(numpy.int64) + 1
+    edges[-1] = n - 1
+    keep = numpy.empty(threshold, numpy.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = numpy.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+
+    return x[keep], y[keep]
+
+
+class DecimationPyramid:
+
+    BASE = 64                   # Samples per bucket at the finest level
+    FACTOR = 8                  # Each level's buckets are this many of the previous level's
+    MIN_BUCKETS = 512           # Coarser levels are added until one has fewer than FACTOR times this many buckets
+
+    def __init__(self, y):
+        self.y = y
+        self.sizes = []         # Samples per bucket at each level
+        self.mins = []
+        self.maxs = []
+
+        if len(y) >= self.BASE:
+            self.add_level(self.BASE, y, y, self.BASE)
+        while self.sizes and len(self.mins[-1]) >= self.FACTOR * self.MIN_BUCKETS:
+            self.add_level(self.sizes[-1] * self.FACTOR, self.mins[-1], self.maxs[-1], self.FACTOR)
+
+    # Adds a level of 'size' samples per bucket, made from every 'step' buckets of mins/maxs
+    def add_level(self, size, mins, maxs, step):
+        edges = numpy.arange(0, len(mins), step)
+        self.sizes.append(size)
+        self.mins.append(numpy.minimum.reduceat(mins, edges))
+        self.maxs.append(numpy.maximum.reduceat(maxs, edges))
+
+    def __len__(self):
+        return len(self.y)
+
+
+    # Like minmax(y[start:stop], pixels, start), from the coarsest level that still has a bucket per pixel.
+    # Buckets at the ends of the window may reach a little past start and stop
+    def query(self, start, stop, pixels):
+        start = max(0, int(start))
+        stop = min(len(self.y), int(stop))
+        pixels = int(pixels)
+        n = stop - start
+        if n <= 0:
+            return numpy.arange(0), self.y[0:0]
+
+        level = None
+        for i in range(len(self.sizes)):
+            if self.sizes[i] * pixels <= n:
+                level = i
+        if level is None:                               # Zoomed in past the finest level: use the samples
+            return minmax(self.y[start:stop], pixels, start)
+
+        size = self.sizes[level]
+        first, last = start // size, -(-stop // size)
+        mins = self.mins[level][first:last]
+        maxs = self.maxs[level][first:last]
+
+        m = len(mins)
+        edges = (numpy.arange(pixels) * m) // pixels
+        points = numpy.empty(2 * pixels, mins.dtype)
+        points[0::2] = numpy.minimum.reduceat(mins, edges)
+        points[1::2] = numpy.maximum.reduceat(maxs, edges)
+        return numpy.repeat((first + edges) * size, 2), points
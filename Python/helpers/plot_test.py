@@ -1,10 +1,12 @@
 import sys, os, random, thread
 from PyQt4 import QtGui, QtCore
 
-from numpy import arange, sin, pi
+from numpy import arange, sin, pi, array
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
+import plotDecimation
+
 progname = os.path.basename(sys.argv[0])
 progversion = "0.1"
 
@@ -54,7 +56,7 @@ class DynamicCanvas(MyMplCanvas):
         MyMplCanvas.__init__(self, *args, **kwargs)
         timer = QtCore.QTimer(self)
         QtCore.QObject.connect(timer, QtCore.SIGNAL("timeout()"), self.update_figure)
-        timer.start(.001)
+        timer.start(1000 / 30)             # 30 fps; more can't be seen anyway
         
         #thread.start_new_thread(self.change_data, ())
         
@@ -66,7 +68,8 @@ class DynamicCanvas(MyMplCanvas):
         # Build a list of 4 random integers between 0 and 10 (both inclusive)
         l = [ random.randint(0, 10) for i in xrange(4) ]
         
-        self.sub_figure.plot(range(len(self.data)), self.data, 'r')
+        x, y = plotDecimation.minmax(array(self.data), self.sub_figure.bbox.width)     # ~1 point per pixel, spikes kept
+        self.sub_figure.plot(x, y, 'r')
         #self.sub_figure.axis([-10,len(self.data),-10,10])
         self.draw()
         
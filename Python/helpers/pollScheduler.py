@@ -0,0 +1,199 @@
+"""
+Poll Scheduler - paces a polling loop against absolute deadlines on a monotonic clock.
+
+Sleeping a fixed 1/rate after doing the work always runs slower than asked,
+and drifts whenever the USB takes longer to answer. Instead, tick n is due at
+start + n/rate; the scheduler sleeps until that deadline, and when the loop
+falls behind it either catches up (runs the late ticks back to back) or drops
+them, depending on its policy.
+
+Use:
+    scheduler = DeadlineScheduler(500)
+    while running:
+        scheduler.wait()
+        poll()
+    print(scheduler.stats.summary())
+"""
+
+import os
+import sys
+import time
+import math
+import threading
+from collections import deque
+
+
+# Python 2 elsewhere has no monotonic clock in time: CLOCK_MONOTONIC through ctypes on Linux, else the
+# elapsed time os.times() counts in clock ticks (monotonic, but only ~10ms resolution)
+def posix_monotonic_clock():
+    if sys.platform.startswith('linux'):
+        try:
+            import ctypes
+            import ctypes.util
+
+            class timespec(ctypes.Structure):
+                _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+            CLOCK_MONOTONIC = 1
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+            clock_gettime = libc.clock_gettime
+            clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+            now = timespec()
+
+            def monotonic():
+                if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(now)) != 0:
+                    raise OSError(ctypes.get_errno(), "clock_gettime(CLOCK_MONOTONIC) failed")
+                return now.tv_sec + now.tv_nsec * 1e-9
+
+            monotonic()
+            return monotonic
+        except (OSError, AttributeError):
+            pass
+    return lambda: os.times()[4]
+
+
+# Monotonic, high resolution clock (seconds)
+if hasattr(time, 'perf_counter'):
+    clock = time.perf_counter
+elif sys.platform == 'win32':
+    clock = time.clock                  # Python 2 on Windows: QueryPerformanceCounter, microsecond resolution
+else:
+    clock = posix_monotonic_clock()
+
+
+# What to do with ticks whose deadline has already passed
+CATCH_UP    = 'catch-up'        # Run them back to back until the loop is on schedule again
+DROP        = 'drop'            # Skip them and carry on at the next deadline still in the future
+POLICIES    = (CATCH_UP, DROP)
+
+
+class RateStats:
+
+    WINDOW = 4096                       # How many recent ticks the percentiles are computed over
+
+    def __init__(self, rate):
+        self.lock = threading.Lock()
+        self.reset(rate)
+
+    def reset(self, rate):
+        self.lock.acquire()
+        try:
+            self.rate = rate
+            self.ticks = 0              # Ticks run
+            self.missed = 0             # Ticks whose deadline had already passed when the loop got to them
+            self.dropped = 0            # Ticks skipped by the DROP policy (or when catching up was given up)
+            self.lateness = deque(maxlen = self.WINDOW)     # Seconds each tick started after its deadline
+            self.start_time = None
+            self.last_time = None
+        finally:
+            self.lock.release()
+
+    def record(self, deadline, now, missed = False):
+        self.lock.acquire()
+        try:
+            if self.start_time is None:
+                self.start_time = now
+            self.last_time = now
+            self.ticks += 1
+            self.lateness.append(now - deadline)
+            if missed:
+                self.missed += 1
+        finally:
+            self.lock.release()
+
+    def record_dropped(self, n):
+        self.lock.acquire()
+        try:
+            self.dropped += n
+        finally:
+            self.lock.release()
+
+
+    # Average ticks/second since the first tick
+    def achieved_rate(self):
+        if self.ticks < 2 or self.last_time <= self.start_time:
+            return 0.0
+        return (self.ticks - 1) / (self.last_time - self.start_time)
+
+    # Lateness (seconds after the deadline) at each of the given percentiles, over the recent window
+    def jitter_percentiles(self, percentiles = (50, 90, 99, 100)):
+        self.lock.acquire()
+        try:
+            values = sorted(self.lateness)
+        finally:
+            self.lock.release()
+
+        result = {}
+        for p in percentiles:
+            if not values:
+                result[p] = 0.0
+            else:
+                index = min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1)
+                result[p] = values[max(index, 0)]
+        return result
+
+    def summary(self):
+        jitter = self.jitter_percentiles()
+        return ("target %.1f/s, achieved %.1f/s, %d ticks, %d missed, %d dropped, "
+                "jitter p50 %.3fms p90 %.3fms p99 %.3fms max %.3fms" % (
+                self.rate or 0, self.achieved_rate(), self.ticks, self.missed, self.dropped,
+                jitter[50]*1000, jitter[90]*1000, jitter[99]*1000, jitter[100]*1000))
+
+
+class DeadlineScheduler:
+
+    SPIN_TIME = 0.002               # Busy-wait the last few ms before a deadline; sleep() alone is too coarse on Windows
+    MAX_CATCH_UP = 100              # CATCH_UP gives up (and drops) once this many ticks behind
+
+    def __init__(self, rate, policy = DROP):
+        if policy not in POLICIES:
+            raise ValueError("unknown policy %r (expected one of %s)" % (policy, ", ".join(POLICIES)))
+        self.policy = policy
+        self.rate = rate
+        self.stats = RateStats(rate)
+        self.next_deadline = None
+
+
+    # Changes the rate. The schedule restarts from the next tick
+    def set_rate(self, rate):
+        self.rate = rate
+        self.next_deadline = None
+        self.stats.reset(rate)
+
+    def reset(self):
+        self.set_rate(self.rate)
+
+
+    # Blocks until the next tick is due, and returns its deadline (on the clock() timescale)
+    def wait(self):
+        now = clock()
+        if not self.rate:                   # Unpaced: every tick is due immediately
+            self.stats.record(now, now)
+            return now
+
+        period = 1.0/self.rate
+        if self.next_deadline is None:
+            self.next_deadline = now
+
+        deadline = self.next_deadline
+        if deadline - now > period:         # Only if the clock stepped back: start the schedule again from now
+            deadline = now
+        behind = now - deadline             # > 0: the previous tick overran into this one's slot
+        if behind > period:
+            skipped = int(behind / period)
+            if self.policy == DROP or skipped > self.MAX_CATCH_UP:
+                deadline += skipped * period
+                self.stats.record_dropped(skipped)
+
+        self.sleep_until(deadline)
+        self.stats.record(deadline, clock(), behind > 0)
+        self.next_deadline = deadline + period
+        return deadline
+
+
+    def sleep_until(self, deadline):
+        remaining = deadline - clock()
+        if remaining > self.SPIN_TIME:
+            time.sleep(remaining - self.SPIN_TIME)
+        while clock() < deadline:
+            pass
@@ -0,0 +1,106 @@
+"""
+Register Format - text renderings of register bytes, and of whole data log rows, from lookup tables.
+
+Every 8-bit value's binary, hex and decimal text is worked out once, when the
+module is loaded, so formatting a register is one list lookup. Log rows (the
+layout dataLogger.format_output has always written: six padded binary
+registers, the debug bytes, then a H:M:S:cc timestamp) are filled into a
+preallocated template and joined once, and format_rows() does a whole block
+of rows per call, so full-register text logging can stay on at high rates.
+
+A TimestampFormatter caches the H:M:S of the last second it formatted, so
+each thread or writer should have its own (pass it as 'timestamp'); without
+one, each call makes a new one.
+
+Use:
+    BIN[0x2A]                               # "0b101010", like bin()
+    BIN8[0x2A]                              # "0b00101010"
+    line = format_row([PORTA, PORTB, PORTC, TRISA, TRISB, TRISC] + dm, time.time())
+    stamp = TimestampFormatter()
+    text = format_rows(rows, times, stamp)  # many lines at once, each ending in "\n"
+"""
+
+import time
+
+
+BIN     = [bin(i) for i in range(256)]                      # "0b101"
+BIN8    = ["0b" + bin(i)[2:].zfill(8) for i in range(256)]  # "0b00000101"
+HEX     = ["0x%02X" % i for i in range(256)]                # "0x05"
+DEC     = [str(i) for i in range(256)]                      # "5"
+
+# Data log columns, padded to their widths
+REGISTER_WIDTH  = 15
+VALUE_WIDTH     = 8
+TIMESTAMP_WIDTH = 20
+REGISTER_COLUMNS = 6                                        # The first 6 values are registers, shown in binary
+
+BIN8_COLUMN = [text.ljust(REGISTER_WIDTH) for text in BIN8]
+DEC_COLUMN  = [text.ljust(VALUE_WIDTH) for text in DEC]
+
+
+def bin8(value):
+    if 0 <= value < 256:
+        return BIN8[value]
+    return "0b" + bin(value)[2:].zfill(8)                   # Doesn't fit a byte: as wide as it needs
+
+
+class TimestampFormatter:
+
+    def __init__(self):
+        self.second = None
+        self.prefix = ""
+
+    # "hour:minute:second:cc" for a time.time() value, cc being the leading two digits of the microseconds
+    # (what the data logs have always had). The microseconds are rounded the way datetime.fromtimestamp()
+    # rounds them, carrying into the second, so rows match the old format_output digit for digit. The H:M:S
+    # part is only worked out once per second
+    def __call__(self, t):
+        second = int(t)
+        microsecond = int(round((t - second) * 1e6))
+        if microsecond >= 1000000:
+            second += 1
+            microsecond -= 1000000
+        if second != self.second:
+            now = time.localtime(second)
+            self.prefix = "%d:%d:%d:" % (now.tm_hour, now.tm_min, now.tm_sec)
+            self.second = second
+        return (self.prefix + str(microsecond)[0:2]).ljust(TIMESTAMP_WIDTH)
+
+
+# One log row: the registers in binary, the rest in decimal, then the timestamp (time.time() value; default now)
+def format_row(values, t = None, timestamp = None):
+    if t is None:
+        t = time.time()
+    if timestamp is None:
+        timestamp = TimestampFormatter()
+    n = len(values)
+    row = [None] * (n + 1)
+    for i in range(n):
+        value = values[i]
+        if i < REGISTER_COLUMNS:
+            if 0 <= value < 256:
+                row[i] = BIN8_COLUMN[value]
+            else:
+                row[i] = bin8(int(value)).ljust(REGISTER_WIDTH)
+        elif value.__class__ is int and 0 <= value < 256:
+            row[i] = DEC_COLUMN[value]
+        else:
+            row[i] = str(value).ljust(VALUE_WIDTH)
+    row[n] = timestamp(t)
+    return "".join(row)
+
+
+# Many rows of 14 bytes (6 registers + 8 debug bytes) at once, one line each. times are time.time() values,
+# one per row (default: now, for all of them)
+def format_rows(rows, times = None, timestamp = None):
+    if times is None:
+        times = [time.time()] * len(rows)
+    if timestamp is None:
+        timestamp = TimestampFormatter()
+    template = (BIN8_COLUMN,) * REGISTER_COLUMNS + (DEC_COLUMN,) * 8
+    lines = []
+    for values, t in zip(rows, times):
+        lines.append("".join([table[value] for table, value in zip(template, values)]))
+        lines.append(timestamp(t))
+        lines.append("\n")
+    return "".join(lines)
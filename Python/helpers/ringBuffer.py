@@ -0,0 +1,100 @@
+"""
+Ring Buffer - a fixed-capacity NumPy buffer of the most recent samples.
+
+Appending is O(1) and memory is bounded however long the run. Every
+sample is written twice, at i and i + capacity, so the newest n samples are
+always one contiguous slice: latest(n) is a view, never a copy.
+
+Writes and snapshot() hold a lock, so one thread can append (e.g. the
+acquisition engine) while another reads: snapshot(n) copies the newest n
+samples under it and never sees a half-written block. latest(n) is a view
+that the next append may overwrite, so use it only from the writing thread.
+
+Use:
+    ring = RingBuffer(100000)
+    ring.append(1.25)
+    ring.extend(block)                      # whole numpy arrays at once
+    plot.set_data(ring.indices(200), ring.latest(200))
+    x, y = ring.snapshot(200)               # from another thread
+"""
+
+import threading
+
+import numpy
+
+
+class RingBuffer:
+
+    def __init__(self, capacity, dtype = numpy.float64):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.buffer = numpy.zeros(2 * capacity, dtype)
+        self.head = 0               # Where the next sample goes, in [0, capacity)
+        self.count = 0              # Samples appended since the last clear() (including those overwritten)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.head = 0
+            self.count = 0
+        finally:
+            self.lock.release()
+
+
+    def append(self, value):
+        self.lock.acquire()
+        try:
+            self.buffer[self.head] = value
+            self.buffer[self.head + self.capacity] = value
+            self.head += 1
+            if self.head == self.capacity:
+                self.head = 0
+            self.count += 1
+        finally:
+            self.lock.release()
+
+    def extend(self, values):
+        values = numpy.asarray(values, self.buffer.dtype)
+        n = len(values)
+        self.lock.acquire()
+        try:
+            if n >= self.capacity:                  # Only the last 'capacity' can be kept
+                self.count += n - self.capacity
+                values = values[n - self.capacity:]
+                n = self.capacity
+
+            first = min(n, self.capacity - self.head)       # Up to the end of the ring, then wrap
+            for start, part in ((self.head, values[:first]), (0, values[first:])):
+                self.buffer[start:start + len(part)] = part
+                self.buffer[start + self.capacity:start + self.capacity + len(part)] = part
+            self.head = (self.head + n) % self.capacity
+            self.count += n
+        finally:
+            self.lock.release()
+
+
+    # The newest n samples (all of them if n is None), oldest first, as a view
+    def latest(self, n = None):
+        available = len(self)
+        if n is None or n > available:
+            n = available
+        end = self.head + self.capacity
+        return self.buffer[end - n:end]
+
+    # Sample numbers (counting from the first sample ever appended) of latest(n)
+    def indices(self, n = None):
+        n = len(self.latest(n))
+        return numpy.arange(self.count - n, self.count)
+
+    # (indices(n), a copy of latest(n)), taken together under the lock: safe while another thread appends
+    def snapshot(self, n = None):
+        self.lock.acquire()
+        try:
+            return self.indices(n), self.latest(n).copy()
+        finally:
+            self.lock.release()
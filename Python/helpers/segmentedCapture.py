@@ -0,0 +1,346 @@
+"""
+Segmented Capture - long binary captures split into segments that roll over by size or time.
+
+A SegmentedCaptureWriter is a CaptureWriter that writes into a directory:
+
+    manifest.json           start time, rate, fields and compression, and every segment
+                            in order: its file, state (open, sealed, compressed), first
+                            record number, record count, first/last timestamps and sizes
+    segment-00001.pic.gz    one capture each (see captureFile.py), with the same header
+    segment-00002.pic.gz    and timebase, so their timestamps carry on from one to the next
+    segment-00003.pic       the segment being written
+
+A segment is sealed once it reaches segment_size bytes or spans segment_time
+seconds (checked as each block is written, so it overshoots by up to a block,
+see CaptureWriter.BLOCK_SIZE and FLUSH_INTERVAL): it gets an index footer (a timestamp per block) and is fsynced,
+then compressed (zlib = .gz, lzma = .xz) by a worker thread, which swaps the
+compressed file in and updates the manifest. A crash loses at most the block
+being written; every earlier segment is sealed or readable as it stands.
+
+Acquisition never waits on the disk: write() only packs records, and full
+blocks are handed to a disk thread through a queue. If the disk falls behind
+by more than MAX_BACKLOG blocks, new blocks are dropped (and counted in
+'dropped') rather than blocking the poll loop. zlib and lzma release the GIL
+while they compress, so the worker doesn't hold up polling either.
+
+Use:
+    capture = SegmentedCaptureWriter("data/run1", rate = 100, segment_time = 3600, compression = "lzma")
+    engine.subscribe(capture.write)
+    ...
+    capture.close()                         # seals the last segment and waits for its compression
+
+    header, records = read_segments("data/run1")
+"""
+
+import os
+import sys
+import json
+import atexit
+import gzip
+import struct
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue           # Python 2
+
+import captureFile
+from captureFile import CaptureError, ADC_CHANNEL, DEFAULT_SCHEMA
+
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Compression name --> file extension (None = segments are left as they are)
+COMPRESSIONS = {"zlib" : ".gz", "lzma" : ".xz", "none" : None}
+
+TIMESTAMP_STRUCT = struct.Struct("<d")
+COPY_CHUNK = 1024 * 1024
+
+
+# Opens 'filename' for writing, compressed with 'compression' (a name from COMPRESSIONS)
+def open_compressed(filename, compression):
+    if compression == "lzma":
+        import lzma
+        return lzma.open(filename, 'wb')
+    return gzip.open(filename, 'wb', 6)
+
+# Renames src to dst, replacing dst if it exists (os.rename won't on Windows)
+def replace_file(src, dst):
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    else:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def read_manifest(directory):
+    fin = open(os.path.join(directory, MANIFEST))
+    try:
+        return json.load(fin)
+    finally:
+        fin.close()
+
+# Paths of a segmented capture's segments, in order
+def segment_files(directory):
+    return [os.path.join(directory, segment['file']) for segment in read_manifest(directory)['segments']]
+
+# Reads every segment into memory. Returns the first segment's header and one list of record tuples
+def read_segments(directory):
+    header = None
+    records = []
+    for filename in segment_files(directory):
+        segment_header, segment_records = captureFile.read_capture(filename)
+        if header is None:
+            header = segment_header
+        records.extend(segment_records)
+    if header is None:
+        raise CaptureError("%s has no segments" % directory)
+    return header, records
+
+
+# The segment being written. Only used from the disk thread
+class Segment:
+
+    def __init__(self, filename, header, first_record, timestamp_offset, record_size):
+        self.filename = filename
+        self.first_record = first_record                # Records in the segments before this one
+        self.timestamp_offset = timestamp_offset        # Where the timestamp is in a record
+        self.record_size = record_size
+        self.records = 0
+        self.size = len(header)
+        self.index = []                                 # (record number, timestamp) at the start of every block
+        self.first_timestamp = self.last_timestamp = 0.0
+        self.fout = open(filename, 'wb')
+        self.fout.write(header)
+        self.fout.flush()
+
+    def append(self, block):
+        first = TIMESTAMP_STRUCT.unpack_from(block, self.timestamp_offset)[0]
+        if not self.records:
+            self.first_timestamp = first
+        self.index.append((self.records, first))
+        self.last_timestamp = TIMESTAMP_STRUCT.unpack_from(block, len(block) - self.record_size + self.timestamp_offset)[0]
+        self.fout.write(block)
+        self.fout.flush()                               # To the OS, so a crash of this process loses nothing
+        self.records += len(block) // self.record_size
+        self.size += len(block)
+
+    # Writes the index footer and closes the file, once everything is on the disk
+    def seal(self):
+        footer = captureFile.encode_footer(self.records, self.first_timestamp, self.last_timestamp, self.index)
+        self.fout.write(footer)
+        self.size += len(footer)
+        self.fout.flush()
+        os.fsync(self.fout.fileno())
+        self.fout.close()
+
+
+class SegmentedCaptureWriter(captureFile.CaptureWriter):
+
+    SEGMENT_SIZE = 64 * 1024 * 1024     # Default bytes per segment (before compression)
+    SEGMENT_TIME = 3600.0               # Default seconds per segment
+    MAX_BACKLOG = 1024                  # Blocks (~64 MB) waiting for the disk thread before new ones are dropped
+
+    # segment_size / segment_time: roll over at this many bytes / seconds (None = no limit).
+    # compression is a name from COMPRESSIONS. The rest are as for CaptureWriter
+    def __init__(self, directory, rate = None, adc_channel = ADC_CHANNEL, start_clock = None, schema = DEFAULT_SCHEMA,
+                 segment_size = SEGMENT_SIZE, segment_time = SEGMENT_TIME, compression = "zlib"):
+        if compression not in COMPRESSIONS:
+            raise CaptureError("unknown compression %r (expected one of %s)" % (compression, ", ".join(sorted(COMPRESSIONS))))
+        if compression == "lzma":
+            try:
+                import lzma
+            except ImportError:
+                raise CaptureError("lzma compression needs Python 3")
+        self.segment_size = segment_size
+        self.segment_time = segment_time
+        self.compression = compression
+        captureFile.CaptureWriter.__init__(self, directory, rate, adc_channel, start_clock, schema)
+
+
+    # Starts the disk and compression threads, and writes the manifest
+    def start(self, start_time, rate):
+        names = [name for name, code in self.fields]
+        if "timestamp" not in names:
+            raise CaptureError("a segmented capture needs a timestamp field")
+        position = names.index("timestamp")
+        self.timestamp_offset = struct.calcsize("<" + "".join([code for name, code in self.fields[:position]]))
+
+        self.directory = self.filename
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.header = captureFile.encode_header(start_time, self.start_clock, rate, self.adc_channel, self.fields, version = 2)
+        self.dropped = 0                    # Records dropped because the disk fell behind
+        self.dropped_lock = threading.Lock()    # dropped is counted from the acquisition and disk threads
+        self.error = None                   # The first disk error, if any (everything after it is dropped)
+        self.manifest = {'version' : MANIFEST_VERSION, 'start_time' : start_time, 'start_clock' : self.start_clock,
+                         'rate' : rate or 0, 'adc_channel' : list(self.adc_channel),
+                         'fields' : [list(field) for field in self.fields], 'compression' : self.compression,
+                         'segment_size' : self.segment_size, 'segment_time' : self.segment_time,
+                         'records' : 0, 'dropped' : 0, 'closed' : False, 'segments' : []}
+        self.manifest_lock = threading.Lock()
+        self.write_manifest()
+
+        self.blocks = queue.Queue(self.MAX_BACKLOG)             # Packed blocks, then None when closing
+        self.compressions = queue.Queue()                       # Manifest entries of sealed segments, then None
+        self.disk_thread = threading.Thread(target = self.run_disk, name = "CaptureDisk")
+        self.compress_thread = threading.Thread(target = self.run_compress, name = "CaptureCompress")
+        for thread in (self.disk_thread, self.compress_thread):
+            thread.daemon = True
+            thread.start()
+
+
+    # Hands the buffered records to the disk thread. Never blocks
+    def flush(self):
+        if self.block:
+            try:
+                self.blocks.put_nowait(self.block)
+            except queue.Full:
+                self.count_dropped(self.block)
+            self.block = bytearray()
+        self.last_flush = captureFile.clock()
+
+    # Segments are fsynced as they are sealed
+    def sync(self):
+        self.flush()
+
+    def count_dropped(self, block):
+        self.dropped_lock.acquire()
+        try:
+            self.dropped += len(block) // self.record.size
+        finally:
+            self.dropped_lock.release()
+
+    # Seals the last segment. With wait, also waits for it to be written and compressed; without, that carries on
+    # in the background, and the program waits for it when exiting (the threads are daemons, so they'd otherwise
+    # be killed with the last segment unwritten)
+    def close(self, wait = True):
+        if self.disk_thread is None:
+            return
+        self.flush()
+        self.blocks.put(None)
+        for thread in (self.disk_thread, self.compress_thread):
+            if wait:
+                thread.join()
+            else:
+                atexit.register(thread.join)
+        self.disk_thread = self.compress_thread = None
+
+
+    # ===== Manifest ===== #
+
+    # Writes the manifest to a temporary file and swaps it in, so there's always a whole one on the disk
+    def write_manifest(self):
+        self.manifest_lock.acquire()
+        try:
+            filename = os.path.join(self.directory, MANIFEST)
+            fout = open(filename + ".tmp", 'w')
+            json.dump(self.manifest, fout, indent = 1, sort_keys = True)
+            fout.flush()
+            os.fsync(fout.fileno())
+            fout.close()
+            replace_file(filename + ".tmp", filename)
+        finally:
+            self.manifest_lock.release()
+
+    # Updates a segment's entry (None = the manifest itself) and rewrites the manifest
+    def update_manifest(self, entry, values):
+        self.manifest_lock.acquire()
+        try:
+            (entry is None and self.manifest or entry).update(values)
+        finally:
+            self.manifest_lock.release()
+        self.write_manifest()
+
+
+    # ===== Disk thread ===== #
+
+    def open_segment(self, first_record):
+        number = len(self.manifest['segments']) + 1
+        name = "segment-%05d.pic" % number
+        segment = Segment(os.path.join(self.directory, name), self.header, first_record,
+                          self.timestamp_offset, self.record.size)
+        segment.entry = {'number' : number, 'file' : name, 'state' : "open", 'first_record' : first_record}
+        self.manifest_lock.acquire()
+        try:
+            self.manifest['segments'].append(segment.entry)
+        finally:
+            self.manifest_lock.release()
+        self.write_manifest()
+        return segment
+
+    def seal_segment(self, segment):
+        segment.seal()
+        self.manifest_lock.acquire()
+        try:
+            segment.entry.update({'state' : "sealed", 'records' : segment.records, 'bytes' : segment.size,
+                                  'first_timestamp' : segment.first_timestamp, 'last_timestamp' : segment.last_timestamp})
+            self.manifest['records'] = segment.first_record + segment.records
+        finally:
+            self.manifest_lock.release()
+        self.write_manifest()
+        if COMPRESSIONS[self.compression] is not None:
+            self.compressions.put(segment.entry)
+
+    def run_disk(self):
+        segment = None
+        records = 0
+        try:
+            while True:
+                block = self.blocks.get()
+                if block is None:
+                    break
+                if segment is None:
+                    segment = self.open_segment(records)
+                segment.append(block)
+                records = segment.first_record + segment.records
+                if (self.segment_size is not None and segment.size >= self.segment_size) or \
+                   (self.segment_time is not None and segment.last_timestamp - segment.first_timestamp >= self.segment_time):
+                    self.seal_segment(segment)
+                    segment = None
+            if segment is not None:
+                self.seal_segment(segment)
+        except EnvironmentError as e:                           # Disk full, directory gone, ...
+            self.error = e
+            sys.stderr.write("capture %s stopped: %s\n" % (self.directory, e))
+            while block is not None:                            # Keep draining, so acquisition never blocks
+                block = self.blocks.get()
+                if block is not None:
+                    self.count_dropped(block)
+        self.compressions.put(None)
+
+
+    # ===== Compression thread ===== #
+
+    # Compresses a sealed segment next to it, then swaps it in for the original
+    def compress(self, entry):
+        raw = os.path.join(self.directory, entry['file'])
+        name = entry['file'] + COMPRESSIONS[self.compression]
+        compressed = os.path.join(self.directory, name)
+        fin = open(raw, 'rb')
+        fout = open_compressed(compressed + ".part", self.compression)
+        try:
+            data = fin.read(COPY_CHUNK)
+            while data:
+                fout.write(data)
+                data = fin.read(COPY_CHUNK)
+        finally:
+            fin.close()
+            fout.close()
+        replace_file(compressed + ".part", compressed)
+        self.update_manifest(entry, {'file' : name, 'state' : "compressed",
+                                     'stored_bytes' : os.path.getsize(compressed)})
+        os.remove(raw)                  # Only once the manifest points at the compressed copy
+
+    def run_compress(self):
+        while True:
+            entry = self.compressions.get()
+            if entry is None:
+                self.update_manifest(None, {'closed' : True, 'dropped' : self.dropped})
+                break
+            try:
+                self.compress(entry)
+            except EnvironmentError as e:                       # The sealed segment is kept as it is
+                sys.stderr.write("unable to compress %s: %s\n" % (entry['file'], e))
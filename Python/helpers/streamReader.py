@@ -0,0 +1,129 @@
+"""
+Stream Reader - drains the PIC's bulk sample stream (EP1 IN) instead of polling it.
+
+In streaming mode the PIC samples the ADC on its own clock into a ring buffer,
+and each bulk packet carries up to 16 samples of 4 bytes: seq, ADRESH, ADRESL,
+PORTA. seq is an 8-bit counter, so gaps in it show samples the PIC had to drop
+because the host was not reading fast enough.
+
+Use:
+    reader = StreamReader(device)
+    reader.subscribe(my_callback)           # my_callback(block) gets numpy arrays of BLOCK_DTYPE
+    reader.start(rate = 5000)
+    ...
+    reader.stop()
+"""
+
+import threading
+import ctypes
+import time
+
+import numpy
+
+from picProtocol import STREAM_ENDPOINT, STREAM_PACKET_SIZE, STREAM_SAMPLE_SIZE
+from acquisitionEngine import Publisher
+import ConversionFunctions
+
+
+# One sample as it comes over the wire
+PACKET_DTYPE = numpy.dtype([('seq', 'u1'), ('adc_high', 'u1'), ('adc_low', 'u1'), ('PORTA', 'u1')])
+
+# One decoded sample: its position in the stream (counting lost samples), the 10-bit ADC count and PORTA
+BLOCK_DTYPE = numpy.dtype([('index', '<u8'), ('adc', '<u2'), ('PORTA', 'u1')])
+
+
+class StreamDecoder:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.next_index = 0             # Index the next sample should have
+        self.next_seq = None            # seq the next sample should have (None = nothing received yet)
+        self.samples = 0                # Samples received
+        self.lost = 0                   # Samples the PIC dropped (gaps in seq)
+
+
+    # Decodes the bytes of one or more packets into an array of BLOCK_DTYPE
+    def decode(self, data):
+        n = len(data) // STREAM_SAMPLE_SIZE
+        raw = numpy.frombuffer(data, PACKET_DTYPE, n)
+        block = numpy.empty(n, BLOCK_DTYPE)
+        if n == 0:
+            return block
+
+        # Unwrap the 8-bit seq: every step is 1 + the number of samples lost in between
+        seq = raw['seq'].astype(numpy.int64)
+        steps = numpy.empty(n, numpy.int64)
+        if self.next_seq is None:
+            steps[0] = 0
+        else:
+            steps[0] = (seq[0] - self.next_seq) % 256
+        steps[1:] = (numpy.diff(seq) - 1) % 256 + 1
+        index = self.next_index + numpy.cumsum(steps)
+
+        block['index'] = index
+        block['adc'] = ConversionFunctions.convertBlock(raw['adc_high'], raw['adc_low'], ConversionFunctions.LEFT_JUSTIFIED)
+        block['PORTA'] = raw['PORTA']
+
+        self.lost += int(index[-1] - self.next_index) - (n - 1)
+        self.samples += n
+        self.next_index = int(index[-1]) + 1
+        self.next_seq = (int(seq[-1]) + 1) % 256
+        return block
+
+
+class StreamReader(Publisher):
+
+    READ_SIZE = 8 * STREAM_PACKET_SIZE      # Bytes asked for per bulk read; the PIC ends early with a short packet
+    TIMEOUT = 100                           # ms
+    ERROR_BACKOFF = 0.1                     # Seconds to wait after a failed read (e.g. board unplugged)
+
+    def __init__(self, device):
+        Publisher.__init__(self)
+        self.device = device                # picDevice.PicDevice (needs bulk_read, start_stream, stop_stream)
+        self.decoder = StreamDecoder()
+        self.buffer = ctypes.c_buffer(self.READ_SIZE)
+        self.thread = None
+        self.running = False
+        self.period = None                  # Sample period the PIC is actually using (seconds)
+        self.error_count = 0
+
+
+    # Reads whatever the PIC has ready (up to READ_SIZE bytes) and returns it decoded. May be empty
+    def read_block(self):
+        count = self.device.bulk_read(STREAM_ENDPOINT, self.buffer, self.TIMEOUT)
+        count -= count % STREAM_SAMPLE_SIZE
+        return self.decoder.decode(memoryview(self.buffer)[:count])         # Decoded straight from the buffer
+
+
+    def start(self, rate):
+        if self.running:
+            return
+        self.decoder.reset()
+        self.period = self.device.start_stream(1.0/rate)
+        self.running = True
+        self.thread = threading.Thread(target = self.run, name = "StreamReader")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout = None):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.currentThread():
+            self.thread.join(timeout)
+        self.thread = None
+        if self.device.is_open():
+            self.device.stop_stream()
+
+
+    def run(self):
+        while self.running:
+            try:
+                block = self.read_block()
+            except Exception as e:
+                self.error_count += 1
+                print("stream read failed: %s" % e)
+                time.sleep(self.ERROR_BACKOFF)
+                continue
+            if len(block):
+                self.publish(block)
@@ -0,0 +1,71 @@
+"""
+Tests of PicDevice's status polls against the simulated PIC: GET_STATUS_ALL on
+newer firmware, and the fallback to the three separate requests on firmware
+without it.
+
+Run from this directory: python -m unittest test_picDevice
+"""
+
+import unittest
+
+import picDevice
+import picSimulator
+import usbTransport
+from picProtocol import GET_STATUS_ALL
+
+
+def open_device(pic, transport = usbTransport.SimulatedTransport):
+    device = picDevice.PicDevice(transport(pic))
+    device.open()
+    return device
+
+
+# A simulated transport that fails GET_STATUS_ALL with 'ret', the first 'times' times it is asked
+class FailingTransport(usbTransport.SimulatedTransport):
+
+    def __init__(self, pic, ret, times = 1):
+        usbTransport.SimulatedTransport.__init__(self, pic)
+        self.ret = ret
+        self.times = times
+
+    def control_transfer(self, bmRequestType, bRequest, wValue, wIndex, wLength, buffer):
+        if bRequest == GET_STATUS_ALL and self.times:
+            self.times -= 1
+            return self.ret
+        return usbTransport.SimulatedTransport.control_transfer(self, bmRequestType, bRequest, wValue, wIndex,
+                                                                 wLength, buffer)
+
+
+class StatusFallbackTest(unittest.TestCase):
+
+    def test_newer_firmware_uses_status_all(self):
+        device = open_device(picSimulator.SimulatedPic())
+        status = device.get_status()
+        self.assertEqual(device.status_all_supported, True)
+        self.assertEqual(status.TRISC, 0b01000000)
+
+    # The original firmware answers requests it doesn't know with 0 bytes instead of stalling
+    def test_original_firmware_answering_nothing_falls_back(self):
+        device = open_device(picSimulator.SimulatedPic(legacy = True))
+        status = device.get_status()
+        self.assertEqual(device.status_all_supported, False)
+        self.assertEqual(status.TRISC, 0b01000000)
+        self.assertEqual(len(status.debug_message), 8)
+        device.get_status()
+        self.assertEqual(device.stats.requests[GET_STATUS_ALL].calls(), 1)      # Not asked again
+
+    def test_stall_falls_back(self):
+        device = open_device(picSimulator.SimulatedPic(), lambda pic: FailingTransport(pic, usbTransport.ERROR_STALL))
+        device.get_status()
+        self.assertEqual(device.status_all_supported, False)
+
+    def test_other_errors_are_raised_and_retried(self):
+        device = open_device(picSimulator.SimulatedPic(), lambda pic: FailingTransport(pic, -116))     # Timeout
+        self.assertRaises(picDevice.PicUsbError, device.get_status)
+        self.assertEqual(device.status_all_supported, None)
+        device.get_status()
+        self.assertEqual(device.status_all_supported, True)
+
+
+if __name__ == "__main__":
+    unittest.main()
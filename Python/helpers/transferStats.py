@@ -0,0 +1,202 @@
+"""
+Transfer Stats - counts and times every USB transfer PicDevice makes, per vendor request.
+
+For each request: calls, failures (stalls counted separately), bytes moved,
+and a latency histogram. The histogram is log-linear like HdrHistogram: 32
+buckets per power of two, so any latency from a microsecond to minutes is
+kept to within about 3% in a fixed list of counters. Recording is a few
+integer operations and no allocation (under a microsecond on CPython 3).
+
+Shows which request is eating the poll budget: summary() sorts requests by
+the total time spent in them.
+
+Use:
+    device.stats.summary()                  # every PicDevice has one
+    device.stats.snapshot()["GET_STATUS_ALL"]["p99"]
+    dumper = StatsDumper(device.stats, 10)  # print a summary every 10 s
+    dumper.start()
+"""
+
+import sys
+import threading
+
+import picProtocol
+import usbTransport
+
+
+# Request number --> name, for every request in picProtocol
+REQUEST_NAMES = dict([(getattr(picProtocol, name), name) for name in dir(picProtocol)
+                      if name.startswith(("GET_", "SET_", "START_", "STOP_")) and isinstance(getattr(picProtocol, name), int)])
+REQUEST_NAMES[picProtocol.SET_CONFIGURATION] = "SET_CONFIGURATION"
+
+STALL_CODES = (usbTransport.ERROR_STALL, usbTransport.LibusbTransport.LIBUSB_ERROR_PIPE)
+
+
+# Latency histogram buckets: values below 2**SUB_BITS ns get a bucket each, and every power of two above
+# that is split into 2**(SUB_BITS-1) buckets. TransferStats.record() has this inlined, for speed
+SUB_BITS = 6
+BUCKETS = (64 - SUB_BITS + 2) << (SUB_BITS - 1)         # Room for any 64-bit number of ns
+
+def bucket(ns):
+    shift = ns.bit_length() - SUB_BITS
+    if shift > 0:
+        return (shift << (SUB_BITS - 1)) + (ns >> shift)
+    return ns
+
+# Smallest value (ns) that falls in bucket i
+def bucket_value(i):
+    if i < 1 << SUB_BITS:
+        return i
+    shift = (i >> (SUB_BITS - 1)) - 1
+    return (i - (shift << (SUB_BITS - 1))) << shift
+
+
+class RequestStats:
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * BUCKETS     # Latency histogram (see bucket()). Calls = sum(counts)
+        self.total = 0                  # ns spent in this request
+        self.failures = 0               # Transfers that returned an error (stalls included)
+        self.stalls = 0
+        self.bytes = 0
+
+    def calls(self):
+        return sum(self.counts)
+
+    # Latency (seconds) that p percent of the calls took no longer than (to the top of its bucket)
+    def percentile(self, p):
+        calls = self.calls()
+        if not calls:
+            return 0.0
+        target = max(1, int(p / 100.0 * calls + 0.5))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return bucket_value(i + 1) * 1e-9
+        return 0.0
+
+    def mean(self):
+        calls = self.calls()
+        return calls and self.total * 1e-9 / calls or 0.0
+
+
+class TransferStats:
+
+    def __init__(self):
+        self.requests = {}              # Request number (or "bulk 0x81") --> RequestStats
+        self.lock = threading.Lock()    # Only for adding requests and snapshots; record() relies on its caller's lock
+        self.opens = 0                  # Successful opens
+        self.reconnects = 0             # Opens after the first
+        self.open_failures = 0
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            for stats in self.requests.values():
+                stats.reset()
+            self.opens = self.reconnects = self.open_failures = 0
+        finally:
+            self.lock.release()
+
+
+    def add(self, request):
+        self.lock.acquire()
+        try:
+            if request not in self.requests:
+                self.requests[request] = RequestStats(REQUEST_NAMES.get(request, str(request)))
+            return self.requests[request]
+        finally:
+            self.lock.release()
+
+    # One transfer of 'request' that took 'elapsed' seconds and returned ret (# bytes, or < 0 on error)
+    def record(self, request, elapsed, ret):
+        stats = self.requests.get(request)
+        if stats is None:
+            stats = self.add(request)
+        ns = int(elapsed * 1e9)
+        shift = ns.bit_length() - 6                     # bucket(ns), inlined
+        if shift > 0:
+            stats.counts[(shift << 5) + (ns >> shift)] += 1
+        else:
+            stats.counts[ns] += 1
+        stats.total += ns
+        if ret < 0:
+            stats.failures += 1
+            if ret in STALL_CODES:
+                stats.stalls += 1
+        else:
+            stats.bytes += ret
+
+    def record_open(self, success):
+        if not success:
+            self.open_failures += 1
+            return
+        if self.opens:
+            self.reconnects += 1
+        self.opens += 1
+
+
+    # name --> {calls, failures, stalls, bytes, time, mean, p50, p90, p99, p100} (times in seconds)
+    def snapshot(self):
+        self.lock.acquire()
+        try:
+            requests = list(self.requests.values())
+        finally:
+            self.lock.release()
+
+        result = {}
+        for stats in requests:
+            result[stats.name] = {'calls' : stats.calls(), 'failures' : stats.failures, 'stalls' : stats.stalls,
+                                  'bytes' : stats.bytes, 'time' : stats.total * 1e-9, 'mean' : stats.mean(),
+                                  'p50' : stats.percentile(50), 'p90' : stats.percentile(90),
+                                  'p99' : stats.percentile(99), 'p100' : stats.percentile(100)}
+        return result
+
+    # One line per request, the ones taking the most time first
+    def summary(self):
+        snapshot = self.snapshot()
+        total = sum([s['time'] for s in snapshot.values()]) or 1.0
+        lines = ["%-18s %8s %6s %6s %9s %6s %9s %9s %9s %9s" % ("request", "calls", "fail", "stall", "bytes", "time%",
+                                                                 "p50 ms", "p90 ms", "p99 ms", "max ms")]
+        for name, s in sorted(snapshot.items(), key = lambda item: -item[1]['time']):
+            lines.append("%-18s %8d %6d %6d %9d %5.1f%% %9.3f %9.3f %9.3f %9.3f" % (name, s['calls'], s['failures'],
+                         s['stalls'], s['bytes'], s['time'] / total * 100, s['p50'] * 1000, s['p90'] * 1000,
+                         s['p99'] * 1000, s['p100'] * 1000))
+        lines.append("%d opens, %d reconnects, %d failed opens" % (self.opens, self.reconnects, self.open_failures))
+        return "\n".join(lines)
+
+
+# Writes stats.summary() to fout every 'interval' seconds, from its own thread
+class StatsDumper:
+
+    def __init__(self, stats, interval = 10.0, fout = None):
+        self.stats = stats
+        self.interval = interval
+        self.fout = fout or sys.stderr
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target = self.run, name = "StatsDumper")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def dump(self):
+        self.fout.write(self.stats.summary() + "\n\n")
+        self.fout.flush()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
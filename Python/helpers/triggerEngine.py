@@ -0,0 +1,368 @@
+"""
+Trigger Engine - oscilloscope-style triggering on a stream of PIC statuses.
+
+Instead of logging every poll, a TriggerEngine watches one signal (the ADC
+voltage, a register, a debug byte or a single register bit) and only hands
+on the windows around the moments a trigger condition fires:
+
+    EdgeTrigger         the signal crosses a level (rising, falling or either way)
+    LevelTrigger        the signal is above (or below) a level
+    WindowTrigger       the signal leaves (or enters) the band between two levels
+    PulseWidthTrigger   a high (or low) pulse ends whose width is in a range
+                        (e.g. shorter than 1 ms, for glitches)
+
+Crossings go through a Schmitt trigger: with a hysteresis h, a signal has to
+get h past the level before it counts as having crossed back, so noise on a
+slow edge fires once, not a burst of times.
+
+The last 'pre' statuses (the one that fired included) are always kept in a
+ring buffer. When the trigger fires, they and the next 'post' statuses make
+one TriggerWindow, published to the subscribers once complete. Triggers are
+ignored while a window is being filled and for 'holdoff' seconds after the
+one that started it. In SINGLE mode the engine stops after the first window.
+Only the windows need to be saved (WindowWriter), so a board can be left for
+days waiting for a rare glitch without logging every poll.
+
+Use:
+    trigger = TriggerEngine(EdgeTrigger(1.2, RISING, hysteresis = 0.05), signal("voltage"), pre = 200, post = 800)
+    writer = WindowWriter("glitches")       # each window becomes glitches/trigger-00001.pic, ...
+    trigger.subscribe(writer.write)
+    engine.subscribe(trigger.process)
+    ...
+    writer.close()
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import deque, namedtuple
+try:
+    import queue
+except ImportError:
+    import Queue as queue           # Python 2
+
+import captureFile
+from acquisitionEngine import Publisher
+from pollScheduler import clock
+
+
+# Edge directions
+RISING  = 'rising'
+FALLING = 'falling'
+EITHER  = 'either'
+SLOPES  = (RISING, FALLING, EITHER)
+
+# Trigger modes
+NORMAL  = 'normal'              # Re-arm after every window
+SINGLE  = 'single'              # Stop after the first window
+MODES   = (NORMAL, SINGLE)
+
+REGISTERS = ("PORTA", "PORTB", "PORTC", "TRISA", "TRISB", "TRISC")
+
+# trigger_index: where the status that fired is in statuses. number counts from 1
+TriggerWindow = namedtuple('TriggerWindow', 'number trigger_time trigger_index statuses')
+
+
+# ===== Signals: status --> value ===== #
+
+# The ADC voltage, worked out from the debug bytes the way the GUI's data log does
+def adc_voltage(adc_channel = captureFile.ADC_CHANNEL):
+    import ConversionFunctions
+    high, low = adc_channel
+    return lambda status: ConversionFunctions.adcToVoltage((status.debug_message[high] << 8) + status.debug_message[low])
+
+def adc_counts(adc_channel = captureFile.ADC_CHANNEL):
+    high, low = adc_channel
+    return lambda status: (status.debug_message[high] << 8) + status.debug_message[low]
+
+# One bit (0-7) of a register, as 0 or 1
+def register_bit(register, bit):
+    return lambda status: (getattr(status, register) >> bit) & 1
+
+# A signal by name: "voltage", "adc", "led", a register ("PORTB") or debug byte ("dm5"), or one bit of either
+# ("PORTB.3", "dm5.0")
+def signal(name):
+    if name == "voltage":
+        return adc_voltage()
+    if name == "adc":
+        return adc_counts()
+    if name == "led":
+        return lambda status: status.led
+    byte, dot, bit = name.partition(".")
+    if byte in REGISTERS:
+        value = lambda status: getattr(status, byte)
+    elif byte.startswith("dm") and byte[2:].isdigit() and int(byte[2:]) < 8:
+        index = int(byte[2:])
+        value = lambda status: status.debug_message[index]
+    else:
+        raise ValueError("unknown signal %r" % name)
+    if not dot:
+        return value
+    if not (bit.isdigit() and int(bit) < 8):
+        raise ValueError("unknown signal %r (bits are 0-7)" % name)
+    shift = int(bit)
+    return lambda status: (value(status) >> shift) & 1
+
+
+# ===== Trigger conditions ===== #
+# Each is fed every sample with check(t, value), which returns True if the trigger fires on it
+
+# Two-threshold comparator: goes high at level + hysteresis/2 or above, and back low below level - hysteresis/2
+class Schmitt:
+
+    def __init__(self, level, hysteresis = 0.0):
+        self.high = level + hysteresis / 2.0
+        self.low = level - hysteresis / 2.0
+        self.state = None               # True = high, None = no samples yet
+
+    def reset(self):
+        self.state = None
+
+    # Returns RISING or FALLING if the state changed on this sample, else None
+    def update(self, value):
+        if self.state is None:
+            self.state = value >= self.high
+        elif not self.state and value >= self.high:
+            self.state = True
+            return RISING
+        elif self.state and value < self.low:
+            self.state = False
+            return FALLING
+        return None
+
+
+class EdgeTrigger:
+
+    def __init__(self, level, slope = RISING, hysteresis = 0.0):
+        if slope not in SLOPES:
+            raise ValueError("unknown slope %r" % slope)
+        self.slope = slope
+        self.comparator = Schmitt(level, hysteresis)
+
+    def reset(self):
+        self.comparator.reset()
+
+    def check(self, t, value):
+        edge = self.comparator.update(value)
+        return edge is not None and (self.slope == EITHER or edge == self.slope)
+
+
+class LevelTrigger:
+
+    def __init__(self, level, above = True, hysteresis = 0.0):
+        self.above = above
+        self.comparator = Schmitt(level, hysteresis)
+
+    def reset(self):
+        self.comparator.reset()
+
+    def check(self, t, value):
+        self.comparator.update(value)
+        return self.comparator.state == self.above
+
+
+class WindowTrigger:
+
+    # Fires when the signal goes outside [low, high] (or, with inside, comes back into it)
+    def __init__(self, low, high, inside = False, hysteresis = 0.0):
+        if low > high:
+            raise ValueError("window low (%s) is above high (%s)" % (low, high))
+        self.inside = inside
+        self.lower = Schmitt(low, hysteresis)
+        self.upper = Schmitt(high, hysteresis)
+        self.was_inside = None
+
+    def reset(self):
+        self.lower.reset()
+        self.upper.reset()
+        self.was_inside = None
+
+    def check(self, t, value):
+        self.lower.update(value)
+        self.upper.update(value)
+        is_inside = self.lower.state and not self.upper.state
+        fired = self.was_inside is not None and is_inside != self.was_inside and is_inside == self.inside
+        self.was_inside = is_inside
+        return fired
+
+
+class PulseWidthTrigger:
+
+    # Fires at the end of a high pulse (or low, with high = False) at least min_width and at most max_width
+    # seconds long (None = no limit)
+    def __init__(self, level, high = True, min_width = None, max_width = None, hysteresis = 0.0):
+        self.high = high
+        self.min_width = min_width
+        self.max_width = max_width
+        self.comparator = Schmitt(level, hysteresis)
+        self.pulse_start = None
+
+    def reset(self):
+        self.comparator.reset()
+        self.pulse_start = None
+
+    def check(self, t, value):
+        edge = self.comparator.update(value)
+        if edge is None:
+            return False
+        if (edge == RISING) == self.high:           # Leading edge
+            self.pulse_start = t
+            return False
+        if self.pulse_start is None:                # The pulse started before the first sample
+            return False
+        width = t - self.pulse_start
+        self.pulse_start = None
+        return (self.min_width is None or width >= self.min_width) and (self.max_width is None or width <= self.max_width)
+
+
+# ===== Engine ===== #
+
+# callback(window) is called with each complete TriggerWindow, from the thread calling process()
+class TriggerEngine(Publisher):
+
+    def __init__(self, condition, signal, pre = 100, post = 100, holdoff = 0.0, mode = NORMAL):
+        Publisher.__init__(self)
+        if mode not in MODES:
+            raise ValueError("unknown trigger mode %r" % mode)
+        self.condition = condition
+        self.signal = signal            # status --> the value the condition looks at
+        self.pre = max(pre, 1)          # Statuses kept up to the trigger, the one that fired included
+        self.post = post                # Statuses kept after it
+        self.holdoff = holdoff          # Seconds after a trigger during which the next ones are ignored
+        self.mode = mode
+        self.history = deque(maxlen = self.pre)         # The ring buffer of the latest statuses
+        self.reset()
+
+    # Re-arms, forgetting any window being filled and everything seen so far
+    def reset(self):
+        self.condition.reset()
+        self.history.clear()
+        self.armed = True
+        self.window = None              # Statuses of the window being filled
+        self.trigger_time = None
+        self.trigger_index = 0
+        self.remaining = 0              # Statuses still to come in the window
+        self.holdoff_until = None
+        self.samples = 0
+        self.triggers = 0               # Triggers that started a window
+        self.ignored = 0                # Triggers that fired while filling a window or in holdoff
+        self.windows = 0                # Windows completed
+
+
+    # Feeds one status (subscribe this to an AcquisitionEngine)
+    def process(self, status):
+        t = status.timestamp
+        fired = self.condition.check(t, self.signal(status))
+        self.samples += 1
+        self.history.append(status)
+
+        if self.window is not None:
+            self.window.append(status)
+            self.remaining -= 1
+            if fired:
+                self.ignored += 1
+            if self.remaining <= 0:
+                self.complete()
+            return
+
+        if not fired or not self.armed:
+            return
+        if self.holdoff_until is not None and t < self.holdoff_until:
+            self.ignored += 1
+            return
+
+        self.triggers += 1
+        self.trigger_time = t
+        self.holdoff_until = t + self.holdoff
+        self.window = list(self.history)
+        self.trigger_index = len(self.window) - 1
+        self.remaining = self.post
+        if self.remaining <= 0:
+            self.complete()
+
+    def complete(self):
+        self.windows += 1
+        window = TriggerWindow(self.windows, self.trigger_time, self.trigger_index, self.window)
+        self.window = None
+        if self.mode == SINGLE:
+            self.armed = False
+        self.publish(window)
+
+    # Publishes the window being filled, if any, short of its post-trigger statuses (e.g. when acquisition stops)
+    def finish(self):
+        if self.window is not None:
+            self.complete()
+
+    # Re-arms a SINGLE mode trigger for another window
+    def arm(self):
+        self.armed = True
+
+    def summary(self):
+        return "%d samples, %d triggers, %d windows, %d ignored (holdoff or mid-window)" % (
+            self.samples, self.triggers, self.windows, self.ignored)
+
+
+# ===== Persisting windows ===== #
+
+# Writes each TriggerWindow to its own capture, directory/trigger-00001.pic, ..., from a thread of its own so
+# the acquisition thread never waits on the disk. directory/triggers.txt lists them, with the wall clock time
+# each one fired at
+class WindowWriter:
+
+    def __init__(self, directory, rate = None, schema = captureFile.DEFAULT_SCHEMA, start_clock = None):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if start_clock is None:
+            start_clock = clock()
+        self.directory = directory
+        self.rate = rate
+        self.schema = schema
+        self.start_clock = start_clock  # The same timebase for every window, so their timestamps line up
+        self.wall_offset = time.time() - clock()            # status timestamps (clock()) --> time.time()
+        self.written = 0
+        self.windows = queue.Queue()
+        self.thread = threading.Thread(target = self.run, name = "WindowWriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    # Subscribe this to a TriggerEngine
+    def write(self, window):
+        self.windows.put(window)
+
+    # Waits for the windows handed over so far to be written
+    def close(self):
+        if self.thread is None:
+            return
+        self.windows.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while True:
+            window = self.windows.get()
+            if window is None:
+                break
+            try:
+                self.save(window)
+            except EnvironmentError as e:
+                sys.stderr.write("unable to save trigger window %d: %s\n" % (window.number, e))
+
+    def save(self, window):
+        name = "trigger-%05d.pic" % window.number
+        capture = captureFile.CaptureWriter(os.path.join(self.directory, name), self.rate,
+                                            start_clock = self.start_clock, schema = self.schema)
+        for status in window.statuses:
+            capture.write(status)
+        capture.close()
+
+        filename = os.path.join(self.directory, "triggers.txt")
+        new = not os.path.exists(filename)
+        fout = open(filename, 'a')
+        if new:
+            fout.write("window\tfile\ttriggered at\ttrigger time (s)\ttrigger index\tstatuses\n")
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(window.trigger_time + self.wall_offset))
+        fout.write("%d\t%s\t%s\t%.6f\t%d\t%d\n" % (window.number, name, when, window.trigger_time - self.start_clock,
+                                                 window.trigger_index, len(window.statuses)))
+        fout.close()
+        self.written += 1
@@ -0,0 +1,397 @@
+"""
+USB Transports - the ways PicDevice can reach a PIC.
+
+    DllTransport        the usb.dll wrapper around libusb-win32 (Windows; what the GUI has always used)
+    LibusbTransport     libusb-1.0 through ctypes (Linux, and anywhere else libusb-1.0 is installed)
+    SimulatedTransport  an in-process picSimulator.SimulatedPic, with a configurable per-transfer latency
+
+All of them take the same calls as the dll: control_transfer() returns the
+number of bytes transferred (< 0 on error, e.g. a stall), and bulk_read()
+returns the number of bytes read (0 if nothing arrived before the timeout).
+
+default_transport() picks one from the PIC_TRANSPORT environment variable
+("dll", "libusb" or "sim"), else by platform.
+
+With several boards plugged in, list_devices() gives the id of each: its
+serial number, or where it is plugged in if it has none. Boards built with
+the default serial number all report the same one, so a serial number that
+more than one board has gets where it is plugged in added ("0001@1-4"). A
+transport made with serial = id opens just that board; see deviceManager.py.
+"""
+
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+
+from pollScheduler import clock
+import picSimulator
+
+
+ERROR_NOT_OPEN  = -2            # Same as usb.c's control_transfer
+ERROR_STALL     = -32           # -EPIPE: the device stalled the request
+
+
+class Transport:
+
+    name = "none"
+    serial = None               # Id of the board open() picks (see list_devices). None = the first one found
+
+    def open(self, vendor_id, product_id):      # Returns True if a device was opened
+        raise NotImplementedError
+
+    def list_devices(self, vendor_id, product_id):      # Ids of all the matching boards
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def is_open(self):
+        return False
+
+    def control_transfer(self, bmRequestType, bRequest, wValue, wIndex, wLength, buffer):
+        raise NotImplementedError
+
+    def claim_interface(self, interface):
+        return 0
+
+    def bulk_read(self, endpoint, buffer, length, timeout):
+        raise NotImplementedError
+
+
+class DllTransport(Transport):
+
+    name = "dll"
+    ETIMEDOUT = 116             # libusb-win32's timeout error (Usb/LibUSB-Win32/src/src/error.h)
+    ID_LIST_SIZE = 4096
+    libraries = {}              # The loaded dll for each path. initialize() forgets every open device, so it runs once
+
+    def __init__(self, dll_path = None, serial = None):
+        if dll_path is None:
+            dll_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'usb.dll')
+        self.dll_path = dll_path
+        self.serial = serial
+        self.usb = None
+        self.dev = -1
+
+    def load(self):
+        if self.dll_path not in self.libraries:
+            usb = ctypes.cdll.LoadLibrary(self.dll_path)
+            usb.initialize()
+            self.libraries[self.dll_path] = usb
+        self.usb = self.libraries[self.dll_path]
+
+    def open(self, vendor_id, product_id):
+        self.close()
+        if self.usb is None:
+            try:
+                self.load()
+            except OSError:
+                print("unable to load usb dll")
+                return False
+
+        if self.serial is None:
+            self.dev = self.usb.open_device(vendor_id, product_id)
+        elif hasattr(self.usb, 'open_device_id'):
+            self.dev = self.usb.open_device_id(vendor_id, product_id, ctypes.c_char_p(self.serial.encode('ascii')))
+        else:
+            raise NotImplementedError("%s can't open boards by id; rebuild it from Usb/usb_source_files/usb.c" % self.dll_path)
+        return self.dev >= 0
+
+    def list_devices(self, vendor_id, product_id):
+        if self.usb is None:
+            self.load()
+        if not hasattr(self.usb, 'list_devices'):
+            raise NotImplementedError("%s has no list_devices; rebuild it from Usb/usb_source_files/usb.c" % self.dll_path)
+        ids = ctypes.create_string_buffer(self.ID_LIST_SIZE)
+        self.usb.list_devices(vendor_id, product_id, ids, self.ID_LIST_SIZE)
+        return ids.value.decode('ascii').splitlines()
+
+    def close(self):
+        if self.usb is not None and self.dev >= 0:
+            self.usb.close_device(self.dev)
+        self.dev = -1
+
+    def is_open(self):
+        return self.usb is not None and self.dev >= 0
+
+    def control_transfer(self, bmRequestType, bRequest, wValue, wIndex, wLength, buffer):
+        return self.usb.control_transfer(self.dev, bmRequestType, bRequest, wValue, wIndex, wLength, buffer)
+
+    def claim_interface(self, interface):
+        if not hasattr(self.usb, 'claim_interface'):
+            return 0                            # Older dll: libusb-win32 claims it on first use
+        return self.usb.claim_interface(self.dev, interface)
+
+    def bulk_read(self, endpoint, buffer, length, timeout):
+        if not hasattr(self.usb, 'bulk_read'):
+            raise NotImplementedError("%s has no bulk_read; rebuild it from Usb/usb_source_files/usb.c" % self.dll_path)
+        ret = self.usb.bulk_read(self.dev, endpoint, buffer, length, timeout)
+        if ret == -self.ETIMEDOUT:              # Timed out = no data yet
+            return 0
+        return ret
+
+
+class LibusbDeviceDescriptor(ctypes.Structure):
+    _fields_ = [("bLength", ctypes.c_uint8), ("bDescriptorType", ctypes.c_uint8), ("bcdUSB", ctypes.c_uint16),
+                ("bDeviceClass", ctypes.c_uint8), ("bDeviceSubClass", ctypes.c_uint8),
+                ("bDeviceProtocol", ctypes.c_uint8), ("bMaxPacketSize0", ctypes.c_uint8),
+                ("idVendor", ctypes.c_uint16), ("idProduct", ctypes.c_uint16), ("bcdDevice", ctypes.c_uint16),
+                ("iManufacturer", ctypes.c_uint8), ("iProduct", ctypes.c_uint8),
+                ("iSerialNumber", ctypes.c_uint8), ("bNumConfigurations", ctypes.c_uint8)]
+
+
+class LibusbTransport(Transport):
+
+    name = "libusb"
+    LIBUSB_ERROR_TIMEOUT = -7
+    LIBUSB_ERROR_PIPE = -9
+
+    def __init__(self, library = None, serial = None):
+        if library is None:
+            library = ctypes.util.find_library('usb-1.0') or 'libusb-1.0.so.0'
+        self.library = library
+        self.serial = serial
+        self.lib = None
+        self.context = ctypes.c_void_p()
+        self.handle = None
+
+    def load(self):
+        lib = ctypes.CDLL(self.library)
+        lib.libusb_init.argtypes = [ctypes.POINTER(ctypes.c_void_p)]
+        lib.libusb_exit.argtypes = [ctypes.c_void_p]
+        lib.libusb_open_device_with_vid_pid.argtypes = [ctypes.c_void_p, ctypes.c_uint16, ctypes.c_uint16]
+        lib.libusb_open_device_with_vid_pid.restype = ctypes.c_void_p
+        lib.libusb_close.argtypes = [ctypes.c_void_p]
+        lib.libusb_control_transfer.argtypes = [ctypes.c_void_p, ctypes.c_uint8, ctypes.c_uint8, ctypes.c_uint16,
+                                                ctypes.c_uint16, ctypes.c_char_p, ctypes.c_uint16, ctypes.c_uint]
+        lib.libusb_claim_interface.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.libusb_set_auto_detach_kernel_driver.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.libusb_bulk_transfer.argtypes = [ctypes.c_void_p, ctypes.c_ubyte, ctypes.c_char_p, ctypes.c_int,
+                                             ctypes.POINTER(ctypes.c_int), ctypes.c_uint]
+        lib.libusb_get_device_list.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.POINTER(ctypes.c_void_p))]
+        lib.libusb_get_device_list.restype = ctypes.c_ssize_t
+        lib.libusb_free_device_list.argtypes = [ctypes.POINTER(ctypes.c_void_p), ctypes.c_int]
+        lib.libusb_get_device_descriptor.argtypes = [ctypes.c_void_p, ctypes.POINTER(LibusbDeviceDescriptor)]
+        lib.libusb_open.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p)]
+        lib.libusb_get_string_descriptor_ascii.argtypes = [ctypes.c_void_p, ctypes.c_uint8, ctypes.c_char_p, ctypes.c_int]
+        lib.libusb_get_bus_number.argtypes = [ctypes.c_void_p]
+        lib.libusb_get_bus_number.restype = ctypes.c_uint8
+        lib.libusb_get_device_address.argtypes = [ctypes.c_void_p]
+        lib.libusb_get_device_address.restype = ctypes.c_uint8
+        if lib.libusb_init(ctypes.byref(self.context)) < 0:
+            raise OSError("libusb_init failed")
+        self.lib = lib
+
+    def open(self, vendor_id, product_id):
+        self.close()
+        if self.lib is None:
+            try:
+                self.load()
+            except OSError as e:
+                print("unable to load libusb-1.0: %s" % e)
+                return False
+
+        if self.serial is None:
+            self.handle = self.lib.libusb_open_device_with_vid_pid(self.context, vendor_id, product_id)
+        else:
+            self.handle = self.open_by_id(vendor_id, product_id, self.serial)
+        if not self.handle:
+            self.handle = None
+            return False
+        self.lib.libusb_set_auto_detach_kernel_driver(self.handle, 1)
+        return True
+
+    # A board's serial number, or None if it has none
+    def device_serial(self, device, descriptor):
+        if descriptor.iSerialNumber:
+            handle = ctypes.c_void_p()
+            if self.lib.libusb_open(device, ctypes.byref(handle)) == 0:
+                serial = ctypes.create_string_buffer(128)
+                n = self.lib.libusb_get_string_descriptor_ascii(handle, descriptor.iSerialNumber, serial, len(serial))
+                self.lib.libusb_close(handle)
+                if n > 0:
+                    return serial.value.decode('ascii', 'replace')
+        return None
+
+    # Where a board is plugged in: "bus-address"
+    def device_location(self, device):
+        return "%d-%d" % (self.lib.libusb_get_bus_number(device), self.lib.libusb_get_device_address(device))
+
+    # Calls found(device, id) for every matching board until it returns something other than None.
+    # A board's id is its serial number if no other board has the same one (see the module docstring)
+    def find_devices(self, vendor_id, product_id, found):
+        devices = ctypes.POINTER(ctypes.c_void_p)()
+        count = self.lib.libusb_get_device_list(self.context, ctypes.byref(devices))
+        try:
+            boards = []                     # (device, serial)
+            for i in range(max(count, 0)):
+                descriptor = LibusbDeviceDescriptor()
+                if self.lib.libusb_get_device_descriptor(devices[i], ctypes.byref(descriptor)) < 0:
+                    continue
+                if descriptor.idVendor == vendor_id and descriptor.idProduct == product_id:
+                    boards.append((devices[i], self.device_serial(devices[i], descriptor)))
+            serials = [serial for device, serial in boards]
+            for device, serial in boards:
+                if serial is None:
+                    id = self.device_location(device)
+                elif serials.count(serial) > 1:
+                    id = "%s@%s" % (serial, self.device_location(device))
+                else:
+                    id = serial
+                result = found(device, id)
+                if result is not None:
+                    return result
+        finally:
+            if count >= 0:
+                self.lib.libusb_free_device_list(devices, 1)
+        return None
+
+    def open_by_id(self, vendor_id, product_id, id):
+        def found(device, device_id):
+            handle = ctypes.c_void_p()
+            if device_id == id and self.lib.libusb_open(device, ctypes.byref(handle)) == 0:
+                return handle.value
+        return self.find_devices(vendor_id, product_id, found)
+
+    def list_devices(self, vendor_id, product_id):
+        if self.lib is None:
+            self.load()
+        ids = []
+        self.find_devices(vendor_id, product_id, lambda device, id: ids.append(id))
+        return ids
+
+    def close(self):
+        if self.handle is not None:
+            self.lib.libusb_close(self.handle)
+        self.handle = None
+
+    def is_open(self):
+        return self.handle is not None
+
+    def control_transfer(self, bmRequestType, bRequest, wValue, wIndex, wLength, buffer):
+        return self.lib.libusb_control_transfer(self.handle, bmRequestType, bRequest, wValue, wIndex,
+                                                buffer, wLength, 100)
+
+    def claim_interface(self, interface):
+        return self.lib.libusb_claim_interface(self.handle, interface)
+
+    def bulk_read(self, endpoint, buffer, length, timeout):
+        transferred = ctypes.c_int(0)
+        ret = self.lib.libusb_bulk_transfer(self.handle, endpoint, buffer, length, ctypes.byref(transferred), timeout)
+        if ret < 0 and ret != self.LIBUSB_ERROR_TIMEOUT:
+            return ret
+        return transferred.value
+
+
+class SimulatedTransport(Transport):
+
+    name = "sim"
+    SPIN_TIME = 0.002           # Latencies shorter than this are busy-waited; sleep() is too coarse
+
+    def __init__(self, pic = None, latency = 0.0, serial = None, devices = 1):
+        self.pic = pic or picSimulator.SimulatedPic()
+        self.latency = latency  # Seconds each transfer takes
+        self.serial = serial
+        self.devices = devices  # How many boards list_devices() pretends are plugged in
+        self.opened = False
+
+    def open(self, vendor_id, product_id):
+        if self.serial is not None and self.serial not in self.list_devices(vendor_id, product_id):
+            return False
+        self.opened = True
+        return True
+
+    def list_devices(self, vendor_id, product_id):
+        return ["SIM%04d" % (i + 1) for i in range(self.devices)]
+
+    def close(self):
+        self.opened = False
+
+    def is_open(self):
+        return self.opened
+
+    def wait(self, seconds):
+        end = clock() + seconds
+        if seconds > self.SPIN_TIME:
+            time.sleep(seconds - self.SPIN_TIME)
+        while clock() < end:
+            pass
+
+    def control_transfer(self, bmRequestType, bRequest, wValue, wIndex, wLength, buffer):
+        if not self.opened:
+            return ERROR_NOT_OPEN
+        if self.latency:
+            self.wait(self.latency)
+        if not bmRequestType & 0x60:            # Standard requests (SET_CONFIGURATION): nothing to do
+            return 0
+
+        data = None
+        if not bmRequestType & 0x80 and wLength:           # Host-to-device with a data stage
+            data = bytearray(ctypes.string_at(buffer, wLength))
+        reply = self.pic.process_vendor_request(bRequest, wValue, wIndex, wLength, data)
+        if reply is None:
+            return ERROR_STALL
+        if not bmRequestType & 0x80:            # Host-to-device: nothing comes back
+            return wLength
+        count = min(len(reply), wLength, len(buffer))
+        ctypes.memmove(buffer, bytes(reply[:count]), count)
+        return count
+
+    def bulk_read(self, endpoint, buffer, length, timeout):
+        if not self.opened:
+            return ERROR_NOT_OPEN
+        wait = self.pic.stream_wait_time()
+        if wait is None or wait > timeout / 1000.0:         # Nothing will arrive in time
+            self.wait(timeout / 1000.0)
+            return 0
+        self.wait(max(wait, self.latency))
+        data = self.pic.read_stream(min(length, len(buffer)))
+        ctypes.memmove(buffer, bytes(data), len(data))
+        return len(data)
+
+
+# Picks a transport: $PIC_TRANSPORT if set, else the dll on Windows and libusb-1.0 elsewhere
+def default_transport():
+    name = os.environ.get('PIC_TRANSPORT')
+    if name is None:
+        name = 'dll' if sys.platform == 'win32' else 'libusb'
+    return make_transport(name)
+
+
+def make_transport(name, **kwargs):
+    transports = {'dll' : DllTransport, 'libusb' : LibusbTransport, 'sim' : SimulatedTransport}
+    if name not in transports:
+        raise ValueError("unknown transport %r (expected one of %s)" % (name, ", ".join(sorted(transports))))
+    return transports[name](**kwargs)
+
+
+# The --transport, --serial, --dll, --latency and --sim-devices options of the command line tools (optparse)
+def add_options(parser):
+    parser.add_option("-t", "--transport", default = None, choices = ["dll", "libusb", "sim"],
+                      help = "how to reach the PIC: dll, libusb or sim (simulated PIC) [default: $PIC_TRANSPORT, "
+                             "else dll on Windows and libusb elsewhere]")
+    parser.add_option("-S", "--serial", default = None,
+                      help = "id of the board to open, when several are plugged in (see pic_acquire.py --list-devices) "
+                             "[default: the first one found]")
+    parser.add_option("--dll", default = None,
+                      help = "path of the usb dll (dll transport) [default: helpers/usb.dll]")
+    parser.add_option("--latency", type = "float", default = 0.0,
+                      help = "seconds each transfer takes (sim transport) [default: %default]")
+    parser.add_option("--sim-devices", type = "int", default = 1,
+                      help = "how many simulated boards there are (sim transport) [default: %default]")
+
+# The transport the options ask for, opening the board 'serial' (default: --serial)
+def from_options(options, serial = None):
+    if serial is None:
+        serial = options.serial
+    if options.transport == "dll" or (options.transport is None and options.dll):
+        return DllTransport(options.dll, serial)
+    elif options.transport == "sim":
+        return SimulatedTransport(latency = options.latency, serial = serial, devices = options.sim_devices)
+    elif options.transport == "libusb":
+        return LibusbTransport(serial = serial)
+    transport = default_transport()
+    transport.serial = serial
+    return transport
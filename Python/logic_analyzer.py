@@ -0,0 +1,80 @@
+#!/usr/bin/python
+"""
+logic-analyzer - shows the PORTA/B/C pins of a recorded capture as logic analyzer timelines.
+
+The registers are turned into per-pin edge times once (helpers/logicAnalyzer.py),
+so captures of tens of millions of samples open quickly, and each repaint only
+does a binary search per pixel (helpers/logicTimeline.py). With --summary the
+edges, frequency, pulse widths and duty cycle of every pin that changed are
+printed instead, without opening a window.
+
+The capture needs the PORTA/B/C columns: a binary capture with the standard
+or full schema (old text logs and --schema adc captures only have the ADC).
+
+Examples:
+    python pic_acquire.py --binary --output capture.pic ... ; python logic_analyzer.py capture.pic
+    python pic_acquire.py --binary --schema full --segment-time 3600 --output run1 ... ; python logic_analyzer.py --pins PORTB,PORTC.0 run1
+    python logic_analyzer.py --summary capture.pic
+"""
+
+import sys
+import os
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "helpers"))
+import captureFile
+import captureReader
+import logicAnalyzer
+
+
+# "PORTB,PORTC.0" --> ["PORTB.0", ..., "PORTB.7", "PORTC.0"]
+def parse_pins(text):
+    pins = []
+    for name in text.split(","):
+        name = name.strip()
+        if name in logicAnalyzer.REGISTERS:
+            pins.extend(["%s.%d" % (name, bit) for bit in range(8)])
+        elif name in logicAnalyzer.PINS:
+            pins.append(name)
+        else:
+            raise ValueError("unknown pin %r (expected e.g. PORTB or PORTB.3)" % name)
+    return pins
+
+
+def main(argv = None):
+    parser = OptionParser(usage = "%prog [options] capture")
+    parser.add_option("-p", "--pins", default = None,
+                      help = "comma separated registers and pins to show, e.g. PORTB,PORTC.0 [default: all 24]")
+    parser.add_option("-s", "--summary", action = "store_true", default = False,
+                      help = "print each pin's edges, frequency and pulse widths instead of showing them")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("give one capture file")
+    pins = None
+    if options.pins:
+        try:
+            pins = parse_pins(options.pins)
+        except ValueError as e:
+            parser.error(str(e))
+
+    try:
+        capture = captureReader.open_capture(args[0])
+        logic = logicAnalyzer.LogicCapture.from_capture(capture)
+    except (EnvironmentError, captureFile.CaptureError, ValueError) as e:
+        parser.error("%s: %s" % (args[0], e))
+
+    if options.summary:
+        print(logic.summary())
+        return 0
+
+    from PyQt4 import QtGui
+    import logicTimeline
+    app = QtGui.QApplication(sys.argv[:1])
+    window = logicTimeline.LogicWindow(logic, pins = pins)
+    window.setWindowTitle("Logic Analyzer - %s" % os.path.basename(args[0]))
+    window.show()
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
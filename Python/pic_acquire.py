@@ -0,0 +1,377 @@
+#!/usr/bin/python
+"""
+pic-acquire - headless data acquisition from the PIC (no GUI, no Qt)
+
+Polls the PIC with the acquisition engine and writes one formatted row
+(PORT/TRIS registers, debug messages, timestamp) per sample.
+
+With --stream, the PIC samples its ADC on its own clock and the samples are
+drained over the bulk endpoint instead (one "index adc PORTA" row per sample).
+
+With --binary, polled statuses are written as a binary capture instead of
+text (see helpers/captureFile.py): much smaller and faster for long runs,
+and still readable if the run is cut off. With --segment-size or
+--segment-time, --output is a directory of segments that roll over and are
+compressed in the background (see helpers/segmentedCapture.py). With
+--delta, only what changed from one poll to the next is stored (see
+helpers/deltaCapture.py): a few bytes an hour for an idle board.
+
+With --trigger, nothing is logged until a trigger condition on --signal fires
+(an edge, a level, leaving a window, or a pulse of some width); each trigger
+saves --pre statuses before it and --post after it as one capture in the
+--output directory (see helpers/triggerEngine.py).
+
+With --devices, several boards are polled at once, each on its own thread,
+into one binary capture per board (<output>/<id>.pic); see
+helpers/deviceManager.py. --list-devices shows the ids of the boards found.
+
+Examples:
+    python pic_acquire.py --rate 100 --duration 3600 --output capture.txt
+    python pic_acquire.py --rate 500 --duration 36000 --binary --output capture.pic
+    python pic_acquire.py --rate 500 --binary --schema full --output capture.pic
+    python pic_acquire.py --rate 500 --binary --segment-time 3600 --compress lzma --output run1
+    python pic_acquire.py --rate 1000 --duration 86400 --binary --delta --output day.picd
+    python pic_acquire.py --rate 0 --count 10000        (as fast as possible, to stdout)
+    python pic_acquire.py --stream --rate 5000 --duration 60 --output adc.txt
+    python pic_acquire.py --transport sim --latency 0.001 --rate 500 --count 1000   (no board needed)
+    python pic_acquire.py --rate 1000 --trigger pulse --signal PORTB.2 --max-width 0.002 --output glitches
+    python pic_acquire.py --rate 200 --trigger edge --signal voltage --level 1.2 --hysteresis 0.05 --output edges
+    python pic_acquire.py --list-devices
+    python pic_acquire.py --devices all --rate 200 --duration 60 --output captures
+"""
+
+import sys
+import os
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "helpers"))
+import dataLogger
+import registerFormat
+import captureFile
+import segmentedCapture
+import deltaCapture
+import picDevice
+import usbTransport
+import acquisitionEngine
+import deviceManager
+import transferStats
+import triggerEngine
+import pollScheduler
+import streamReader
+from pollScheduler import clock
+
+
+def parse_args(argv):
+    parser = OptionParser(usage = "%prog [options]")
+    parser.add_option("-r", "--rate", type = "float", default = 20,
+                      help = "polls per second (0 = as fast as the device answers) [default: %default]")
+    parser.add_option("-p", "--policy", default = pollScheduler.DROP, choices = pollScheduler.POLICIES,
+                      help = "what to do with late polls: %s [default: %%default]" % " or ".join(pollScheduler.POLICIES))
+    parser.add_option("-s", "--stream", action = "store_true", default = False,
+                      help = "stream ADC samples over the bulk endpoint (rate up to 10000/s)")
+    parser.add_option("-d", "--duration", type = "float", default = None,
+                      help = "stop after this many seconds")
+    parser.add_option("-n", "--count", type = "int", default = None,
+                      help = "stop after this many samples")
+    parser.add_option("-o", "--output", default = None,
+                      help = "file to write samples to [default: stdout]")
+    parser.add_option("-b", "--binary", action = "store_true", default = False,
+                      help = "write a binary capture file instead of text (needs --output)")
+    parser.add_option("--schema", default = captureFile.DEFAULT_SCHEMA, choices = sorted(captureFile.SCHEMAS),
+                      help = "fields of each binary record: %s (full adds a sequence number and the host wall clock) "
+                             "[default: %%default]" % ", ".join(sorted(captureFile.SCHEMAS)))
+    parser.add_option("--delta", action = "store_true", default = False,
+                      help = "write a change-only delta capture (timestamps to the ms, full register state) with --binary")
+    parser.add_option("--segment-size", type = "float", default = None,
+                      help = "split the binary capture into segments of this many MB (--output is then a directory)")
+    parser.add_option("--segment-time", type = "float", default = None,
+                      help = "split the binary capture into segments of this many seconds (--output is then a directory)")
+    parser.add_option("--compress", default = "zlib", choices = sorted(segmentedCapture.COMPRESSIONS),
+                      help = "how sealed segments are compressed: %s [default: %%default]" % ", ".join(sorted(segmentedCapture.COMPRESSIONS)))
+    parser.add_option("--trigger", default = None, choices = ("edge", "level", "window", "pulse"),
+                      help = "only save the statuses around each time this fires: edge, level, window or pulse "
+                             "(--output is then a directory of captures, one per trigger)")
+    parser.add_option("--signal", default = "voltage",
+                      help = "what the trigger looks at: voltage, adc, a register (PORTB), a register bit (PORTB.2), "
+                             "dm0..dm7 or led [default: %default]")
+    parser.add_option("--level", type = "float", default = 0.5,
+                      help = "edge, level and pulse triggers: the level [default: %default]")
+    parser.add_option("--slope", default = triggerEngine.RISING, choices = triggerEngine.SLOPES,
+                      help = "edge trigger: %s [default: %%default]" % ", ".join(triggerEngine.SLOPES))
+    parser.add_option("--below", action = "store_true", default = False,
+                      help = "level trigger: fire below the level instead of above it; "
+                             "pulse trigger: look at low pulses instead of high ones")
+    parser.add_option("--low", type = "float", default = None, help = "window trigger: bottom of the window")
+    parser.add_option("--high", type = "float", default = None, help = "window trigger: top of the window")
+    parser.add_option("--inside", action = "store_true", default = False,
+                      help = "window trigger: fire on coming into the window instead of leaving it")
+    parser.add_option("--min-width", type = "float", default = None, help = "pulse trigger: shortest pulse (seconds)")
+    parser.add_option("--max-width", type = "float", default = None, help = "pulse trigger: longest pulse (seconds)")
+    parser.add_option("--hysteresis", type = "float", default = 0.0,
+                      help = "how far past a level the signal has to go to count as crossing back [default: %default]")
+    parser.add_option("--pre", type = "int", default = 100,
+                      help = "statuses saved up to each trigger [default: %default]")
+    parser.add_option("--post", type = "int", default = 100,
+                      help = "statuses saved after each trigger [default: %default]")
+    parser.add_option("--holdoff", type = "float", default = 0.0,
+                      help = "seconds after a trigger during which the next ones are ignored [default: %default]")
+    parser.add_option("--single", action = "store_true", default = False,
+                      help = "stop after the first trigger")
+    parser.add_option("--devices", default = None,
+                      help = "poll several boards at once: 'all', or a comma separated list of ids. "
+                             "--output is then a directory of binary captures")
+    parser.add_option("--list-devices", action = "store_true", default = False,
+                      help = "print the ids of the boards plugged in, and exit")
+    parser.add_option("--stats-interval", type = "float", default = None,
+                      help = "print per-request transfer statistics every this many seconds (and at the end)")
+    usbTransport.add_options(parser)
+    options, args = parser.parse_args(argv)
+    if options.devices and (options.stream or not options.output):
+        parser.error("--devices needs --output (a directory), and does not work with --stream")
+    if options.stream and not options.rate > 0:
+        parser.error("--stream needs a sample rate (--rate > 0)")
+    if options.binary and (options.stream or not options.output):
+        parser.error("--binary needs --output, and does not work with --stream")
+    if (options.segment_size or options.segment_time) and not (options.binary or options.devices):
+        parser.error("--segment-size and --segment-time need --binary or --devices")
+    if options.delta and (not options.binary or options.segment_size or options.segment_time):
+        parser.error("--delta needs --binary, and does not work with --segment-size or --segment-time")
+    if options.trigger and (not options.output or options.binary or options.stream or options.devices):
+        parser.error("--trigger needs --output (a directory), and does not work with --binary, --stream or --devices")
+    if options.trigger == "window" and (options.low is None or options.high is None):
+        parser.error("a window trigger needs --low and --high")
+    if options.trigger:
+        try:
+            triggerEngine.signal(options.signal)
+        except ValueError as e:
+            parser.error(str(e))
+    return options, args
+
+
+# The binary capture writer for --output: a delta capture with --delta, segmented if --segment-size or
+# --segment-time was given
+def capture_writer(options):
+    if options.delta:
+        return deltaCapture.DeltaWriter(options.output, options.rate)
+    if options.segment_size or options.segment_time:
+        return segmentedCapture.SegmentedCaptureWriter(options.output, options.rate, schema = options.schema,
+                                                       segment_size = options.segment_size and int(options.segment_size * 1e6),
+                                                       segment_time = options.segment_time, compression = options.compress)
+    return captureFile.CaptureWriter(options.output, options.rate, schema = options.schema)
+
+
+# The TriggerEngine the --trigger options describe
+def make_trigger(options):
+    if options.trigger == "edge":
+        condition = triggerEngine.EdgeTrigger(options.level, options.slope, options.hysteresis)
+    elif options.trigger == "level":
+        condition = triggerEngine.LevelTrigger(options.level, not options.below, options.hysteresis)
+    elif options.trigger == "window":
+        condition = triggerEngine.WindowTrigger(options.low, options.high, options.inside, options.hysteresis)
+    else:
+        condition = triggerEngine.PulseWidthTrigger(options.level, not options.below, options.min_width,
+                                                    options.max_width, options.hysteresis)
+    return triggerEngine.TriggerEngine(condition, triggerEngine.signal(options.signal), options.pre, options.post,
+                                       options.holdoff, options.single and triggerEngine.SINGLE or triggerEngine.NORMAL)
+
+
+# Writes statuses as text rows, formatted a block at a time (registerFormat.format_rows)
+class SampleWriter:
+
+    BLOCK_ROWS = 256                # Rows formatted and written together...
+    BLOCK_TIME = 0.25               # ...or at least this often (seconds)
+
+    def __init__(self, fout, count = None):
+        self.fout = fout
+        self.count = count
+        self.written = 0
+        self.rows = []
+        self.times = []
+        self.wall_offset = time.time() - clock()            # status timestamps (clock()) --> time.time()
+        self.timestamp = registerFormat.TimestampFormatter()    # This writer's own, as it caches the last second
+
+    def __call__(self, status):
+        if self.done():
+            return
+        self.rows.append((status.PORTA, status.PORTB, status.PORTC, status.TRISA, status.TRISB, status.TRISC) +
+                         tuple(status.debug_message))
+        self.times.append(status.timestamp + self.wall_offset)
+        self.written += 1
+        if len(self.rows) >= self.BLOCK_ROWS or status.timestamp + self.wall_offset - self.times[0] >= self.BLOCK_TIME \
+           or self.done():
+            self.flush()
+
+    # Writes out the rows not written yet
+    def flush(self):
+        if self.rows:
+            self.fout.write(registerFormat.format_rows(self.rows, self.times, self.timestamp))
+            self.rows = []
+            self.times = []
+
+    def done(self):
+        return self.count is not None and self.written >= self.count
+
+
+class CaptureSampleWriter(SampleWriter):
+
+    def __call__(self, status):
+        if self.done():
+            return
+        self.fout.write(status)
+        self.written += 1
+
+
+# Feeds statuses to a TriggerEngine, whose windows go to fout (a triggerEngine.WindowWriter)
+class TriggerSampleWriter(SampleWriter):
+
+    def __init__(self, fout, trigger, count = None):
+        SampleWriter.__init__(self, fout, count)
+        self.trigger = trigger
+        trigger.subscribe(fout.write)
+
+    def __call__(self, status):
+        if self.done():
+            return
+        self.trigger.process(status)
+        self.written += 1
+
+    # Saves a window still waiting for its post-trigger statuses
+    def flush(self):
+        self.trigger.finish()
+
+    def done(self):
+        return SampleWriter.done(self) or (self.trigger.mode == triggerEngine.SINGLE and self.trigger.windows > 0)
+
+
+class BlockWriter(SampleWriter):
+
+    def __call__(self, block):
+        if self.done():
+            return
+        if self.count is not None:
+            block = block[:self.count - self.written]
+        self.fout.write("".join(["%d\t%d\t%d\n" % (index, adc, porta) for index, adc, porta in block.tolist()]))
+        self.written += len(block)
+
+
+# Polls every board in options.devices into its own capture file, until the duration or count is reached
+def acquire_all(options):
+    manager = deviceManager.DeviceManager(lambda id: usbTransport.from_options(options, id),
+                                          options.rate, options.policy)
+    ids = None
+    if options.devices != "all":
+        ids = options.devices.split(",")
+    try:
+        opened = manager.open_all(ids)
+    except NotImplementedError as e:                # An old usb.dll
+        sys.stderr.write("unable to open boards by id: %s (or use --transport libusb)\n" % e)
+        return 1
+    if not opened:
+        sys.stderr.write("no boards opened\n")
+        return 1
+
+    manager.start_capture(options.output, schema = options.schema,
+                          segment_size = options.segment_size and int(options.segment_size * 1e6),
+                          segment_time = options.segment_time, compression = options.compress)
+    start = time.time()
+    manager.start()
+    try:
+        while options.duration is None or time.time() - start < options.duration:
+            if options.count is not None and min([engine.sample_count for engine in manager]) >= options.count:
+                break
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    manager.stop()
+    sys.stderr.write("%s\n" % manager.summary())
+    manager.close()
+    return 0
+
+
+def main(argv = None):
+    options, args = parse_args(argv)
+
+    if options.list_devices:
+        try:
+            ids = usbTransport.from_options(options).list_devices(picDevice.PicDevice.VENDOR_ID, picDevice.PicDevice.PRODUCT_ID)
+        except NotImplementedError as e:            # An old usb.dll
+            sys.stderr.write("unable to list boards: %s (or use --transport libusb)\n" % e)
+            return 1
+        for id in ids:
+            sys.stdout.write("%s\n" % id)
+        sys.stderr.write("%d boards found\n" % len(ids))
+        return 0
+    if options.devices:
+        return acquire_all(options)
+
+    device = picDevice.PicDevice(usbTransport.from_options(options))
+    if not device.open():
+        return 1
+
+    if options.binary:
+        fout = capture_writer(options)
+    elif options.trigger:
+        fout = triggerEngine.WindowWriter(options.output, options.rate)
+    elif options.output:
+        fout = open(options.output, 'w')
+    else:
+        fout = sys.stdout
+
+    if options.binary:
+        writer = CaptureSampleWriter(fout, options.count)
+        engine = acquisitionEngine.AcquisitionEngine(device, options.rate, options.policy)
+    elif options.trigger:
+        writer = TriggerSampleWriter(fout, make_trigger(options), options.count)
+        engine = acquisitionEngine.AcquisitionEngine(device, options.rate, options.policy)
+    elif options.stream:
+        fout.write("index\tadc\tPORTA\n")
+        writer = BlockWriter(fout, options.count)
+        engine = streamReader.StreamReader(device)
+    else:
+        fout.write(dataLogger.makeHeaders())
+        writer = SampleWriter(fout, options.count)
+        engine = acquisitionEngine.AcquisitionEngine(device, options.rate, options.policy)
+    engine.subscribe(writer)
+
+    dumper = None
+    if options.stats_interval:
+        dumper = transferStats.StatsDumper(device.stats, options.stats_interval)
+        dumper.start()
+
+    start = time.time()
+    if options.stream:
+        engine.start(options.rate)
+    else:
+        engine.start()
+    try:
+        while not writer.done():
+            if options.duration is not None and time.time() - start >= options.duration:
+                break
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    engine.stop()
+    writer.flush()
+    elapsed = time.time() - start
+    if dumper is not None:
+        dumper.stop()
+        dumper.dump()
+
+    if fout is not sys.stdout:
+        fout.close()
+    device.close()
+
+    sys.stderr.write("%d samples in %.1fs (%.1f samples/s), %d errors\n" % (
+        writer.written, elapsed, writer.written / max(elapsed, 1e-9), engine.error_count))
+    if options.trigger:
+        sys.stderr.write("%s, %d saved to %s\n" % (writer.trigger.summary(), fout.written, options.output))
+    if options.stream:
+        sys.stderr.write("%d samples lost by the PIC\n" % engine.decoder.lost)
+    else:
+        sys.stderr.write("%s\n" % engine.stats.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+#!/usr/bin/python
+"""
+pic-benchmark - times the host side of the debugger against a simulated PIC.
+
+Every benchmark runs in-process against helpers/picSimulator.py, with each
+USB transfer taking --latency seconds, so the numbers measure this code and
+not the board or the bus:
+
+    transfers           GET_STATUS_ALL transfers/s with the given latency
+    transfer_overhead   host time per transfer with no latency at all (us)
+    sample_rate         statuses/s through the acquisition engine, polling flat out
+    convert_scalar      ADC counts --> volts, one at a time (ConversionFunctions.adcToVoltage)
+    convert_block       ADC counts --> volts, as numpy blocks (adcToVoltageBlock)
+    stream_decode       bulk stream packets decoded (streamReader.StreamDecoder), MB/s
+    capture_write       binary capture logging (captureFile.CaptureWriter, what Log Data uses), MB/s
+    delta_write         change-only logging of an idle board (deltaCapture.DeltaWriter), samples/s
+    delta_size          bytes a sample that delta_write stores
+    logic_edges         register samples turned into per-pin edge times (logicAnalyzer.LogicCapture), samples/s
+    logic_frame         time to decimate all 24 pins (5M samples, up to 1.7M edges a pin) for a 1600 pixel timeline (ms)
+    text_log_write      text logging (dataLogger.format_output, what pic_acquire writes), MB/s
+    plot_fps            ContinualPlot frames/s (needs matplotlib; drawn off screen)
+    eeprom_dump         time to read all 256 eeprom bytes (ms)
+    eeprom_dump_legacy  same, with the old 8-bytes-per-request GET_EEPROM (ms)
+
+Benchmarks whose modules can't be imported (numpy, matplotlib) are skipped.
+
+Results can be written as JSON (--output), saved as a baseline
+(--save-baseline), and compared with one (--baseline): any result more than
+--tolerance worse than the baseline is flagged, and the exit status is 1.
+
+Examples:
+    python pic_benchmark.py
+    python pic_benchmark.py --save-baseline benchmark_baseline.json
+    python pic_benchmark.py --baseline benchmark_baseline.json --output results.json
+    python pic_benchmark.py --only transfers,eeprom_dump --latency 0.002
+"""
+
+import sys
+import os
+import time
+import json
+import platform
+import tempfile
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "helpers"))
+import picDevice
+import usbTransport
+import acquisitionEngine
+import captureFile
+import deltaCapture
+import dataLogger
+import registerFormat
+from pollScheduler import clock
+
+
+# Calls function() until 'duration' seconds have passed. Returns calls/second
+def rate_of(function, duration):
+    calls = 0
+    start = clock()
+    end = start + duration
+    now = start
+    while now < end:
+        function()
+        calls += 1
+        now = clock()
+    return calls / (now - start)
+
+
+def sim_device(latency):
+    device = picDevice.PicDevice(usbTransport.SimulatedTransport(latency = latency))
+    device.open()
+    return device
+
+
+# ===== Benchmarks ===== #
+# Each takes the options and returns (value, unit, True if higher is better)
+
+def bench_transfers(options):
+    device = sim_device(options.latency)
+    return rate_of(device.get_status, options.duration), "transfers/s", True
+
+def bench_transfer_overhead(options):
+    device = sim_device(0.0)
+    return 1e6 / rate_of(device.get_status, options.duration), "us", False
+
+def bench_sample_rate(options):
+    device = sim_device(options.latency)
+    engine = acquisitionEngine.AcquisitionEngine(device, 0)
+    received = []
+    engine.subscribe(received.append)
+    start = clock()
+    engine.start()
+    time.sleep(options.duration)
+    engine.stop()
+    return len(received) / (clock() - start), "samples/s", True
+
+def bench_convert_scalar(options):
+    import ConversionFunctions
+    values = list(range(1024))
+    def convert():
+        for value in values:
+            ConversionFunctions.adcToVoltage(value)
+    return rate_of(convert, options.duration) * len(values), "samples/s", True
+
+def bench_convert_block(options):
+    import numpy
+    import ConversionFunctions
+    values = numpy.arange(1 << 20) % 1024
+    ConversionFunctions.adcToVoltageBlock(values[:1])       # Builds the lookup table outside the timing
+    return rate_of(lambda: ConversionFunctions.adcToVoltageBlock(values), options.duration) * len(values), "samples/s", True
+
+def bench_stream_decode(options):
+    import streamReader
+    packets = bytearray()
+    for i in range(16 * 1024):
+        packets += bytearray([i & 0xFF, (i >> 2) & 0xFF, (i << 6) & 0xC0, 0x05])
+    packets = bytes(packets)
+    decoder = streamReader.StreamDecoder()
+    return rate_of(lambda: decoder.decode(packets), options.duration) * len(packets) / 1e6, "MB/s", True
+
+def bench_capture_write(options):
+    status = sim_device(0.0).get_status()
+    handle, filename = tempfile.mkstemp(".pic")
+    os.close(handle)
+    try:
+        writer = captureFile.CaptureWriter(filename, 100, start_clock = status.timestamp)
+        def write():
+            for i in range(1000):
+                writer.write(status)
+        rate = rate_of(write, options.duration)
+        writer.close()
+    finally:
+        os.remove(filename)
+    return rate * 1000 * captureFile.RECORD_STRUCT.size / 1e6, "MB/s", True
+
+# Statuses of an idle board polled every 10ms, with the poll jitter ~N(0, 50us)
+def idle_statuses(count):
+    import random
+    status = sim_device(0.0).get_status()
+    return [status._replace(timestamp = i * 0.01 + random.gauss(0, 5e-5)) for i in range(count)]
+
+def delta_write(statuses):
+    handle, filename = tempfile.mkstemp(".picd")
+    os.close(handle)
+    try:
+        writer = deltaCapture.DeltaWriter(filename, 100, start_clock = 0.0)
+        for status in statuses:
+            writer.write(status)
+        writer.close()
+        return os.path.getsize(filename)
+    finally:
+        os.remove(filename)
+
+def bench_delta_write(options):
+    statuses = idle_statuses(10000)
+    return rate_of(lambda: delta_write(statuses), options.duration) * len(statuses), "samples/s", True
+
+def bench_delta_size(options):
+    statuses = idle_statuses(100000)
+    return delta_write(statuses) / float(len(statuses)), "bytes/sample", False
+
+# 1M samples of PORTA/B/C counting up every third sample: every bit of every register toggles
+def counting_registers(count = 1 << 20):
+    import numpy
+    values = (numpy.arange(count) // 3).astype(numpy.uint8)
+    return numpy.arange(count) * 1e-4, {"PORTA" : values, "PORTB" : values, "PORTC" : values}
+
+def bench_logic_edges(options):
+    import logicAnalyzer
+    timestamps, columns = counting_registers()
+    return rate_of(lambda: logicAnalyzer.LogicCapture().append(timestamps, columns), options.duration) * len(timestamps), "samples/s", True
+
+def bench_logic_frame(options):
+    import logicAnalyzer
+    timestamps, columns = counting_registers(5000000)
+    logic = logicAnalyzer.LogicCapture()
+    logic.append(timestamps, columns)
+    pins = [logic.pin(name) for name in logic.pin_names()]
+    def frame():
+        for pin in pins:
+            pin.decimate(logic.start, logic.end, 1600)
+    return 1000.0 / rate_of(frame, options.duration), "ms", False
+
+def bench_text_log_write(options):
+    status = sim_device(0.0).get_status()
+    row = [status.PORTA, status.PORTB, status.PORTC, status.TRISA, status.TRISB, status.TRISC] + list(status.debug_message)
+    handle, filename = tempfile.mkstemp(".txt")
+    fout = os.fdopen(handle, 'w')
+    written = [0]
+    stamp = registerFormat.TimestampFormatter()
+    def write():
+        line = dataLogger.format_output(row, timestamp = stamp) + "\n"
+        fout.write(line)
+        written[0] += len(line)
+    try:
+        start = clock()
+        rate_of(write, options.duration)
+        fout.close()
+        elapsed = clock() - start
+    finally:
+        os.remove(filename)
+    return written[0] / elapsed / 1e6, "MB/s", True
+
+def bench_plot_fps(options):
+    import matplotlib
+    matplotlib.use('Agg')
+    import numpy
+    import Continual_Plot
+    plot = Continual_Plot.ContinualPlot(window = 2000)
+    plot.myfig.canvas.draw()
+    samples = numpy.sin(numpy.arange(100000) * 0.01) + 1.5
+    position = [0]
+    def frame():
+        plot.addBlock(samples[position[0]:position[0] + 100])       # ~3000 samples/s at 30 fps
+        position[0] = (position[0] + 100) % (len(samples) - 100)
+        plot.render()
+    fps = rate_of(frame, options.duration)
+    plot.exit()
+    return fps, "frames/s", True
+
+def bench_eeprom_dump(options):
+    device = sim_device(options.latency)
+    return 1000.0 / rate_of(lambda: device.read_eeprom(True), options.duration), "ms", False
+
+def bench_eeprom_dump_legacy(options):
+    device = sim_device(options.latency)
+    return 1000.0 / rate_of(device.read_eeprom_legacy, options.duration), "ms", False
+
+
+BENCHMARKS = [("transfers", bench_transfers), ("transfer_overhead", bench_transfer_overhead),
+              ("sample_rate", bench_sample_rate), ("convert_scalar", bench_convert_scalar),
+              ("convert_block", bench_convert_block), ("stream_decode", bench_stream_decode),
+              ("capture_write", bench_capture_write), ("delta_write", bench_delta_write),
+              ("delta_size", bench_delta_size), ("logic_edges", bench_logic_edges),
+              ("logic_frame", bench_logic_frame), ("text_log_write", bench_text_log_write),
+              ("plot_fps", bench_plot_fps), ("eeprom_dump", bench_eeprom_dump),
+              ("eeprom_dump_legacy", bench_eeprom_dump_legacy)]
+
+
+def run(options):
+    names = options.only and options.only.split(",") or [name for name, bench in BENCHMARKS]
+    results = {}
+    for name, bench in BENCHMARKS:
+        if name not in names:
+            continue
+        try:
+            value, unit, higher_is_better = bench(options)
+        except (ImportError, SyntaxError) as e:             # SyntaxError: Continual_Plot is Python 2 code
+            sys.stderr.write("%-20s skipped (%s)\n" % (name, e))
+            continue
+        results[name] = {'value' : value, 'unit' : unit, 'higher_is_better' : higher_is_better}
+        sys.stderr.write("%-20s %12.3f %s\n" % (name, value, unit))
+    return results
+
+
+# Names of the results more than 'tolerance' (a fraction) worse than in the baseline, with a line about each
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        value, old = results[name]['value'], baseline[name]['value']
+        if not old:
+            continue
+        change = (value - old) / float(old)
+        if not results[name]['higher_is_better']:
+            change = -change
+        flag = change < -tolerance and "REGRESSION" or ""
+        sys.stderr.write("%-20s %12.3f (baseline %12.3f, %+6.1f%%) %s\n" % (name, value, old, change * 100, flag))
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv = None):
+    parser = OptionParser(usage = "%prog [options]")
+    parser.add_option("-l", "--latency", type = "float", default = 0.001,
+                      help = "seconds each simulated transfer takes [default: %default]")
+    parser.add_option("-d", "--duration", type = "float", default = 1.0,
+                      help = "seconds to run each benchmark for [default: %default]")
+    parser.add_option("--only", default = None,
+                      help = "comma separated benchmarks to run [default: all]")
+    parser.add_option("-o", "--output", default = None,
+                      help = "write the results to this JSON file")
+    parser.add_option("-b", "--baseline", default = None,
+                      help = "compare with the results in this JSON file")
+    parser.add_option("--save-baseline", default = None,
+                      help = "write the results to this JSON file, as the baseline for later runs")
+    parser.add_option("--tolerance", type = "float", default = 0.15,
+                      help = "how much worse than the baseline (a fraction) counts as a regression [default: %default]")
+    options, args = parser.parse_args(argv)
+
+    report = {'time' : time.strftime("%Y-%m-%d %H:%M:%S"), 'python' : platform.python_version(),
+              'platform' : platform.platform(), 'latency' : options.latency, 'duration' : options.duration,
+              'results' : run(options)}
+    for filename in (options.output, options.save_baseline):
+        if filename:
+            fout = open(filename, 'w')
+            json.dump(report, fout, indent = 1, sort_keys = True)
+            fout.close()
+
+    if options.baseline:
+        fin = open(options.baseline)
+        baseline = json.load(fin)
+        fin.close()
+        if baseline.get('latency') != options.latency:
+            sys.stderr.write("note: the baseline was run with --latency %s\n" % baseline.get('latency'))
+        if baseline.get('python') != report['python']:
+            sys.stderr.write("note: the baseline was run with Python %s\n" % baseline.get('python'))
+        regressions = compare(report['results'], baseline['results'], options.tolerance)
+        if regressions:
+            sys.stderr.write("%d regressions: %s\n" % (len(regressions), ", ".join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+"""
+pic-eeprom - reads and writes the PIC's 256-byte EEPROM from the command line.
+
+The file format is picked by the file's extension: .bin (raw bytes),
+.hex (Intel HEX) or anything else (the GUI's "Byte n: value" text dump).
+With no file, dump writes the text dump to stdout.
+
+write only sends the bytes that differ from what is on the PIC, then reads
+them back to verify (unless --no-verify). Needs firmware with SET_EEPROM_BLOCK.
+
+Examples:
+    python pic_eeprom.py dump eeprom.hex
+    python pic_eeprom.py --transport sim dump
+    python pic_eeprom.py write eeprom.hex
+"""
+
+import sys
+import os
+import time
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "helpers"))
+import picDevice
+import eepromImage
+import usbTransport
+
+
+def parse_args(argv):
+    parser = OptionParser(usage = "%prog [options] dump [file] | write file")
+    parser.add_option("--no-verify", dest = "verify", action = "store_false", default = True,
+                      help = "don't read written bytes back")
+    usbTransport.add_options(parser)
+    options, args = parser.parse_args(argv)
+    if args[:1] == ["dump"] and len(args) <= 2:
+        return options, args
+    if args[:1] == ["write"] and len(args) == 2:
+        return options, args
+    parser.error("expected: dump [file] | write file")
+
+
+def main(argv = None):
+    options, args = parse_args(argv)
+    if args[0] == "write":
+        image = eepromImage.load(args[1])
+
+    device = picDevice.PicDevice(usbTransport.from_options(options))
+    if not device.open():
+        return 1
+
+    if args[0] == "write":
+        start = time.time()
+        try:
+            blocks = device.write_eeprom(image, options.verify)
+        except picDevice.PicUsbError as e:
+            sys.stderr.write("%s\n" % e)
+            device.close()
+            return 1
+        elapsed = time.time() - start
+        device.close()
+        sys.stderr.write("wrote %d bytes in %d transfers, %.1f ms%s\n" % (sum([length for offset, length in blocks]),
+                         len(blocks), elapsed * 1000, options.verify and ", verified" or ""))
+        return 0
+
+    start = time.time()
+    device.read_eeprom()
+    elapsed = time.time() - start
+    device.close()
+
+    if len(args) > 1:
+        device.eeprom.save(args[1])
+    else:
+        sys.stdout.write(device.eeprom.to_text())
+    sys.stderr.write("read %d bytes in %.1f ms\n" % (len(device.eeprom), elapsed * 1000))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+"""
+plot-capture - plots a recorded capture (binary or old text log) of any length.
+
+The column is decimated to a min/max pair per pixel (helpers/plotDecimation.py),
+and re-decimated from a precomputed pyramid whenever the view is zoomed or
+panned, so even captures of tens of millions of samples stay responsive and
+every spike stays visible.
+
+Examples:
+    python pic_acquire.py ... ; python plot_capture.py capture.pic
+    python plot_capture.py "data/data - 4.28.2010 - 10h.47m.23s - continual data log"     (segmented)
+    python plot_capture.py --column PORTA "data/data - 4.28.2010 - 10h.47m.23s - continual data log.txt"
+"""
+
+import sys
+import os
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "helpers"))
+import captureReader
+import ConversionFunctions
+import plotDecimation
+
+
+class CapturePlot:
+
+    def __init__(self, capture, column, axes):
+        self.capture = capture
+        self.column = column
+        self.axes = axes
+
+        # Voltage is monotonic in the ADC count, so decimating the counts and converting the
+        # min/max points gives the same envelope without converting every sample
+        self.convert = column == "voltage" and "voltage" not in capture.records.dtype.names
+        self.pyramid = plotDecimation.DecimationPyramid(capture["adc"] if self.convert else capture[column])
+        self.timestamps = capture["timestamp"]
+
+        self.line, = axes.plot([], [])
+        axes.set_xlabel("time (s)")
+        axes.set_ylabel(column)
+        axes.grid(True)
+        if len(capture):
+            axes.set_xlim(self.timestamps[0], self.timestamps[-1])
+        self.update()
+        axes.callbacks.connect('xlim_changed', self.on_zoom)
+
+
+    def on_zoom(self, axes):
+        self.update()
+        axes.figure.canvas.draw_idle()
+
+    # Re-decimates the visible time window to the axes' width in pixels
+    def update(self):
+        t0, t1 = self.axes.get_xlim()
+        start, stop = self.capture.time_range(t0, t1)
+        x, y = self.pyramid.query(max(start - 1, 0), stop + 1, self.axes.bbox.width)
+        if self.convert:
+            y = ConversionFunctions.adcToVoltageBlock(y)
+        self.line.set_data(self.timestamps[x], y)
+        if len(y):
+            margin = max(float(y.max()) - float(y.min()), 1e-9) * 0.05
+            self.axes.set_ylim(float(y.min()) - margin, float(y.max()) + margin)
+
+
+def main(argv = None):
+    parser = OptionParser(usage = "%prog [options] capture")
+    parser.add_option("-c", "--column", default = "voltage",
+                      help = "column to plot: voltage, adc, PORTA..TRISC, dm0..dm7, led [default: %default]")
+    parser.add_option("-r", "--rate", type = "float", default = 20,
+                      help = "sample rate of old text logs, which don't record it [default: %default]")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("give one capture file")
+
+    import pylab
+    capture = captureReader.open_capture(args[0], options.rate)
+    if options.column not in capture.names():
+        parser.error("%s has no column %r (it has: %s)" % (args[0], options.column, ", ".join(capture.names())))
+
+    figure = pylab.figure()
+    axes = figure.add_subplot(111)
+    axes.set_title(os.path.basename(args[0]))
+    plot = CapturePlot(capture, options.column, axes)
+    pylab.show()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
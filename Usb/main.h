@@ -4,10 +4,18 @@
 
 	// Functions Called Externally
 	void ProcessVendorRequest(unsigned char, unsigned char, unsigned char[], unsigned char[]);
+	void ProcessVendorData(unsigned char, unsigned char, unsigned char[], unsigned char);
+	
+	#define VENDOR_DATA_SIZE	64		// Max # bytes a vendor request can send back (sent as several packets if > MAX_PACKET_SIZE)
 	
 	// Functions that might be called externally
 	unsigned char getPotentiometerVal(void);
 	
+	// Streaming (main.c)
+	void StartStream(unsigned char);
+	void StreamSample(void);
+	void ServiceStream(void);
+	
 	// Variables Called Externally
 	extern unsigned char debug_message[];
 
@@ -26,6 +26,10 @@ unsigned char USB_device_status;
 unsigned char USB_dev_req;
 unsigned char USB_address_pending;
 unsigned char rom *USB_desc_ptr;
+unsigned char *USB_vendor_ptr;
+unsigned char USB_vendor_data[VENDOR_DATA_SIZE];	// Reply (or data stage) of the vendor request in process (may span several packets)
+unsigned char USB_vendor_request;					// The host-to-device vendor request whose data stage is arriving
+unsigned char USB_vendor_value;						// ...and its wValue
 unsigned char USB_bytes_left;
 unsigned char USB_packet_length;
 unsigned char USB_USTAT;
@@ -51,14 +55,14 @@ rom const unsigned char Device[] = {
 	0x00,	// bcdDevice (high byte)
 	0x01,	// iManufacturer
 	0x02,	// iProduct
-	0x00,	// iSerialNumber (none)
+	0x03,	// iSerialNumber
 	NUM_CONFIGURATIONS	// bNumConfigurations
 };
 
 rom const unsigned char Configuration1[] = {
 	0x09,	// bLength
 	CONFIGURATION,	// bDescriptorType
-	0x12,	// wTotalLength (low byte)
+	0x19,	// wTotalLength (low byte)
 	0x00,	// wTotalLength (high byte)
 	NUM_INTERFACES,	// bNumInterfaces
 	0x01,	// bConfigurationValue
@@ -69,11 +73,18 @@ rom const unsigned char Configuration1[] = {
 	INTERFACE,	// bDescriptorType
 	0x00,	// bInterfaceNumber
 	0x00,	// bAlternateSetting
-	0x00,	// bNumEndpoints (excluding EP0)
+	0x01,	// bNumEndpoints (excluding EP0)
 	0xFF,	// bInterfaceClass (vendor specific class code)
 	0x00,	// bInterfaceSubClass
 	0xFF,	// bInterfaceProtocol (vendor specific protocol used)
-	0x00	// iInterface (none)
+	0x00,	// iInterface (none)
+	0x07,	// bLength (Endpoint1 IN descriptor starts here)
+	ENDPOINT,	// bDescriptorType
+	0x81,	// bEndpointAddress (EP1 IN)
+	0x02,	// bmAttributes (bulk)
+	STREAM_PACKET_SIZE,	// wMaxPacketSize (low byte)
+	0x00,	// wMaxPacketSize (high byte)
+	0x00	// bInterval (ignored for bulk)
 };
 
 rom const unsigned char String0[] = {
@@ -99,11 +110,17 @@ rom const unsigned char String2[] = {
 	'F', 0x00, 'i', 0x00, 'r', 0x00, 'm', 0x00, 'w', 0x00, 'a', 0x00, 'r', 0x00, 'e', 0x00
 };
 
+rom const unsigned char String3[] = {
+	0x0A,	// bLength
+	STRING,	// bDescriptorType
+	SERIAL_NUMBER_0, 0x00, SERIAL_NUMBER_1, 0x00, SERIAL_NUMBER_2, 0x00, SERIAL_NUMBER_3, 0x00
+};
+
 #pragma code
 void InitUSB(void) {
 	UIE = 0x00;					// mask all USB interrupts
 	UIR = 0x00;					// clear all USB interrupt flags
-	UCFG = 0x10;				// configure USB for low-speed transfers and to use the on-chip transciever and pull-up resistor
+	UCFG = 0x14;				// configure USB for full-speed transfers (needed for the bulk streaming endpoint) and to use the on-chip transciever and pull-up resistor
 	UCON = 0x08;				// enable the USB module and its supporting circuitry
 	USB_curr_config = 0x00;
 	USB_USWSTAT = 0x00;			// default to powered state
@@ -381,6 +398,9 @@ void StandardRequests(void) {
 						case 2:
 							USB_desc_ptr = String2;
 							break;
+						case 3:
+							USB_desc_ptr = String3;
+							break;
 						default:
 							USB_error_flags |= 0x01;	// set Request Error Flag
 					}
@@ -424,6 +444,9 @@ void StandardRequests(void) {
 						break;
 					default:
 						USB_USWSTAT = CONFIG_STATE;
+						BD1I.address = EP1_IN_buffer;	// EP1 IN gets a buffer
+						BD1I.status = 0x40;			// clear UOWN bit (MCU can write), DATA1 so the first packet goes out as DATA0
+						UEP1 = ENDPT_IN_ONLY;		// EP1 is a bulk IN pipe
 				}
 				BD0I.bytecount = 0x00;		// set EP0 IN byte count to 0
 				BD0I.status = 0xC8;		// send packet as DATA1, set UOWN bit
@@ -507,9 +530,19 @@ void ClassRequests(void) {
 void VendorRequests(void) 
 {
 	unsigned char i;
-	unsigned char returnData[8];								// Data to be sent back to usb peripheral
+	unsigned char *returnData = USB_vendor_data;				// Data to be sent back to usb peripheral
 	unsigned char bufferSettings[] = {0, 0xC8, 0};				// Settings to be configured by program, for correct usb peripheral communication
 	
+	// Host-to-device requests with a data stage: collect the data first (ReceiveVendorPacket), then hand it to ProcessVendorData
+	if (!(USB_buffer_data[bmRequestType]&0x80) && (USB_buffer_data[wLength] || USB_buffer_data[wLengthHigh])) {
+		USB_vendor_request = USB_buffer_data[bRequest];
+		USB_vendor_value = USB_buffer_data[wValue];
+		USB_bytes_left = (USB_buffer_data[wLengthHigh] || USB_buffer_data[wLength]>VENDOR_DATA_SIZE) ? VENDOR_DATA_SIZE:USB_buffer_data[wLength];
+		USB_vendor_ptr = USB_vendor_data;
+		USB_dev_req = VENDOR_DATA_OUT;
+		return;
+	}
+	
 	//vendor request, data from usb, buffer settings to be set, data to send back to peripheral
 	ProcessVendorRequest(USB_buffer_data[bRequest], USB_buffer_data[wValue], bufferSettings, returnData);
 	
@@ -534,6 +567,19 @@ void VendorRequests(void)
 	
 	
 	
+	// Replies longer than one packet are sent like descriptors: first packet now, the rest on each following IN token
+	if (bufferSettings[0] > MAX_PACKET_SIZE) {
+		USB_error_flags |= bufferSettings[2];
+		USB_bytes_left = bufferSettings[0];
+		if ((USB_buffer_data[wLengthHigh]==0x00) && (USB_buffer_data[wLength]<USB_bytes_left)) {
+			USB_bytes_left = USB_buffer_data[wLength];
+		}
+		USB_dev_req = VENDOR_DATA_IN;
+		USB_vendor_ptr = USB_vendor_data;
+		SendVendorPacket();
+		return;
+	}
+	
 	// Unpack Return Array
 	BD0I.bytecount = bufferSettings[0];					// #bytes sending back
 	BD0I.status = bufferSettings[1];					// default value: 0xC8 (end packet as DATA1, set UOWN bit). Never really saw this one changed, so set a default
@@ -573,6 +619,9 @@ void ProcessInToken(void) {
 				case GET_DESCRIPTOR:
 					SendDescriptorPacket();
 					break;
+				case VENDOR_DATA_IN:
+					SendVendorPacket();
+					break;
 			}
 			break;
 		case EP1:
@@ -585,6 +634,10 @@ void ProcessInToken(void) {
 void ProcessOutToken(void) {
 	switch (USB_USTAT&0x18) {	// extract the EP bits
 		case EP0:
+			if (USB_dev_req==VENDOR_DATA_OUT) {
+				ReceiveVendorPacket();
+				break;
+			}
 			BD0O.bytecount = MAX_PACKET_SIZE;
 			BD0O.status = 0x88;
 			BD0I.bytecount = 0x00;		// set EP0 IN byte count to 0
@@ -613,4 +666,67 @@ void SendDescriptorPacket(void) {
 	}
 	BD0I.bytecount = USB_packet_length;
 	BD0I.status = ((BD0I.status^0x40)&0x40)|0x88; // toggle the DATA01 bit, clear the PIDs bits, and set the UOWN and DTS bits
+}
+
+void SendVendorPacket(void) {				// Same as SendDescriptorPacket, but from the vendor request reply in RAM
+	unsigned char n;
+
+	if (USB_bytes_left<MAX_PACKET_SIZE) {
+		USB_dev_req = NO_REQUEST;	// sending a short packet, so clear device request
+		USB_packet_length = USB_bytes_left;
+		USB_bytes_left = 0x00;
+	} else {
+		USB_packet_length = MAX_PACKET_SIZE;
+		USB_bytes_left -= MAX_PACKET_SIZE;
+	}
+	for (n = 0; n<USB_packet_length; n++) {
+		BD0I.address[n] = *USB_vendor_ptr++;
+	}
+	BD0I.bytecount = USB_packet_length;
+	BD0I.status = ((BD0I.status^0x40)&0x40)|0x88; // toggle the DATA01 bit, clear the PIDs bits, and set the UOWN and DTS bits
+}
+
+void ReceiveVendorPacket(void) {			// One packet of a vendor request's data stage (see VendorRequests)
+	unsigned char n;
+
+	for (n = 0; (n<BD0O.bytecount) && USB_bytes_left; n++) {
+		*USB_vendor_ptr++ = BD0O.address[n];
+		USB_bytes_left--;
+	}
+	if (!USB_bytes_left || (BD0O.bytecount<MAX_PACKET_SIZE)) {	// last packet: act on the data, then let the status stage complete
+		USB_dev_req = NO_REQUEST;
+		ProcessVendorData(USB_vendor_request, USB_vendor_value, USB_vendor_data, USB_vendor_ptr-USB_vendor_data);
+		BD0O.bytecount = MAX_PACKET_SIZE;
+		BD0O.status = 0x88;
+		BD0I.bytecount = 0x00;		// set EP0 IN byte count to 0
+		BD0I.status = 0xC8;		// send packet as DATA1, set UOWN bit
+	} else {
+		BD0O.bytecount = MAX_PACKET_SIZE;
+		BD0O.status = ((BD0O.status^0x40)&0x40)|0x88;	// expect the other DATA01, set the UOWN and DTS bits
+	}
+}
+
+
+
+/*=======================================================================================================================
+
+	Streaming (EP1 IN, bulk)
+	The host drains samples with bulk reads instead of asking for them one control transfer at a time
+
+  =======================================================================================================================*/
+unsigned char EP1InReady(void) {
+	return (USB_USWSTAT==CONFIG_STATE) && !(BD1I.status&0x80);	// configured, and the last packet has been picked up (UOWN clear)
+}
+
+// Copies bytecount bytes from ring[start] on (wrapping at 256) into the EP1 buffer and hands it to the SIE
+void SendEP1(unsigned char ring[], unsigned char start, unsigned char bytecount) {
+	unsigned char n;
+
+	if (bytecount>STREAM_PACKET_SIZE)
+		bytecount = STREAM_PACKET_SIZE;
+	for (n = 0; n<bytecount; n++) {
+		BD1I.address[n] = ring[start++];
+	}
+	BD1I.bytecount = bytecount;
+	BD1I.status = ((BD1I.status^0x40)&0x40)|0x88; // toggle the DATA01 bit, clear the PIDs bits, and set the UOWN and DTS bits
 }
\ No newline at end of file
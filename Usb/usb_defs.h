@@ -12,8 +12,24 @@ extern unsigned char USB_error_flags;
 
 #define	NUM_CONFIGURATIONS	1
 #define	NUM_INTERFACES		1
-#define NUM_STRINGS		2
+#define NUM_STRINGS		3
 #define MAX_PACKET_SIZE		8	// maximum packet size for low-speed peripherals is 8 bytes, for full-speed peripherals it can be 8, 16, 32, or 64 bytes
+#define STREAM_PACKET_SIZE	64	// EP1 IN (bulk, streaming samples). Bulk endpoints need full-speed, so the device enumerates as full-speed
+
+// The board's serial number (string descriptor 3), so the host can tell several boards apart.
+// Give every board its own, e.g. build with -DSERIAL_NUMBER_2='1' -DSERIAL_NUMBER_3='5' for "0015"
+#ifndef SERIAL_NUMBER_0
+#define SERIAL_NUMBER_0		'0'
+#endif
+#ifndef SERIAL_NUMBER_1
+#define SERIAL_NUMBER_1		'0'
+#endif
+#ifndef SERIAL_NUMBER_2
+#define SERIAL_NUMBER_2		'0'
+#endif
+#ifndef SERIAL_NUMBER_3
+#define SERIAL_NUMBER_3		'1'
+#endif
 
 // Define the states that the USB interface can be in
 #define	POWERED_STATE	0x00
@@ -70,6 +86,8 @@ extern unsigned char USB_error_flags;
 
 // Standard USB requests
 #define NO_REQUEST		0xFF
+#define VENDOR_DATA_IN	0xFE	// Not a standard request: a vendor request reply is still being sent, one packet per IN token
+#define VENDOR_DATA_OUT	0xFD	// Not a standard request: a vendor request's data is still arriving, one packet per OUT token
 #define	GET_STATUS		0x00
 #define	CLEAR_FEATURE	0x01
 #define	SET_FEATURE		0x03
@@ -179,6 +197,7 @@ far BUFDESC BD15I;
 #pragma udata USB_BUFFERS=0x0480
 far unsigned char EP0_OUT_buffer[MAX_PACKET_SIZE];
 far unsigned char EP0_IN_buffer[MAX_PACKET_SIZE];
+far unsigned char EP1_IN_buffer[STREAM_PACKET_SIZE];
 
 #endif
 
@@ -189,6 +208,8 @@ void StandardRequests(void);
 void ClassRequests(void);
 void VendorRequests(void);
 void SendDescriptorPacket(void);
+void SendVendorPacket(void);
+void ReceiveVendorPacket(void);
 
 
 
@@ -9,5 +9,9 @@
 	//functions and variables that are called externally
 	void InitUSB(void);				
 	void ServiceUSB(void);
+	
+	// Streaming (EP1 IN, bulk)
+	unsigned char EP1InReady(void);										// 1 if EP1 can take another packet
+	void SendEP1(unsigned char ring[], unsigned char start, unsigned char bytecount);	// Queues up to STREAM_PACKET_SIZE bytes of a 256-byte ring on EP1
 
 #endif
\ No newline at end of file
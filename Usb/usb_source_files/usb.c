@@ -1,6 +1,10 @@
+#include <stdio.h>
+#include <string.h>
 #include <usb.h>
 
-#define MAX_DEVICES_OPEN    10
+#define MAX_DEVICES_OPEN    32
+#define SERIAL_LENGTH       128
+#define DEVICE_ID_LENGTH    (SERIAL_LENGTH + 2 * LIBUSB_PATH_MAX + 3)
 
 usb_dev_handle *open_devices[MAX_DEVICES_OPEN];
 int devices_open;
@@ -42,6 +46,126 @@ int open_device(int vendorID, int productID) {
     return -2;
 }
 
+/*
+ * Writes a device's serial number to serial, or "" if it has none
+ */
+static void device_serial(struct usb_device *dev, char *serial) {
+    usb_dev_handle *handle;
+
+    serial[0] = 0;
+    if (dev->descriptor.iSerialNumber && (handle = usb_open(dev))) {
+        if (usb_get_string_simple(handle, dev->descriptor.iSerialNumber, serial, SERIAL_LENGTH) < 0)
+            serial[0] = 0;
+        usb_close(handle);
+    }
+}
+
+/*
+ * How many matching devices have the serial number serial
+ */
+static int serial_count(int vendorID, int productID, const char *serial) {
+    struct usb_bus *bus;
+    struct usb_device *dev;
+    char other[SERIAL_LENGTH];
+    int count = 0;
+
+    for (bus = usb_get_busses(); bus; bus = bus->next) {
+        for (dev = bus->devices; dev; dev = dev->next) {
+            if ((dev->descriptor.idVendor==vendorID) && (dev->descriptor.idProduct==productID)) {
+                device_serial(dev, other);
+                if (!strcmp(other, serial))
+                    count++;
+            }
+        }
+    }
+    return count;
+}
+
+/*
+ * A device's id: its serial number, or "bus/device" (libusb's names for them) if it has none.
+ * Boards built with the default serial number all have the same one, so if another matching
+ * device has the same serial number the id is "serial@bus/device"
+ */
+static void device_id(int vendorID, int productID, struct usb_bus *bus, struct usb_device *dev, char *id) {
+    char serial[SERIAL_LENGTH];
+
+    device_serial(dev, serial);
+    if (!serial[0])
+        sprintf(id, "%s/%s", bus->dirname, dev->filename);
+    else if (serial_count(vendorID, productID, serial) > 1)
+        sprintf(id, "%s@%s/%s", serial, bus->dirname, dev->filename);
+    else
+        strcpy(id, serial);
+}
+
+/*
+ * Writes the ids of all matching devices to ids, one per line (as many as fit in length bytes).
+ * Returns how many devices matched
+ */
+int list_devices(int vendorID, int productID, char *ids, int length) {
+    struct usb_bus *bus;
+    struct usb_device *dev;
+    char id[DEVICE_ID_LENGTH];
+    int count = 0, used = 0, n;
+
+    usb_find_busses();
+    usb_find_devices();
+
+    if (length > 0)
+        ids[0] = 0;
+    for (bus = usb_get_busses(); bus; bus = bus->next) {
+        for (dev = bus->devices; dev; dev = dev->next) {
+            if ((dev->descriptor.idVendor==vendorID) && (dev->descriptor.idProduct==productID)) {
+                device_id(vendorID, productID, bus, dev, id);
+                n = strlen(id);
+                if (used + n + 2 <= length) {
+                    strcpy(ids + used, id);
+                    used += n;
+                    ids[used++] = '\n';
+                    ids[used] = 0;
+                }
+                count++;
+            }
+        }
+    }
+    return count;
+}
+
+/*
+ * Like open_device, but opens the device whose id (see list_devices) is id
+ */
+int open_device_id(int vendorID, int productID, const char *id) {
+    struct usb_bus *bus;
+    struct usb_device *dev;
+    char dev_id[DEVICE_ID_LENGTH];
+    int i;
+
+    usb_find_busses();
+    usb_find_devices();
+
+    for (bus = usb_get_busses(); bus; bus = bus->next) {
+        for (dev = bus->devices; dev; dev = dev->next) {
+            if ((dev->descriptor.idVendor==vendorID) && (dev->descriptor.idProduct==productID)) {
+                device_id(vendorID, productID, bus, dev, dev_id);
+                if (strcmp(dev_id, id))
+                    continue;
+                for (i = 0; i<MAX_DEVICES_OPEN; i++) {
+                    if (open_devices[i]==NULL) {
+                        if (open_devices[i] = usb_open(dev)) {
+                            devices_open++;
+                            return i;
+                        } else {
+                            return -1;
+                        }
+                    }
+                }
+                return -3;
+            }
+        }
+    }
+    return -2;
+}
+
 int close_device(int device) {
     if ((device<0) || (device>=MAX_DEVICES_OPEN))
         return -1;
@@ -65,3 +189,19 @@ int control_transfer(int device, unsigned char bmRequestType, unsigned char bReq
         return usb_control_msg(open_devices[device], bmRequestType, bRequest, wValue, wIndex, buffer, wLength, 100);
     return -2;
 }
+
+int claim_interface(int device, int interface) {
+    if ((device<0) || (device>=MAX_DEVICES_OPEN))
+        return -1;
+    if (open_devices[device])
+        return usb_claim_interface(open_devices[device], interface);
+    return -2;
+}
+
+int bulk_read(int device, int endpoint, unsigned char *buffer, int length, int timeout) {
+    if ((device<0) || (device>=MAX_DEVICES_OPEN))
+        return -1;
+    if (open_devices[device])
+        return usb_bulk_read(open_devices[device], endpoint, buffer, length, timeout);
+    return -2;
+}
@@ -43,6 +43,21 @@ unsigned char eeprom_write_to 	= 0;			// EEPROM address to write to next
 unsigned char eeprom_error		= 0;			// Whether an error occured writing to eeprom
 unsigned char eeprom[8];
 
+// Streaming Vars (see StreamSample / ServiceStream)
+#define STREAM_SAMPLE_SIZE	4					// seq, ADRESH, ADRESL, PORTA
+#define STREAM_PACKET_SIZE	64					// Must match usb_defs.h
+#define TMR1_TICKS_PER_UNIT	75					// Timer1 ticks (Fosc/4, 1:8 prescale) per 100 us
+
+unsigned char streaming = 0;					// 1 while the host has asked for a stream
+unsigned char stream_seq = 0;					// Sample counter (wraps); gaps tell the host samples were lost
+unsigned char stream_reload_high, stream_reload_low;	// Timer1 reload value for the sample period
+unsigned char stream_head = 0;					// Next byte to write
+unsigned char stream_tail = 0;					// Next byte to send
+
+#pragma udata stream_ring_section				// A whole bank of its own (see 18f2455.lkr)
+unsigned char stream_ring[256];					// Samples waiting to be sent. 256 bytes, so the indices wrap on their own
+#pragma udata
+
 
 // Pin States Diagram (makes it easy to see what pins are used for what!)
 
@@ -97,6 +112,7 @@ void main(void) {
     
     // Initialize Timers
     T0CON = 0b10000101;				// initialize Timer0 to go off every 700 ms
+    T1CON = 0b10110001;				// Timer1: 16-bit writes, 1:8 prescale, Fosc/4 -> 75 ticks per 100 us (stream sample clock)
     
     // Other Init Functions
     InitUSB();						// initialize the USB registers and serial interface engine
@@ -111,6 +127,19 @@ void main(void) {
     { 
     	ServiceUSB(); 							// service any pending USB requests
     	
+    	// Streaming: take a sample every time Timer1 overflows, and hand finished samples to EP1
+    	if (streaming)
+    	{
+    		if (PIR1bits.TMR1IF)
+    		{
+    			TMR1H = stream_reload_high;				// Restart the sample period
+    			TMR1L = stream_reload_low;
+    			PIR1bits.TMR1IF = 0;
+    			StreamSample();
+    		}
+    		ServiceStream();
+    	}
+    	
 		// Simple: if button pressed, change LED status
 	   	if (PORTCbits.RC6 == 1)						
 	   	{
@@ -144,6 +173,72 @@ void main(void) {
 
 
 
+/*=======================================================================================================================
+
+	Streaming
+	
+	Instead of answering one control transfer per sample, the PIC samples on its own clock (Timer1) into
+	stream_ring, and the host drains it with bulk reads on EP1 (up to 16 samples per 64-byte packet)
+
+  =======================================================================================================================*/
+
+// Starts streaming one sample every 'period' * 100 us (1 -> 10 kHz, 10 -> 1 kHz, 255 -> ~39 Hz)
+void StartStream(unsigned char period)
+{
+	unsigned int reload;
+	
+	if (period == 0)
+		period = 1;
+	reload = 0 - (unsigned int)period * TMR1_TICKS_PER_UNIT;	// Timer1 counts up to the overflow
+	stream_reload_high = reload >> 8;
+	stream_reload_low = reload & 0xFF;
+	
+	stream_head = 0;
+	stream_tail = 0;
+	stream_seq = 0;
+	
+	TMR1H = stream_reload_high;
+	TMR1L = stream_reload_low;
+	PIR1bits.TMR1IF = 0;
+	streaming = 1;
+}
+
+// Puts one sample into stream_ring. If the host isn't keeping up, the sample is lost (and seq jumps)
+void StreamSample(void)
+{
+	unsigned char high = ADConversion(0);			// 10-bit result, left justified: ADRESH holds the top 8 bits
+	
+	if ((unsigned char)(stream_tail - stream_head - 1) >= STREAM_SAMPLE_SIZE)	// free space in the ring
+	{
+		stream_ring[stream_head++] = stream_seq;
+		stream_ring[stream_head++] = high;
+		stream_ring[stream_head++] = ADRESL;
+		stream_ring[stream_head++] = PORTA;
+	}
+	stream_seq++;
+}
+
+// Sends whatever whole samples are waiting, once EP1 is free
+void ServiceStream(void)
+{
+	unsigned char count;
+	
+	if (!EP1InReady())
+		return;
+	
+	count = stream_head - stream_tail;				// Bytes waiting (always a multiple of STREAM_SAMPLE_SIZE)
+	if (count == 0)
+		return;
+	if (count > STREAM_PACKET_SIZE)
+		count = STREAM_PACKET_SIZE;
+	
+	SendEP1(stream_ring, stream_tail, count);		// Copied straight from the ring into the EP1 buffer
+	stream_tail += count;
+}
+
+
+
+
 /*=======================================================================================================================
 
 	Vendor Requests
@@ -161,6 +256,12 @@ void main(void) {
 #define GET_MSG			10		// sends debug vals to 10
 #define GET_REGISTERS 	11		// Get PORT & TRIS Registers
 #define GET_EEPROM		12		// Sends the EEPROM (all 256 bytes)
+#define GET_STATUS_ALL	13		// Debug messages, PORT & TRIS Registers and the debug LED, all in one transfer
+#define GET_EEPROM_BLOCK 16		// Up to VENDOR_DATA_SIZE EEPROM bytes, starting at the address given as data
+#define SET_EEPROM_BLOCK 17		// Writes the request's data stage (up to VENDOR_DATA_SIZE bytes) to EEPROM, starting at the address given as data
+
+#define START_STREAM	14		// Start sampling into the EP1 stream (data = sample period in 100 us units)
+#define STOP_STREAM		15		// Stop streaming
 
 #define SET_USB_MSG1	20		// USB sends message1 to PIC
 #define SET_USB_MSG2	21		// USB sends message2 to PIC
@@ -234,6 +335,23 @@ void ProcessVendorRequest(unsigned char vendor_request, unsigned char data_from_
 			}
 			break;
 
+		case GET_STATUS_ALL:								// GET_MSG + GET_REGISTERS + GET_LED in one reply (15 bytes, sent as 2 packets)
+			bytes_to_send = 15;
+			for (i = 0; i < 8; i++)
+			{
+				returnData[i] = debug_message[i];
+			}
+			returnData[8]  = PORTA;
+			returnData[9]  = PORTB;
+			returnData[10] = PORTC;
+			
+			returnData[11] = TRISA;
+			returnData[12] = TRISB;
+			returnData[13] = TRISC;
+			
+			returnData[14] = (DEBUG_LED) ? 0x01:0x00;
+			break;
+			
 		case GET_REGISTERS:									// Returns the values of the PIC's registers
 			bytes_to_send = 0x06;
 			returnData[0] = PORTA;
@@ -262,6 +380,25 @@ void ProcessVendorRequest(unsigned char vendor_request, unsigned char data_from_
 			
 			break;
 			
+		case GET_EEPROM_BLOCK:								// Addressed: doesn't touch eeprom_return_index
+			bytes_to_send = VENDOR_DATA_SIZE;				// The host's wLength cuts the reply short (see VendorRequests)
+			j = data_from_usb;								// Start address; wraps from 255 to 0 on its own
+			for (i = 0; i < VENDOR_DATA_SIZE; i++)
+			{
+				returnData[i] = eeprom_read_byte(j++);
+			}
+			break;
+			
+		case START_STREAM:
+			StartStream(data_from_usb);
+			bytes_to_send = 0x00;
+			break;
+			
+		case STOP_STREAM:
+			streaming = 0;
+			bytes_to_send = 0x00;
+			break;
+			
 		case SET_PORTA:										// Sets the appropriate register to the given value
 			PORTA = data_from_usb;
 			break;
@@ -306,8 +443,32 @@ void ProcessVendorRequest(unsigned char vendor_request, unsigned char data_from_
 		
 			
 		default:
-			bufferSettings[3] |= 0x01;				// If this statement is reached, something went wrong!
+			bufferSettings[2] |= 0x01;				// If this statement is reached, something went wrong! (stalls the request)
 			
 	}
 	
+}
+
+
+
+// Like ProcessVendorRequest, for host-to-device requests that come with data: usb_code collects the data stage
+// (data[0..count-1]) first, and calls this before letting the host see the request complete
+void ProcessVendorData(unsigned char vendor_request, unsigned char data_from_usb, unsigned char data[], unsigned char count)
+{
+	unsigned char i;
+	unsigned char address = data_from_usb;
+	
+	switch (vendor_request)
+	{
+		case SET_EEPROM_BLOCK:
+			eeprom_error = 0;
+			for (i = 0; i < count; i++)
+			{
+				if (eeprom_read_byte(address) != data[i])				// Bytes that already match aren't rewritten (saves time & wear)
+					eeprom_error |= eeprom_write_byte(address, data[i]);
+				address++;											// wraps from 255 to 0 on its own
+			}
+			debug_message[7] = eeprom_error;
+			break;
+	}
 }
\ No newline at end of file